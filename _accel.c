@@ -0,0 +1,404 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include "structmember.h"
+#include <stdint.h>
+#include <string.h>
+
+#define READ_SIZE 0x8000
+#define DECODE_TABLE_BITS 15
+#define LARGEST_TABLE_SIZE 306
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *source;
+    Py_buffer view;
+    int hasview;
+    Py_ssize_t pos;     /* next byte to load into the accumulator */
+    uint64_t acc;       /* low count bits are the unread input */
+    int count;
+} BitReaderObject;
+
+static int
+setdata(BitReaderObject *self, PyObject *data)
+{
+    if (self->hasview) {
+        PyBuffer_Release(&self->view);
+        self->hasview = 0;
+    }
+    if (PyObject_GetBuffer(data, &self->view, PyBUF_SIMPLE) < 0)
+        return -1;
+    self->hasview = 1;
+    self->pos = 0;
+    self->acc = 0;
+    self->count = 0;
+    return 0;
+}
+
+static inline void
+refill(BitReaderObject *self)
+{
+    const unsigned char *buf = (const unsigned char *)self->view.buf;
+    Py_ssize_t len = self->view.len;
+    while (self->count <= 56) {
+        unsigned char b = self->pos < len ? buf[self->pos] : 0;
+        self->acc = (self->acc << 8) | b;
+        self->count += 8;
+        self->pos++;
+    }
+}
+
+static inline uint32_t
+peekbits(BitReaderObject *self, int bits)
+{
+    if (bits == 0)
+        return 0;
+    if (self->count < bits)
+        refill(self);
+    return (uint32_t)((self->acc >> (self->count - bits)) & ((1ULL << bits) - 1));
+}
+
+static void
+addbits(BitReaderObject *self, long bits)
+{
+    if (bits <= self->count) {
+        self->count -= (int)bits;
+        return;
+    }
+    Py_ssize_t bitpos = self->pos * 8 - self->count + bits;
+    self->pos = bitpos >> 3;
+    self->acc = 0;
+    self->count = 0;
+    if (bitpos & 7) {
+        refill(self);
+        self->count -= (int)(bitpos & 7);
+    }
+}
+
+static int
+BitReader_init(BitReaderObject *self, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"data", "source", NULL};
+    PyObject *data = Py_None, *source = Py_None, *empty = NULL;
+    int rc;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|OO", kwlist, &data, &source))
+        return -1;
+    if (data == Py_None) {
+        empty = PyBytes_FromStringAndSize(NULL, 0);
+        if (empty == NULL)
+            return -1;
+        data = empty;
+    }
+    rc = setdata(self, data);
+    Py_XDECREF(empty);
+    if (rc < 0)
+        return -1;
+    Py_XSETREF(self->source, source == Py_None ? NULL : Py_NewRef(source));
+    return 0;
+}
+
+static void
+BitReader_dealloc(BitReaderObject *self)
+{
+    if (self->hasview)
+        PyBuffer_Release(&self->view);
+    Py_XDECREF(self->source);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *
+BitReader_Fill(BitReaderObject *self, PyObject *args)
+{
+    Py_ssize_t size = READ_SIZE;
+    PyObject *chunk, *joined;
+    Py_buffer cv;
+    if (!PyArg_ParseTuple(args, "|n", &size))
+        return NULL;
+    if (self->source == NULL)
+        Py_RETURN_FALSE;
+    chunk = PyObject_CallFunction(self->source, "n", size);
+    if (chunk == NULL)
+        return NULL;
+    if (PyObject_GetBuffer(chunk, &cv, PyBUF_SIMPLE) < 0) {
+        Py_DECREF(chunk);
+        return NULL;
+    }
+    if (cv.len == 0) {
+        PyBuffer_Release(&cv);
+        Py_DECREF(chunk);
+        Py_CLEAR(self->source);
+        Py_RETURN_FALSE;
+    }
+    /* restart the accumulator from the first unread byte, dropping any
+       zero padding loaded from past the old end */
+    Py_ssize_t bitpos = self->pos * 8 - self->count;
+    Py_ssize_t start = bitpos >> 3;
+    Py_ssize_t keep = start < self->view.len ? self->view.len - start : 0;
+    joined = PyBytes_FromStringAndSize(NULL, keep + cv.len);
+    if (joined != NULL) {
+        char *out = PyBytes_AS_STRING(joined);
+        if (keep)
+            memcpy(out, (const char *)self->view.buf + start, keep);
+        memcpy(out + keep, cv.buf, cv.len);
+    }
+    PyBuffer_Release(&cv);
+    Py_DECREF(chunk);
+    if (joined == NULL)
+        return NULL;
+    int rc = setdata(self, joined);
+    Py_DECREF(joined);
+    if (rc < 0)
+        return NULL;
+    addbits(self, bitpos & 7);
+    Py_RETURN_TRUE;
+}
+
+static PyObject *
+BitReader_AddBits(BitReaderObject *self, PyObject *arg)
+{
+    long bits = PyLong_AsLong(arg);
+    if (bits == -1 && PyErr_Occurred())
+        return NULL;
+    addbits(self, bits);
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+BitReader_Read16(BitReaderObject *self, PyObject *unused)
+{
+    return PyLong_FromUnsignedLong(peekbits(self, 16));
+}
+
+static PyObject *
+BitReader_Read32(BitReaderObject *self, PyObject *unused)
+{
+    return PyLong_FromUnsignedLong(peekbits(self, 32));
+}
+
+static PyObject *
+BitReader_GetBits(BitReaderObject *self, PyObject *arg)
+{
+    long bits = PyLong_AsLong(arg);
+    if (bits == -1 && PyErr_Occurred())
+        return NULL;
+    if (bits < 0 || bits > 32) {
+        PyErr_SetString(PyExc_ValueError, "bit count must be between 0 and 32");
+        return NULL;
+    }
+    uint32_t value = peekbits(self, (int)bits);
+    self->count -= (int)bits;
+    return PyLong_FromUnsignedLong(value);
+}
+
+static PyObject *
+BitReader_DecodeEntry(BitReaderObject *self, PyObject *table)
+{
+    Py_buffer tv;
+    uint16_t entry;
+    if (PyObject_GetBuffer(table, &tv, PyBUF_SIMPLE) < 0)
+        return NULL;
+    if (tv.len < (2 << DECODE_TABLE_BITS)) {
+        PyBuffer_Release(&tv);
+        PyErr_SetString(PyExc_ValueError, "decode table is too small");
+        return NULL;
+    }
+    entry = ((const uint16_t *)tv.buf)[peekbits(self, DECODE_TABLE_BITS)];
+    PyBuffer_Release(&tv);
+    self->count -= entry & 0xf;
+    return PyLong_FromUnsignedLong(entry >> 4);
+}
+
+static PyObject *
+BitReader_get_addr(BitReaderObject *self, void *closure)
+{
+    return PyLong_FromSsize_t((self->pos * 8 - self->count) >> 3);
+}
+
+static PyObject *
+BitReader_get_bit(BitReaderObject *self, void *closure)
+{
+    return PyLong_FromSsize_t((self->pos * 8 - self->count) & 7);
+}
+
+static PyObject *
+BitReader_get_size(BitReaderObject *self, void *closure)
+{
+    return PyLong_FromSsize_t(self->view.len);
+}
+
+static PyObject *
+BitReader_get_streaming(BitReaderObject *self, void *closure)
+{
+    return PyBool_FromLong(self->source != NULL);
+}
+
+static PyMethodDef BitReader_methods[] = {
+    {"Fill", (PyCFunction)BitReader_Fill, METH_VARARGS, NULL},
+    {"AddBits", (PyCFunction)BitReader_AddBits, METH_O, NULL},
+    {"Read16", (PyCFunction)BitReader_Read16, METH_NOARGS, NULL},
+    {"Read32", (PyCFunction)BitReader_Read32, METH_NOARGS, NULL},
+    {"GetBits", (PyCFunction)BitReader_GetBits, METH_O, NULL},
+    {"DecodeEntry", (PyCFunction)BitReader_DecodeEntry, METH_O, NULL},
+    {NULL}
+};
+
+static PyGetSetDef BitReader_getset[] = {
+    {"Addr", (getter)BitReader_get_addr, NULL, NULL, NULL},
+    {"Bit", (getter)BitReader_get_bit, NULL, NULL, NULL},
+    {"Size", (getter)BitReader_get_size, NULL, NULL, NULL},
+    {"Streaming", (getter)BitReader_get_streaming, NULL, NULL, NULL},
+    {NULL}
+};
+
+static PyTypeObject BitReaderType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "_accel.BitReader",
+    .tp_basicsize = sizeof(BitReaderObject),
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = PyType_GenericNew,
+    .tp_init = (initproc)BitReader_init,
+    .tp_dealloc = (destructor)BitReader_dealloc,
+    .tp_methods = BitReader_methods,
+    .tp_getset = BitReader_getset,
+};
+
+static int
+getarray(PyObject *obj, Py_buffer *view, Py_ssize_t itemsize, Py_ssize_t count, const char *name)
+{
+    if (PyObject_GetBuffer(obj, view, PyBUF_WRITABLE | PyBUF_FORMAT) < 0)
+        return -1;
+    if (view->itemsize != itemsize || view->len < itemsize * count) {
+        PyBuffer_Release(view);
+        PyErr_Format(PyExc_ValueError, "%s must be an array of %zd %zd byte items",
+                     name, count, itemsize);
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject *
+build_table(PyObject *module, PyObject *args)
+{
+    PyObject *lengthobj, *lenobj, *posobj, *numobj, *tableobj;
+    Py_ssize_t size;
+    Py_buffer lv, dl, dp, dn, tv;
+    if (!PyArg_ParseTuple(args, "OnOOOO", &lengthobj, &size, &lenobj, &posobj, &numobj, &tableobj))
+        return NULL;
+    if (size < 0 || size > LARGEST_TABLE_SIZE) {
+        PyErr_SetString(PyExc_ValueError, "table size out of range");
+        return NULL;
+    }
+    if (PyObject_GetBuffer(lengthobj, &lv, PyBUF_SIMPLE) < 0)
+        return NULL;
+    if (lv.len < size) {
+        PyBuffer_Release(&lv);
+        PyErr_SetString(PyExc_ValueError, "length table is shorter than size");
+        return NULL;
+    }
+    if (getarray(lenobj, &dl, 4, 16, "DecodeLen") < 0)
+        goto fail_l;
+    if (getarray(posobj, &dp, 4, 16, "DecodePos") < 0)
+        goto fail_dl;
+    if (getarray(numobj, &dn, 2, LARGEST_TABLE_SIZE, "DecodeNum") < 0)
+        goto fail_dp;
+    if (getarray(tableobj, &tv, 2, 1 << DECODE_TABLE_BITS, "Table") < 0)
+        goto fail_dn;
+
+    const unsigned char *lengths = (const unsigned char *)lv.buf;
+    uint32_t *decodelen = (uint32_t *)dl.buf;
+    uint32_t *decodepos = (uint32_t *)dp.buf;
+    uint16_t *decodenum = (uint16_t *)dn.buf;
+    uint16_t *table = (uint16_t *)tv.buf;
+    Py_ssize_t tablesize = tv.len / 2;
+    uint32_t count[16] = {0};
+    uint32_t copypos[16];
+    Py_ssize_t i, total = 0, pos = 0;
+    uint32_t upperlimit = 0;
+    int length;
+
+    for (i = 0; i < size; i++)
+        count[lengths[i] & 0xf]++;
+    count[0] = 0;
+    decodelen[0] = 0;
+    decodepos[0] = 0;
+    for (length = 1; length < 16; length++) {
+        upperlimit += count[length];
+        decodelen[length] = upperlimit << (16 - length);
+        upperlimit *= 2;
+        decodepos[length] = decodepos[length - 1] + count[length - 1];
+        total += count[length];
+    }
+    memset(decodenum, 0, dn.len);
+    memcpy(copypos, decodepos, sizeof(copypos));
+    for (i = 0; i < size; i++) {
+        length = lengths[i] & 0xf;
+        if (length != 0)
+            decodenum[copypos[length]++] = (uint16_t)i;
+    }
+    /* canonical codes fill the direct table in DecodeNum order */
+    for (i = 0; i < total && pos < tablesize; i++) {
+        uint16_t symbol = decodenum[i];
+        length = lengths[symbol] & 0xf;
+        Py_ssize_t span = (Py_ssize_t)1 << (DECODE_TABLE_BITS - length);
+        uint16_t entry = (uint16_t)((symbol << 4) | length);
+        Py_ssize_t end = pos + span < tablesize ? pos + span : tablesize;
+        while (pos < end)
+            table[pos++] = entry;
+    }
+    if (pos < tablesize) {
+        Py_ssize_t fill = size - total;
+        if (fill > tablesize - pos)
+            fill = tablesize - pos;
+        while (fill-- > 0)
+            table[pos++] = 15;
+        uint16_t fallback = (uint16_t)((decodenum[0] << 4) | 15);
+        while (pos < tablesize)
+            table[pos++] = fallback;
+    }
+
+    PyBuffer_Release(&tv);
+    PyBuffer_Release(&dn);
+    PyBuffer_Release(&dp);
+    PyBuffer_Release(&dl);
+    PyBuffer_Release(&lv);
+    Py_RETURN_NONE;
+
+fail_dn:
+    PyBuffer_Release(&dn);
+fail_dp:
+    PyBuffer_Release(&dp);
+fail_dl:
+    PyBuffer_Release(&dl);
+fail_l:
+    PyBuffer_Release(&lv);
+    return NULL;
+}
+
+static PyMethodDef module_methods[] = {
+    {"build_table", build_table, METH_VARARGS, NULL},
+    {NULL}
+};
+
+static struct PyModuleDef accelmodule = {
+    PyModuleDef_HEAD_INIT,
+    .m_name = "_accel",
+    .m_size = -1,
+    .m_methods = module_methods,
+};
+
+PyMODINIT_FUNC
+PyInit__accel(void)
+{
+    PyObject *m;
+    if (PyType_Ready(&BitReaderType) < 0)
+        return NULL;
+    m = PyModule_Create(&accelmodule);
+    if (m == NULL)
+        return NULL;
+    Py_INCREF(&BitReaderType);
+    if (PyModule_AddObject(m, "BitReader", (PyObject *)&BitReaderType) < 0) {
+        Py_DECREF(&BitReaderType);
+        Py_DECREF(m);
+        return NULL;
+    }
+    return m;
+}
@@ -0,0 +1,20 @@
+import os
+
+ACCEL_ENV = "MINIRAR_ACCEL"
+
+
+def load_accel():
+    mode = os.environ.get(ACCEL_ENV, "auto").lower()
+    if mode in ("0", "python", "off"):
+        return None
+    try:
+        import _accel
+    except ImportError:
+        if mode in ("1", "c", "on"):
+            raise
+        return None
+    return _accel
+
+
+_accel = load_accel()
+BACKEND = "python" if _accel is None else "c"
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from reader import Archive
+
+STREAM_QUEUE_DEPTH = 8
+STREAM_HANDLES = 4
+
+_DONE = object()
+
+
+class AsyncArchive:
+    # Archive for asyncio code: opening scans the headers on the executor,
+    # each stream decodes there and hands chunks over through a bounded
+    # queue, so a slow reader holds its decoder back instead of piling up
+    # data. Up to handles streams run at once, each on its own Archive
+    # handle; the rest wait for one to come free. Decoding is Python code
+    # under the GIL, the executor keeps it off the event loop rather than
+    # making it parallel. A stream left early holds its handle until it is
+    # closed, contextlib.aclosing does that
+    def __init__(self, filename, usemmap = True, executor = None, handles = STREAM_HANDLES,
+                 depth = STREAM_QUEUE_DEPTH):
+        self.__filename = filename
+        self.__usemmap = usemmap
+        self.__executor = executor
+        self.__handles = handles
+        self.__depth = depth
+        self.__archive = None
+        self.__idle = []
+        self.__all = []
+        self.__slots = None
+
+    async def __run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+    async def open(self):
+        if self.__archive is None:
+            self.__archive = await self.__run(Archive, self.__filename, self.__usemmap)
+            self.__idle.append(self.__archive)
+            self.__all.append(self.__archive)
+            self.__slots = asyncio.Semaphore(self.__handles)
+        return self
+
+    async def close(self):
+        handles, self.__all, self.__idle = self.__all, [], []
+        self.__archive = None
+        for handle in handles:
+            handle.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def __acquire(self):
+        await self.__slots.acquire()
+        try:
+            if self.__idle:
+                return self.__idle.pop()
+            handle = await self.__run(self.__archive.clone)
+            self.__all.append(handle)
+            return handle
+        except BaseException:
+            self.__slots.release()
+            raise
+
+    def __release(self, handle):
+        if handle in self.__all:
+            self.__idle.append(handle)
+        self.__slots.release()
+
+    def namelist(self):
+        return self.__archive.namelist()
+
+    def infolist(self):
+        return self.__archive.infolist()
+
+    def getinfo(self, name):
+        return self.__archive.getinfo(name)
+
+    async def read(self, name):
+        handle = await self.__acquire()
+        try:
+            return await self.__run(handle.read, name)
+        finally:
+            self.__release(handle)
+
+    async def stream(self, name):
+        self.__archive.getinfo(name)
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.__depth)
+        stop = threading.Event()
+
+        def produce(handle):
+            # runs on the executor, blocked while the queue is full
+            try:
+                for chunk in handle.chunks(name):
+                    if stop.is_set():
+                        return
+                    asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+                item = _DONE
+            except BaseException as e:
+                item = e
+            if not stop.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        handle = await self.__acquire()
+        producer = None
+        try:
+            producer = loop.run_in_executor(self.__executor, produce, handle)
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # a producer waiting on a full queue needs room to notice stop
+            while producer is not None and not producer.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait((producer,), timeout=0.05)
+            self.__release(handle)
+
+    @property
+    def Filename(self):
+        return self.__filename
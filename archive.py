@@ -0,0 +1,170 @@
+import os
+from structs import RAR_FORMAT, HEADER_TYPE, HOST_SYSTEM
+from structs import BaseBlock, MainHeader, FileHeader
+from structs import MHD_COMMENT, MHD_PASSWORD, LHD_COMMENT, LHD_LARGE
+from structs5 import BaseBlock5, MainHeader5, FileHeader5, QuickOpen
+from mmapfile import MappedFile
+from crc import CRCError, header_crc, checked_chunks
+import stats
+
+
+def open_archive(filename, usemmap=True):
+    return MappedFile(filename) if usemmap else open(filename, "rb")
+
+
+def read_signature(f):
+    rarsig = bytearray([0x52, 0x61, 0x72, 0x21, 0x1a, 0x07])
+    sig = f.read(7)
+    if sig[0:6]==rarsig:
+        if sig[6]==0:
+            return RAR_FORMAT.RARFMT15
+        elif sig[6]==1:
+            if f.read(1) == b"\x00":
+                return RAR_FORMAT.RARFMT50
+        elif sig[6]==2:
+            return RAR_FORMAT.RARFMT_FUTURE
+    return RAR_FORMAT.RARFMT_NONE
+
+
+MAIN_HEADERS = (HEADER_TYPE.HEAD3_MAIN, HEADER_TYPE.HEAD_MAIN)
+FILE_HEADERS = (HEADER_TYPE.HEAD3_FILE, HEADER_TYPE.HEAD_FILE)
+# unrar does not check these: old subblocks, and the AV and sign headers
+# whose CRC was never set properly
+UNCHECKED_HEADERS = (HEADER_TYPE.HEAD3_OLDSERVICE, HEADER_TYPE.HEAD3_AV, HEADER_TYPE.HEAD3_SIGN)
+SIZEOF_MAINHEAD3 = 13
+SIZEOF_FILEHEAD3 = 32
+
+
+def header_crc_size(f, bb):
+    # how much of a RAR 1.5-4.x header its CRC covers, None when it is not
+    # checked. A RAR 2.x comment embedded in a main or file header follows
+    # the checked part: the fixed fields, and for a file the name
+    if bb.HeaderType in UNCHECKED_HEADERS:
+        return None
+    if bb.HeaderType == HEADER_TYPE.HEAD3_MAIN and bb.Flags & MHD_COMMENT:
+        return SIZEOF_MAINHEAD3
+    if bb.HeaderType == HEADER_TYPE.HEAD3_FILE and bb.Flags & LHD_COMMENT:
+        pos = f.tell()
+        # NameSize follows the block header and 19 bytes of file fields
+        f.seek(bb.Offset + 26)
+        namesize = int.from_bytes(f.read(2), "little")
+        f.seek(pos)
+        return SIZEOF_FILEHEAD3 + (8 if bb.Flags & LHD_LARGE else 0) + namesize
+    return bb.HeadSize
+
+
+def read_blocks(f, verify = False, fmt = RAR_FORMAT.RARFMT15):
+    if fmt == RAR_FORMAT.RARFMT50:
+        yield from read_blocks5(f, verify)
+        return
+    pos = f.tell()
+    while True:
+        f.seek(pos)
+        try:
+            bb = BaseBlock(f)
+        except EOFError:
+            return
+        if verify:
+            size = header_crc_size(f, bb)
+            if size is not None and header_crc(f, bb.Offset, size) != bb.HeadCRC:
+                raise CRCError("header CRC mismatch at offset %d" % bb.Offset)
+        if bb.HeaderType == HEADER_TYPE.HEAD3_ENDARC:
+            return
+        h = None
+        if bb.HeaderType == HEADER_TYPE.HEAD3_MAIN:
+            # the headers after an encrypted main header are ciphertext
+            if bb.Flags & MHD_PASSWORD:
+                raise NotImplementedError("encrypted headers are not supported")
+            h = MainHeader(bb, f)
+        elif bb.HeaderType == HEADER_TYPE.HEAD3_FILE:
+            h = FileHeader(bb, f)
+        else:
+            bb.Skip(f)
+        pos = f.tell()
+        if h is not None:
+            yield h
+
+
+def read_blocks5(f, verify = False):
+    pos = f.tell()
+    quickopen = None
+    while True:
+        raw = None if quickopen is None else quickopen.Get(pos)
+        if raw is not None:
+            bb = BaseBlock5(raw=raw, offset=pos)
+        else:
+            f.seek(pos)
+            try:
+                bb = BaseBlock5(f)
+            except EOFError:
+                return
+        if verify and not bb.VerifyCRC():
+            raise CRCError("header CRC mismatch at offset %d" % bb.Offset)
+        if bb.HeaderType == HEADER_TYPE.HEAD_ENDARC:
+            return
+        if bb.HeaderType == HEADER_TYPE.HEAD_CRYPT:
+            raise NotImplementedError("encrypted headers are not supported")
+        h = None
+        if bb.HeaderType == HEADER_TYPE.HEAD_MAIN:
+            h = MainHeader5(bb)
+            quickopen = QuickOpen(f, h)
+        elif bb.HeaderType == HEADER_TYPE.HEAD_FILE:
+            h = FileHeader5(bb, f)
+        pos = bb.DataOffset + bb.DataSize
+        if h is not None:
+            yield h
+
+
+def read_header(f, offset, fmt = RAR_FORMAT.RARFMT15):
+    f.seek(offset)
+    if fmt == RAR_FORMAT.RARFMT50:
+        return FileHeader5(BaseBlock5(f), f)
+    return FileHeader(BaseBlock(f), f)
+
+
+def member_path(destination, fh):
+    # RAR 1.5-4.x names always separate directories with a backslash,
+    # whatever system made the archive; RAR5 names only from Windows
+    name = fh.Filename
+    if (fh.HeaderType == HEADER_TYPE.HEAD3_FILE or
+            fh.HostOS in (HOST_SYSTEM.MSDOS, HOST_SYSTEM.OS2, HOST_SYSTEM.WIN32)):
+        name = name.replace("\\", "/")
+    parts = [p for p in name.split("/") if p not in ("", ".", "..")]
+    return os.path.join(destination, *parts)
+
+
+def member_chunks(fh, decoder = None):
+    chunks = fh.Chunks() if decoder is None else decoder.Chunks(fh)
+    return chunks if stats.STATS is None else stats.STATS.Chunks(chunks)
+
+
+def extract_member(fh, destination, decoder = None):
+    if fh.IsSymlink:
+        # links are not made, a later member could be written through
+        # one; a solid run still needs its data decoded
+        test_member(fh, decoder)
+        return 0
+    path = member_path(destination, fh)
+    if fh.IsDirectory:
+        os.makedirs(path, exist_ok=True)
+        return 0
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    chunks = checked_chunks(fh, member_chunks(fh, decoder))
+    # the first chunk comes before the file is made, so a member that
+    # cannot be decoded at all, encrypted or unsupported, leaves nothing
+    first = next(chunks, b"")
+    total = len(first)
+    with open(path, "wb") as out:
+        out.write(first)
+        for chunk in chunks:
+            out.write(chunk)
+            total += len(chunk)
+    return total
+
+
+def test_member(fh, decoder = None):
+    chunks = member_chunks(fh, decoder)
+    total = 0
+    for chunk in checked_chunks(fh, chunks):
+        total += len(chunk)
+    return total
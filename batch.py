@@ -0,0 +1,158 @@
+import csv
+import functools
+import glob
+import json
+import os
+import re
+import time
+from structs import RAR_FORMAT
+from archive import open_archive, read_signature, extract_member, test_member, FILE_HEADERS
+from crc import CRCError
+from solid import SolidDecoder
+from tabledump import TableDump, DUMP_SUFFIX
+from volume import read_volumes
+
+BATCH_MODES = ("read", "list", "test", "extract")
+REPORT_FIELDS = ("archive", "mode", "members", "bytes", "errors", "seconds", "error")
+LATER_VOLUME = re.compile(r"\.part0*([2-9]|[1-9]\d+)\.rar$", re.IGNORECASE)
+
+
+def is_pattern(name):
+    return any(c in name for c in "*?[")
+
+
+def pattern_root(pattern):
+    # the directory a pattern searches below: its leading plain components
+    parts = []
+    for part in os.path.dirname(pattern).split(os.sep):
+        if is_pattern(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts)
+
+
+def expand_inputs(inputs, recursive = False):
+    # (archive, root) pairs, root being the directory the archive was found
+    # below. Archives named outright are taken as they are; directories and
+    # patterns give their .rar files less the later parts of volume sets,
+    # which are read through their first part
+    seen = set()
+    for name in inputs:
+        if os.path.isdir(name):
+            paths = glob.glob(os.path.join(name, "**", "*.rar") if recursive else os.path.join(name, "*.rar"),
+                              recursive=recursive)
+            paths = [p for p in sorted(paths) if os.path.isfile(p) and not LATER_VOLUME.search(p)]
+            root = name
+        elif is_pattern(name):
+            paths = [p for p in sorted(glob.glob(name, recursive=recursive))
+                     if os.path.isfile(p) and not LATER_VOLUME.search(p)]
+            root = pattern_root(name)
+        else:
+            paths = [name]
+            root = os.path.dirname(name)
+        for path in paths:
+            if path not in seen:
+                seen.add(path)
+                yield path, root
+
+
+def archive_destination(destination, filename, root = ""):
+    # each archive extracts into a directory named after its path below
+    # root, so d1/x.rar and d2/x.rar found in one directory stay apart
+    return os.path.join(destination, os.path.splitext(os.path.relpath(filename, root or os.curdir))[0])
+
+
+def archive_destinations(archives, destination):
+    # archive_destination for each (archive, root) pair; archives that
+    # would still share a directory, x.rar named from two places, get a
+    # numbered one. Returns the directories and the (archive, directory)
+    # pairs that were renumbered
+    taken = set()
+    destinations = []
+    renamed = []
+    for filename, root in archives:
+        path = base = archive_destination(destination, filename, root)
+        n = 1
+        while os.path.normcase(os.path.normpath(path)) in taken:
+            n += 1
+            path = "%s-%d" % (base, n)
+        taken.add(os.path.normcase(os.path.normpath(path)))
+        destinations.append(path)
+        if n > 1:
+            renamed.append((filename, path))
+    return destinations, renamed
+
+
+def process_archive(filename, destination = None, mode = "test", log = True, usemmap = True):
+    # one archive, quietly: the counts go back as a report row. Anything
+    # an archive raises is its own failure, the batch goes on
+    result = {"archive": filename, "mode": mode, "members": 0, "bytes": 0,
+              "errors": 0, "seconds": 0.0, "error": None}
+    start = time.perf_counter()
+    out = None
+    try:
+        with open_archive(filename, usemmap) as f:
+            fmt = read_signature(f)
+            if fmt == RAR_FORMAT.RARFMT_NONE:
+                raise ValueError("not a RAR archive")
+            if mode == "read" and log:
+                out = TableDump(os.path.splitext(filename)[0] + DUMP_SUFFIX)
+            decoder = SolidDecoder()
+            for h in read_volumes(f, filename, mode in ("test", "extract"), fmt, usemmap):
+                if h.HeaderType not in FILE_HEADERS:
+                    continue
+                result["members"] += 1
+                if mode in ("read", "list"):
+                    result["bytes"] += h.UnpSize
+                    tables = h.GetTables() if out is not None else None
+                    if tables:
+                        out.Write(h.Filename, tables)
+                    continue
+                try:
+                    if mode == "test":
+                        result["bytes"] += test_member(h, decoder)
+                    else:
+                        result["bytes"] += extract_member(h, destination, decoder)
+                except (CRCError, NotImplementedError) as e:
+                    result["errors"] += 1
+                    result["error"] = result["error"] or str(e)
+    except Exception as e:
+        result["errors"] += 1
+        result["error"] = result["error"] or "%s: %s" % (type(e).__name__, e)
+    finally:
+        if out is not None:
+            out.close()
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(filenames, mode = "test", destinations = None, log = True, usemmap = True, jobs = 1):
+    # results in the order of filenames; destinations, from
+    # archive_destinations, is where each one extracts to. With jobs > 1
+    # one pool of worker processes takes every archive, so start-up is
+    # paid once per worker and each keeps its table cache from archive to
+    # archive
+    process = functools.partial(process_archive, mode=mode, log=log, usemmap=usemmap)
+    filenames = list(filenames)
+    if destinations is None:
+        destinations = [None] * len(filenames)
+    if jobs <= 1:
+        yield from map(process, filenames, destinations)
+        return
+    # imported here as in parallel, the pool is only for -j
+    from concurrent.futures import ProcessPoolExecutor
+    chunksize = max(1, min(64, len(filenames) // (jobs * 8)))
+    with ProcessPoolExecutor(jobs) as pool:
+        yield from pool.map(process, filenames, destinations, chunksize=chunksize)
+
+
+def write_report(results, filename):
+    # JSON for a .json name, tab separated values otherwise
+    with open(filename, "w", newline="") as out:
+        if filename.lower().endswith(".json"):
+            json.dump(results, out, indent=1)
+            out.write("\n")
+            return
+        writer = csv.DictWriter(out, REPORT_FIELDS, delimiter="\t", extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
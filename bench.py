@@ -0,0 +1,207 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import unpack
+from accel import BACKEND
+from archive import open_archive, read_signature, read_blocks, test_member, FILE_HEADERS
+from bitreader import BitReader
+from crc import CRCError
+from reader import Archive
+from solid import SolidDecoder
+from synth import write_archive, header_members, random_lengths, make_bitstream, text_data, random_data
+from unpack import DecodeTable, TableCache, NC, DC, LDC, RC, BC, NC30, DC30, LDC30, RC30, BC30
+from volume import read_volumes
+
+TABLE_SIZES = (("NC30", NC30), ("DC30", DC30), ("LDC30", LDC30), ("RC30", RC30), ("BC30", BC30),
+               ("NC", NC), ("DC", DC), ("LDC", LDC), ("RC", RC), ("BC", BC))
+
+
+def best(run, repeat):
+    # the fastest of repeat runs, the one least disturbed by the machine
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def bench_headers(workdir, count, repeat):
+    results = []
+    for fmt in (3, 5):
+        path = os.path.join(workdir, "headers%d.rar" % fmt)
+        write_archive(path, header_members(count), fmt)
+        for usemmap in (True, False):
+            def scan():
+                with open_archive(path, usemmap) as f:
+                    return sum(1 for h in read_blocks(f, fmt=read_signature(f)) if h.HeaderType in FILE_HEADERS)
+            seconds, entries = best(scan, repeat)
+            results.append({"name": "headers.rar%d.%s" % (fmt, "mmap" if usemmap else "read"),
+                            "entries": entries, "seconds": seconds, "entries_per_s": entries / seconds})
+    return results
+
+
+def bench_tables(builds, repeat):
+    results = []
+    saved = unpack.TABLE_CACHE
+    try:
+        for name, size in TABLE_SIZES:
+            lengths = bytes(random_lengths(size, size))
+            table = DecodeTable()
+            for label, cache in (("build", TableCache(0)), ("cached", TableCache(1))):
+                # a cache of one that has seen the lengths twice only ever hits
+                unpack.TABLE_CACHE = cache
+                table.Build(lengths, size)
+                table.Build(lengths, size)
+                def build():
+                    for _ in range(builds):
+                        table.Build(lengths, size)
+                seconds, _ = best(build, repeat)
+                results.append({"name": "tables.%s.%s" % (label, name), "builds": builds,
+                                "seconds": seconds, "us_per_build": seconds / builds * 1e6})
+    finally:
+        unpack.TABLE_CACHE = saved
+    return results
+
+
+def bench_symbols(count, repeat):
+    results = []
+    for name, size in (("NC30", NC30), ("DC30", DC30), ("NC", NC)):
+        lengths = random_lengths(size, size)
+        data = make_bitstream(lengths, count, size)
+        table = DecodeTable()
+        table.Build(bytes(lengths), size)
+        entries = table.Table
+        def decode():
+            br = BitReader(data)
+            decodeentry = br.DecodeEntry
+            for _ in range(count):
+                decodeentry(entries)
+            return br.Addr
+        seconds, _ = best(decode, repeat)
+        results.append({"name": "symbols.%s" % name, "symbols": count, "bytes": len(data),
+                        "seconds": seconds, "symbols_per_s": count / seconds})
+    return results
+
+
+def test_archive(path, usemmap = True):
+    # the -t path without the printing: unpacked bytes and failed members
+    total = 0
+    failed = 0
+    with open_archive(path, usemmap) as f:
+        decoder = SolidDecoder()
+        try:
+            for h in read_volumes(f, path, True, read_signature(f), usemmap):
+                if h.HeaderType not in FILE_HEADERS:
+                    continue
+                try:
+                    total += test_member(h, decoder)
+                except CRCError:
+                    failed += 1
+        except (CRCError, EOFError, OSError):
+            failed += 1
+    return total, failed
+
+
+def throughput(name, path, repeat):
+    def run():
+        unpack.TABLE_CACHE.Clear()
+        return test_archive(path)
+    seconds, (total, failed) = best(run, repeat)
+    return {"name": name, "bytes": total, "packed": os.path.getsize(path), "errors": failed,
+            "seconds": seconds, "mb_per_s": total / seconds / 1e6}
+
+
+def bench_extract(workdir, size, repeat):
+    results = []
+    text = text_data(size, 1)
+    noise = random_data(size // 4, 2)
+    small = [("small%04d.txt" % i, text_data(4096, i)) for i in range(size // 4096)]
+    for label, fmt, members, compress in (
+            ("stored.rar3", 3, [("text.txt", text), ("noise.bin", noise)], False),
+            ("stored.rar5", 5, [("text.txt", text), ("noise.bin", noise)], False),
+            ("lz.text", 3, [("text.txt", text)], True),
+            ("lz.noise", 3, [("noise.bin", noise)], True),
+            ("lz.small", 3, small, True)):
+        path = os.path.join(workdir, label + ".rar")
+        write_archive(path, members, fmt, compress)
+        results.append(throughput("extract." + label, path, repeat))
+    return results
+
+
+def bench_access(workdir, count, repeat, samples = 10):
+    # reads of members picked at random from one solid run, decoding from
+    # the start of the run each time or from checkpoints
+    path = os.path.join(workdir, "solid.rar")
+    write_archive(path, [("small%05d.txt" % i, text_data(2048, i)) for i in range(count)], 3, True, solid=True)
+    picks = random.Random(0).sample(range(count), min(samples, count))
+    results = []
+    for checkpoint in (0, max(1, count // 20)):
+        def run():
+            unpack.TABLE_CACHE.Clear()
+            with Archive(path, checkpoint=checkpoint) as archive:
+                names = archive.namelist()
+                return sum(len(archive.read(names[i])) for i in picks)
+        seconds, total = best(run, repeat)
+        results.append({"name": "access.solid.checkpoint%d" % checkpoint, "members": count, "reads": len(picks),
+                        "bytes": total, "seconds": seconds, "reads_per_s": len(picks) / seconds})
+    return results
+
+
+def bench_fixtures(directory, repeat):
+    return [throughput("fixture." + os.path.basename(path), path, repeat)
+            for path in sorted(glob.glob(os.path.join(directory, "*.rar")))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark header scans, table builds, symbol decoding and extraction")
+    parser.add_argument("-n", "--count", type=int, default=20000,
+                        help="members in the header scan archives")
+    parser.add_argument("-s", "--size", type=int, default=2, metavar="MB",
+                        help="unpacked size of the synthetic extraction archives")
+    parser.add_argument("--members", type=int, default=500,
+                        help="members in the solid archive for random access reads")
+    parser.add_argument("--symbols", type=int, default=200000,
+                        help="symbols per decode run")
+    parser.add_argument("--builds", type=int, default=200,
+                        help="table builds per run")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="runs per case, the fastest is reported")
+    parser.add_argument("--fixtures", metavar="DIR",
+                        help="also time testing every .rar archive in DIR")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="write the JSON report to FILE instead of standard output")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        results += bench_headers(workdir, args.count, args.repeat)
+        results += bench_tables(args.builds, args.repeat)
+        results += bench_symbols(args.symbols, args.repeat)
+        results += bench_extract(workdir, args.size << 20, args.repeat)
+        results += bench_access(workdir, args.members, args.repeat)
+    if args.fixtures:
+        results += bench_fixtures(args.fixtures, args.repeat)
+    report = {
+        "backend": BACKEND,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
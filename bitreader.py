@@ -1,42 +1,108 @@
 from binascii import hexlify
+from accel import _accel
+
+READ_SIZE = 0x8000
+
 class BitReader:
-    def __init__(self, data = None):
-        length = 0 if data is None else len(data) + 4 
-        self.__data = bytearray(length)
-        self.__addr = 0
-        self.__bit = 0
-        if data is not None:
-            self.__data[0:len(data)] = data
+    __slots__ = ('__data', '__source', '__pos', '__acc', '__count')
+
+    def __init__(self, data = None, source = None):
+        self.__data = b"" if data is None else data
+        self.__source = source
+        self.__pos = 0      # next byte to load into the accumulator
+        self.__acc = 0      # low __count bits are the unread input
+        self.__count = 0
+
+    def Fill(self, size = READ_SIZE):
+        if self.__source is None:
+            return False
+        chunk = self.__source(size)
+        if not chunk:
+            self.__source = None
+            return False
+        # the accumulator may hold zero padding from past the old end,
+        # so restart it from the first unread byte of the joined buffer
+        bitpos = self.__pos * 8 - self.__count
+        self.__data = bytes(self.__data[bitpos >> 3:]) + bytes(chunk)
+        self.__pos = 0
+        self.__acc = 0
+        self.__count = 0
+        self.AddBits(bitpos & 7)
+        return True
+
+    def __refill(self):
+        chunk = self.__data[self.__pos:self.__pos + 8]
+        value = int.from_bytes(chunk, 'big')
+        if len(chunk) < 8:
+            value <<= (8 - len(chunk)) * 8
+        self.__acc = ((self.__acc & ((1 << self.__count) - 1)) << 64) | value
+        self.__count += 64
+        self.__pos += 8
 
     def AddBits(self, bits):
-        bits += self.__bit
-        self.__addr += (bits >> 3)
-        self.__bit = bits & 7
+        if bits <= self.__count:
+            self.__count -= bits
+            return
+        bitpos = self.__pos * 8 - self.__count + bits
+        self.__pos = bitpos >> 3
+        self.__acc = 0
+        self.__count = 0
+        if bitpos & 7:
+            self.__refill()
+            self.__count -= bitpos & 7
 
     def Read16(self):
-        bitfield = self.__data[self.__addr] << 16
-        bitfield |= self.__data[self.__addr + 1] << 8
-        bitfield |= self.__data[self.__addr + 2]
-        bitfield >>= (8 - self.__bit)
-        return bitfield & 0xffff
+        if self.__count < 16:
+            self.__refill()
+        return (self.__acc >> (self.__count - 16)) & 0xffff
 
     def Read32(self):
-        bitfield = self.__data[self.__addr] << 24
-        bitfield |= self.__data[self.__addr + 1] << 16
-        bitfield |= self.__data[self.__addr + 2] << 8
-        bitfield |= self.__data[self.__addr + 3]
-        bitfield <<= self.__bit
-        bitfield |= self.__data[self.__addr + 4] >> (8 - self.__bit)
-        return bitfield & 0xffffffff
+        if self.__count < 32:
+            self.__refill()
+        return (self.__acc >> (self.__count - 32)) & 0xffffffff
+
+    def GetBits(self, bits):
+        if self.__count < bits:
+            self.__refill()
+        self.__count -= bits
+        return (self.__acc >> self.__count) & ((1 << bits) - 1)
+
+    def DecodeEntry(self, table):
+        # table entries are (symbol << 4) | length, indexed by 15 bits
+        if self.__count < 15:
+            self.__refill()
+        entry = table[(self.__acc >> (self.__count - 15)) & 0x7fff]
+        self.__count -= entry & 0xf
+        return entry >> 4
+
+    @property
+    def Addr(self):
+        return (self.__pos * 8 - self.__count) >> 3
+
+    @property
+    def Size(self):
+        return len(self.__data)
+
+    @property
+    def Streaming(self):
+        return self.__source is not None
+
+    @property
+    def Bit(self):
+        return (self.__pos * 8 - self.__count) & 7
+
+PyBitReader = BitReader
+if _accel is not None:
+    BitReader = _accel.BitReader
 
 if __name__ == '__main__':
     test = bytearray((0x11, 0xD9, 0x5C, 0x1C))
-    br = BitReader(test)
+    br = BitReader(memoryview(test))
     test1 = br.Read16()
     br.AddBits(2)
     test2 = br.Read16()
-    test3 = test2 >> 12
+    test3 = br.GetBits(4)
     print(hexlify(test))
     print("{0:#0{1}x}".format(test1, 10))
     print("{0:#0{1}x}".format(test2, 10))
-    print("{0:#0{1}x}".format(test3, 10))
\ No newline at end of file
+    print("{0:#0{1}x}".format(test3, 10))
@@ -0,0 +1,77 @@
+from array import array
+from collections import namedtuple
+from structs import RAR_FORMAT
+from archive import read_blocks, MAIN_HEADERS, FILE_HEADERS
+
+IndexEntry = namedtuple("IndexEntry", (
+    "Offset", "DataOffset", "DataSize", "UnpSize", "FileCRC", "Flags",
+    "FileTime", "Method", "WinSize", "Host", "FileAttribute", "Filename"))
+
+
+class Catalog:
+    # the members of an archive as plain array columns and one blob of
+    # UTF-8 names, a hundred bytes or so per member against several
+    # hundred for a FileHeader; entries are built when indexed
+    def __init__(self, f = None, fmt = RAR_FORMAT.RARFMT15, verify = False):
+        self.__offset = array("Q")
+        self.__headsize = array("I")
+        self.__datasize = array("Q")
+        self.__unpsize = array("Q")
+        self.__filecrc = array("q")
+        self.__flags = array("I")
+        self.__filetime = array("I")
+        self.__method = array("B")
+        self.__winsize = array("Q")
+        self.__host = array("B")
+        self.__fileattr = array("Q")
+        self.__names = bytearray()
+        self.__nameends = array("Q")
+        self.__isvolume = False
+        if f is not None:
+            self.__read(f, fmt, verify)
+
+    def __read(self, f, fmt, verify):
+        for h in read_blocks(f, verify, fmt):
+            if h.HeaderType in MAIN_HEADERS:
+                self.__isvolume = self.__isvolume or h.IsVolume
+            elif h.HeaderType in FILE_HEADERS:
+                self.Append(h)
+
+    def Append(self, fh):
+        self.__offset.append(fh.Offset)
+        self.__headsize.append(fh.DataOffset - fh.Offset)
+        self.__datasize.append(fh.DataSize)
+        self.__unpsize.append(fh.UnpSize)
+        self.__filecrc.append(-1 if fh.FileCRC is None else fh.FileCRC)
+        self.__flags.append(int(fh.Flags))
+        self.__filetime.append(fh.FileTime)
+        self.__method.append(fh.Method)
+        self.__winsize.append(fh.WinSize)
+        self.__host.append(fh.HostOS.value)
+        self.__fileattr.append(fh.FileAttribute)
+        self.__names += fh.Filename.encode("utf-8", "surrogatepass")
+        self.__nameends.append(len(self.__names))
+
+    def __len__(self):
+        return len(self.__offset)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("catalog index out of range")
+        offset = self.__offset[i]
+        filecrc = self.__filecrc[i]
+        start = self.__nameends[i - 1] if i else 0
+        return IndexEntry(offset, offset + self.__headsize[i], self.__datasize[i], self.__unpsize[i],
+                          None if filecrc < 0 else filecrc, self.__flags[i], self.__filetime[i],
+                          self.__method[i], self.__winsize[i], self.__host[i], self.__fileattr[i],
+                          self.__names[start:self.__nameends[i]].decode("utf-8", "surrogatepass"))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def IsVolume(self):
+        return self.__isvolume
@@ -0,0 +1,128 @@
+import hashlib
+import zlib
+from structs import LHD_SPLIT_AFTER
+
+CRC_CHUNK = 0x400000
+BLAKE2SP_LEAVES = 8
+BLAKE2S_BLOCK = 64
+BLAKE2SP_ROUND = BLAKE2SP_LEAVES * BLAKE2S_BLOCK
+
+
+class CRCError(ValueError):
+    pass
+
+
+class CRC32:
+    def __init__(self):
+        self.__value = 0
+        self.__size = 0
+
+    def Update(self, data):
+        # zlib drops the GIL on large buffers, so feed it whole chunks
+        view = memoryview(data).cast("B")
+        for pos in range(0, len(view), CRC_CHUNK):
+            self.__value = zlib.crc32(view[pos:pos + CRC_CHUNK], self.__value)
+        self.__size += len(view)
+
+    @property
+    def Value(self):
+        return self.__value
+
+    @property
+    def Size(self):
+        return self.__size
+
+
+class Blake2sp:
+    # BLAKE2sp, the RAR5 file hash: eight BLAKE2s leaves taking the 64 byte
+    # blocks of the data in turn, and a root hashing their digests
+    def __init__(self):
+        self.__leaves = [hashlib.blake2s(fanout=BLAKE2SP_LEAVES, depth=2, node_offset=i, inner_size=32,
+                                         last_node=i == BLAKE2SP_LEAVES - 1)
+                         for i in range(BLAKE2SP_LEAVES)]
+        self.__pending = b""
+        self.__size = 0
+
+    def Update(self, data):
+        # whole rounds of eight blocks go out, the rest waits for more data
+        view = memoryview(data).cast("B")
+        self.__size += len(view)
+        if self.__pending:
+            need = BLAKE2SP_ROUND - len(self.__pending)
+            self.__pending += view[:need]
+            view = view[need:]
+            if len(self.__pending) < BLAKE2SP_ROUND:
+                return
+            self.__feed(memoryview(self.__pending))
+        end = len(view) - len(view) % BLAKE2SP_ROUND
+        if end:
+            self.__feed(view[:end])
+        self.__pending = bytes(view[end:])
+
+    def __feed(self, view):
+        # leaf i takes blocks i, i + 8, ... of these whole rounds. As 8 byte
+        # words, word j of each of its blocks is every 64th word from
+        # 8 * i + j, so eight strided copies gather a leaf's input in C
+        words = view.cast("Q")
+        gathered = bytearray(len(view) // BLAKE2SP_LEAVES)
+        out = memoryview(gathered).cast("Q")
+        step = BLAKE2SP_ROUND // 8
+        blockwords = BLAKE2S_BLOCK // 8
+        for i, leaf in enumerate(self.__leaves):
+            for j in range(blockwords):
+                out[j::blockwords] = words[i * blockwords + j::step]
+            leaf.update(gathered)
+
+    @property
+    def Value(self):
+        root = hashlib.blake2s(fanout=BLAKE2SP_LEAVES, depth=2, node_depth=1, inner_size=32, last_node=True)
+        for i, leaf in enumerate(self.__leaves):
+            leaf = leaf.copy()
+            leaf.update(self.__pending[i * BLAKE2S_BLOCK:(i + 1) * BLAKE2S_BLOCK])
+            root.update(leaf.digest())
+        return root.digest()
+
+    @property
+    def Size(self):
+        return self.__size
+
+
+def new_checksum(fh):
+    # a running check for the data of fh: CRC32, or BLAKE2sp for RAR5
+    # members that carry that instead; None when there is nothing to check
+    if fh.FileCRC is not None:
+        return CRC32()
+    if fh.Hash is not None:
+        return Blake2sp()
+    return None
+
+
+def checksum_error(fh, checksum):
+    # what is wrong with the data of fh, None when it matches its header
+    if isinstance(checksum, CRC32):
+        if checksum.Value != fh.FileCRC:
+            return "%s: CRC mismatch (%08x, expected %08x)" % (fh.Filename, checksum.Value, fh.FileCRC)
+    elif checksum is not None and checksum.Value != fh.Hash:
+        return "%s: BLAKE2 mismatch (%s, expected %s)" % (fh.Filename, checksum.Value.hex(), fh.Hash.hex())
+    return None
+
+
+def header_crc(f, offset, headsize):
+    pos = f.tell()
+    f.seek(offset + 2)
+    crc = zlib.crc32(f.read(headsize - 2)) & 0xffff
+    f.seek(pos)
+    return crc
+
+
+def checked_chunks(fh, chunks):
+    checksum = None if fh.IsDirectory else new_checksum(fh)
+    for chunk in chunks:
+        if checksum is not None:
+            checksum.Update(chunk)
+        yield chunk
+    if fh.Flags & LHD_SPLIT_AFTER:
+        raise CRCError("%s: continues in a missing volume" % fh.Filename)
+    error = checksum_error(fh, checksum)
+    if error is not None:
+        raise CRCError(error)
@@ -0,0 +1,281 @@
+import operator
+import re
+import struct
+import zlib
+from itertools import accumulate, repeat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FILTER_DELTA = 0
+FILTER_E8 = 1
+FILTER_E8E9 = 2
+FILTER_ARM = 3
+FILTER_AUDIO = 4
+FILTER_RGB = 5
+FILTER_ITANIUM = 6
+FILTER_NONE = 9
+
+VM_MEMSIZE = 0x40000
+VM_MEMMASK = VM_MEMSIZE - 1
+MAX3_UNPACK_CHANNELS = 1024
+E8_FILE_SIZE = 0x1000000
+
+# RAR 3.x archives carry filters as VM bytecode, unrar only runs the
+# standard programs WinRAR emits and recognises them by length and CRC32
+VM_STANDARD_FILTERS = {
+    (53, 0xad576887): FILTER_E8,
+    (57, 0x3cd7e57e): FILTER_E8E9,
+    (120, 0x3769893f): FILTER_ITANIUM,
+    (29, 0x0e06077d): FILTER_DELTA,
+    (149, 0x1c2c5dc8): FILTER_RGB,
+    (216, 0xbc85e701): FILTER_AUDIO,
+}
+
+# a match swallows the 4 address bytes, so finditer skips them like
+# the reference loop does after each converted call
+E8_PATTERN = re.compile(rb'\xe8....', re.S)
+E8E9_PATTERN = re.compile(rb'[\xe8\xe9]....', re.S)
+ARM_BL = re.compile(rb'\xeb')
+NONZERO = re.compile(rb'[^\x00]')
+ITANIUM_MASKS = bytes((4, 4, 6, 6, 0, 0, 7, 7, 4, 4, 0, 0, 4, 4, 0, 0)[b & 0xf] if b & 0x10 else 0
+                      for b in range(256))
+DWORD = struct.Struct('<I')
+
+
+class UnpackFilter:
+    def __init__(self, filtertype, blockstart, blocklength, channels = 0):
+        self.Type = filtertype
+        self.BlockStart = blockstart
+        self.BlockLength = blocklength
+        self.Channels = channels
+        self.NextWindow = False
+        self.ParentFilter = 0
+        self.InitR = None
+
+
+def vm_filter_type(vmcode):
+    # the first byte is an xor checksum of the rest
+    xorsum = 0
+    for b in vmcode[1:]:
+        xorsum ^= b
+    if xorsum != vmcode[0]:
+        return FILTER_NONE
+    return VM_STANDARD_FILTERS.get((len(vmcode), zlib.crc32(vmcode)), FILTER_NONE)
+
+
+def read_vm_data(br):
+    data = br.Read16()
+    kind = data & 0xc000
+    if kind == 0:
+        br.AddBits(6)
+        return (data >> 10) & 0xf
+    if kind == 0x4000:
+        if data & 0x3c00 == 0:
+            br.AddBits(14)
+            return 0xffffff00 | ((data >> 2) & 0xff)
+        br.AddBits(10)
+        return (data >> 6) & 0xff
+    br.AddBits(2)
+    if kind == 0x8000:
+        data = br.Read16()
+        br.AddBits(16)
+        return data
+    data = br.Read16() << 16
+    br.AddBits(16)
+    data |= br.Read16()
+    br.AddBits(16)
+    return data
+
+
+def add_bytes(a, b):
+    if numpy is not None:
+        return (numpy.frombuffer(a, numpy.uint8) + numpy.frombuffer(b, numpy.uint8)).tobytes()
+    return bytes(map(operator.and_, map(operator.add, a, b), repeat(0xff)))
+
+
+def delta_decode(data):
+    # out[i] = -(data[0] + ... + data[i]) mod 256
+    if numpy is not None:
+        return numpy.negative(numpy.frombuffer(data, numpy.uint8).cumsum(dtype=numpy.uint8)).tobytes()
+    return bytes(map((0xff).__and__, accumulate(map(operator.neg, data))))
+
+
+def e8_filter(data, fileoffset, e8e9 = False, wrap = False):
+    pattern = E8E9_PATTERN if e8e9 else E8_PATTERN
+    for m in pattern.finditer(data):
+        pos = m.start() + 1
+        offset = pos + fileoffset
+        if wrap:
+            offset %= E8_FILE_SIZE
+        addr = DWORD.unpack_from(data, pos)[0]
+        if addr & 0x80000000:
+            if (addr + offset) & 0x80000000 == 0:
+                DWORD.pack_into(data, pos, (addr + E8_FILE_SIZE) & 0xffffffff)
+        elif (addr - E8_FILE_SIZE) & 0x80000000:
+            DWORD.pack_into(data, pos, (addr - offset) & 0xffffffff)
+    return data
+
+
+def arm_filter(data, fileoffset):
+    # BL instructions with the always condition, one per aligned dword
+    for m in ARM_BL.finditer(data[3::4]):
+        pos = m.start() * 4
+        offset = int.from_bytes(data[pos:pos+3], 'little') - (((fileoffset + pos) & 0xffffffff) >> 2)
+        data[pos:pos+3] = (offset & 0xffffff).to_bytes(3, 'little')
+    return data
+
+
+def itanium_filter(data, fileoffset):
+    fileoffset >>= 4
+    # bundle templates select which of the three slots may hold a branch
+    templates = data[0:len(data)-21:16].translate(ITANIUM_MASKS)
+    for m in NONZERO.finditer(templates):
+        pos = m.start() * 16
+        cmdmask = templates[m.start()]
+        bundle = int.from_bytes(data[pos:pos+16], 'little')
+        for slot in range(3):
+            if cmdmask & (1 << slot):
+                start = slot * 41 + 5
+                if (bundle >> (start + 37)) & 0xf == 5:
+                    offset = ((bundle >> (start + 13)) - fileoffset - m.start()) & 0xfffff
+                    bundle = (bundle & ~(0xfffff << (start + 13))) | (offset << (start + 13))
+        data[pos:pos+16] = bundle.to_bytes(16, 'little')
+    return data
+
+
+def delta_filter(data, channels):
+    # each channel is stored as one contiguous run of byte differences
+    size = len(data)
+    out = bytearray(size)
+    src = 0
+    for channel in range(channels):
+        count = len(range(channel, size, channels))
+        out[channel::channels] = delta_decode(data[src:src+count])
+        src += count
+    return out
+
+
+def rgb_filter(data, width, posr):
+    # paeth-like prediction needs each output byte before the next one
+    size = len(data)
+    out = bytearray(size)
+    src = 0
+    for channel in range(3):
+        prev = 0
+        for i in range(channel, size, 3):
+            if i >= width + 3:
+                upper = out[i - width]
+                upperleft = out[i - width - 3]
+                pa = abs(upper - upperleft)
+                pb = abs(prev - upperleft)
+                pc = abs(prev + upper - 2 * upperleft)
+                if pa <= pb and pa <= pc:
+                    predicted = prev
+                elif pb <= pc:
+                    predicted = upper
+                else:
+                    predicted = upperleft
+            else:
+                predicted = prev
+            prev = out[i] = (predicted - data[src]) & 0xff
+            src += 1
+    end = posr + len(range(posr, size - 2, 3)) * 3
+    green = out[posr+1:end+1:3]
+    out[posr:end:3] = add_bytes(out[posr:end:3], green)
+    out[posr+2:end+2:3] = add_bytes(out[posr+2:end+2:3], green)
+    return out
+
+
+def audio_filter(data, channels):
+    size = len(data)
+    out = bytearray(size)
+    src = 0
+    for channel in range(channels):
+        prevbyte = prevdelta = 0
+        d1 = d2 = d3 = 0
+        k1 = k2 = k3 = 0
+        dif = [0] * 7
+        for bytecount, i in enumerate(range(channel, size, channels)):
+            d3 = d2
+            d2 = prevdelta - d1
+            d1 = prevdelta
+            curbyte = data[src]
+            src += 1
+            predicted = (((8 * prevbyte + k1 * d1 + k2 * d2 + k3 * d3) >> 3) - curbyte) & 0xff
+            out[i] = predicted
+            prevdelta = ((predicted - prevbyte + 0x80) & 0xff) - 0x80
+            prevbyte = predicted
+            d = (((curbyte + 0x80) & 0xff) - 0x80) << 3
+            dif[0] += abs(d)
+            dif[1] += abs(d - d1)
+            dif[2] += abs(d + d1)
+            dif[3] += abs(d - d2)
+            dif[4] += abs(d + d2)
+            dif[5] += abs(d - d3)
+            dif[6] += abs(d + d3)
+            if bytecount & 0x1f == 0:
+                mindif = dif[0]
+                numdif = 0
+                dif[0] = 0
+                for j in range(1, 7):
+                    if dif[j] < mindif:
+                        mindif = dif[j]
+                        numdif = j
+                    dif[j] = 0
+                if numdif == 1 and k1 >= -16:
+                    k1 -= 1
+                elif numdif == 2 and k1 < 16:
+                    k1 += 1
+                elif numdif == 3 and k2 >= -16:
+                    k2 -= 1
+                elif numdif == 4 and k2 < 16:
+                    k2 += 1
+                elif numdif == 5 and k3 >= -16:
+                    k3 -= 1
+                elif numdif == 6 and k3 < 16:
+                    k3 += 1
+    return out
+
+
+def apply_filter(flt, data, fileoffset):
+    # RAR 5.0 filters, data is a private copy of the window block
+    if flt.Type in (FILTER_E8, FILTER_E8E9):
+        return e8_filter(data, fileoffset, flt.Type == FILTER_E8E9, True)
+    if flt.Type == FILTER_ARM:
+        return arm_filter(data, fileoffset)
+    if flt.Type == FILTER_DELTA:
+        return delta_filter(data, flt.Channels)
+    return None
+
+
+def execute_filter30(flt, data, fileoffset):
+    # RAR 3.x standard VM programs; like the VM, a filter that rejects its
+    # parameters returns the block unchanged
+    r = flt.InitR
+    datasize = r[4]
+    out = None
+    if flt.Type == FILTER_NONE:
+        return b""
+    if flt.Type in (FILTER_E8, FILTER_E8E9):
+        if 4 <= datasize <= VM_MEMSIZE:
+            out = e8_filter(data[:datasize], fileoffset, flt.Type == FILTER_E8E9)
+    elif flt.Type == FILTER_ITANIUM:
+        if 21 <= datasize <= VM_MEMSIZE:
+            out = itanium_filter(data[:datasize], fileoffset)
+    elif datasize <= VM_MEMSIZE // 2:
+        if flt.Type == FILTER_DELTA:
+            if 0 < r[0] <= MAX3_UNPACK_CHANNELS:
+                out = delta_filter(data[:datasize], r[0])
+        elif flt.Type == FILTER_RGB:
+            width = (r[0] - 3) & 0xffffffff
+            if datasize >= 3 and width <= datasize and r[1] <= 2:
+                out = rgb_filter(data[:datasize], width, r[1])
+        elif flt.Type == FILTER_AUDIO:
+            if 0 < r[0] <= 128:
+                out = audio_filter(data[:datasize], r[0])
+    if out is None:
+        out = data
+    return out[:datasize & VM_MEMMASK]
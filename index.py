@@ -0,0 +1,142 @@
+import os
+import sqlite3
+from structs import RAR_FORMAT, HEADER_TYPE, BaseBlock
+from structs5 import BaseBlock5
+from archive import open_archive, read_signature, read_blocks, FILE_HEADERS
+from catalog import IndexEntry
+
+INDEX_ENV = "MINIRAR_INDEX"
+INDEX_VERSION = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    headcrc INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    path TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    dataoffset INTEGER NOT NULL,
+    datasize INTEGER NOT NULL,
+    unpsize INTEGER NOT NULL,
+    filecrc INTEGER,
+    flags INTEGER NOT NULL,
+    filetime INTEGER NOT NULL,
+    method INTEGER NOT NULL,
+    winsize INTEGER NOT NULL,
+    host INTEGER NOT NULL,
+    attr INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (path, seq)
+);
+CREATE INDEX IF NOT EXISTS members_name ON members (path, name);
+"""
+
+_COLUMNS = "offset, dataoffset, datasize, unpsize, filecrc, flags, filetime, method, winsize, host, attr, name"
+
+
+def index_path():
+    path = os.environ.get(INDEX_ENV)
+    if path:
+        return path
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "minirar", "index.sqlite")
+
+
+def read_headcrc(filename):
+    # the main header sits right after the signature, so this only
+    # touches the first few bytes of the archive
+    with open(filename, "rb") as f:
+        fmt = read_signature(f)
+        if fmt == RAR_FORMAT.RARFMT_NONE:
+            return -1
+        try:
+            bb = BaseBlock5(f) if fmt == RAR_FORMAT.RARFMT50 else BaseBlock(f)
+        except (EOFError, ValueError):
+            return -1
+        return bb.HeadCRC if bb.HeaderType in (HEADER_TYPE.HEAD3_MAIN, HEADER_TYPE.HEAD_MAIN) else -1
+
+
+class ArchiveIndex:
+    def __init__(self, filename = None):
+        self.__filename = index_path() if filename is None else filename
+        if self.__filename != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.__filename)), exist_ok=True)
+        self.__db = sqlite3.connect(self.__filename)
+        if self.__db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            # version 3 kept pickled decoder checkpoints, which are not
+            # loaded from disk any more
+            self.__db.executescript("DROP TABLE IF EXISTS archives; DROP TABLE IF EXISTS members; "
+                                    "DROP TABLE IF EXISTS checkpoints;")
+            self.__db.execute("PRAGMA user_version = %d" % INDEX_VERSION)
+        self.__db.executescript(_SCHEMA)
+
+    def __key(self, archive):
+        st = os.stat(archive)
+        return os.path.abspath(archive), st.st_size, st.st_mtime_ns
+
+    def __fresh(self, path, size, mtime, archive):
+        row = self.__db.execute("SELECT size, mtime, headcrc FROM archives WHERE path = ?", (path,)).fetchone()
+        return row is not None and row == (size, mtime, read_headcrc(archive))
+
+    def __rows(self, path, f, fmt):
+        if fmt == RAR_FORMAT.RARFMT_NONE:
+            return
+        seq = 0
+        for h in read_blocks(f, fmt=fmt):
+            if h.HeaderType not in FILE_HEADERS:
+                continue
+            yield (path, seq, h.Offset, h.DataOffset, h.DataSize, h.UnpSize,
+                   h.FileCRC, int(h.Flags), h.FileTime, h.Method, h.WinSize,
+                   h.HostOS.value, h.FileAttribute, h.Filename)
+            seq += 1
+
+    def __build(self, path, size, mtime, archive):
+        # rows go straight from the headers into the insert, a failed read
+        # rolls the whole archive back
+        with open_archive(archive) as f, self.__db:
+            fmt = read_signature(f)
+            self.__db.execute("DELETE FROM members WHERE path = ?", (path,))
+            self.__db.execute("INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?)",
+                              (path, size, mtime, read_headcrc(archive)))
+            self.__db.executemany("INSERT INTO members VALUES (%s)" % ", ".join("?" * 14),
+                                  self.__rows(path, f, fmt))
+
+    def Update(self, archive):
+        path, size, mtime = self.__key(archive)
+        if not self.__fresh(path, size, mtime, archive):
+            self.__build(path, size, mtime, archive)
+        return path
+
+    def Members(self, archive):
+        path = self.Update(archive)
+        cur = self.__db.execute("SELECT %s FROM members WHERE path = ? ORDER BY seq" % _COLUMNS, (path,))
+        return [IndexEntry(*row) for row in cur]
+
+    def Lookup(self, archive, name):
+        path = self.Update(archive)
+        row = self.__db.execute("SELECT %s FROM members WHERE path = ? AND name = ? ORDER BY seq LIMIT 1" % _COLUMNS,
+                                (path, name)).fetchone()
+        return None if row is None else IndexEntry(*row)
+
+    def Invalidate(self, archive):
+        path = os.path.abspath(archive)
+        with self.__db:
+            self.__db.execute("DELETE FROM members WHERE path = ?", (path,))
+            self.__db.execute("DELETE FROM archives WHERE path = ?", (path,))
+
+    def close(self):
+        self.__db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def Filename(self):
+        return self.__filename
@@ -1,49 +1,239 @@
 import argparse
-from structs import RAR_FORMAT, HEADER_TYPE
-from structs import BaseBlock, MainHeader, FileHeader
-
-
-def read_signature(f):
-    rarsig = bytearray([0x52, 0x61, 0x72, 0x21, 0x1a, 0x07])
-    sig = f.read(7)
-    if sig[0:6]==rarsig:
-        if sig[6]==0:
-            return RAR_FORMAT.RARFMT15
-        elif sig[6]==1:
-            return RAR_FORMAT.RARFMT50
-        elif sig[6]==2:
-            return RAR_FORMAT.RARFMT_FUTURE
-        else:
-            return RAR_FORMAT.RARFMT_NONE
-
-
-def read_file(filename):
-    f = open(filename, "rb")
+import os
+import shutil
+import sys
+import time
+import stats
+from structs import RAR_FORMAT, LHD_SPLIT_AFTER, LHD_SOLID, FormatError
+from archive import open_archive, read_signature, read_header, extract_member, test_member
+from archive import member_chunks
+from archive import FILE_HEADERS
+from batch import run_batch, expand_inputs, archive_destinations, is_pattern, write_report
+from crc import CRCError
+from index import ArchiveIndex
+from parallel import extract_parallel
+from reader import Archive
+from solid import SolidDecoder
+from tabledump import TableDump, DUMP_SUFFIX
+from volume import read_volumes
+
+# what a damaged, encrypted or unsupported archive or member raises
+READ_ERRORS = (CRCError, FormatError, NotImplementedError, EOFError, OSError)
+
+
+def pipe_chunks(chunks):
+    out = sys.stdout.buffer
+    for chunk in chunks:
+        out.write(chunk)
+    out.flush()
+
+
+def pipe_member(filename, name, usemmap=True):
+    # Archive decodes whatever a solid or split member depends on. False
+    # when there is no such member; a bad one raises once its data is out
+    with Archive(filename, usemmap) as archive:
+        try:
+            stream = archive.open(name)
+        except KeyError:
+            return False
+        with stream:
+            shutil.copyfileobj(stream, sys.stdout.buffer)
+    sys.stdout.buffer.flush()
+    return True
+
+
+def read_index(filename, pipe=None):
+    with ArchiveIndex() as index:
+        if pipe is None:
+            for e in index.Members(filename):
+                print("%12d %12d %8s %s" % (e.UnpSize, e.DataSize,
+                                           "-" if e.FileCRC is None else "%08x" % e.FileCRC, e.Filename))
+            return 0
+        entry = index.Lookup(filename, pipe)
+    if entry is None:
+        print("%s: no member named %s" % (filename, pipe), file=sys.stderr)
+        return 1
+    if entry.Flags & (LHD_SPLIT_AFTER | LHD_SOLID):
+        # the index covers this volume only and knows no decoder state
+        pipe_member(filename, pipe)
+        return 0
+    with open_archive(filename) as f:
+        pipe_chunks(member_chunks(read_header(f, entry.Offset, read_signature(f))))
+    return 0
+
+
+def test_file(filename, usemmap=True):
+    failed = 0
+    total = 0
+    start = time.perf_counter()
+    with open_archive(filename, usemmap) as f:
+        fmt = read_signature(f)
+        if fmt == RAR_FORMAT.RARFMT_NONE:
+            print("%s: not a RAR archive" % filename, file=sys.stderr)
+            return 1
+        decoder = SolidDecoder()
+        try:
+            for h in stats.iterate("headers", read_volumes(f, filename, True, fmt, usemmap)):
+                if h.HeaderType not in FILE_HEADERS:
+                    continue
+                try:
+                    total += test_member(h, decoder)
+                    # a member with neither a CRC nor a hash decodes but proves nothing
+                    checked = h.IsDirectory or h.FileCRC is not None or h.Hash is not None
+                    print("%-60s %s" % (h.Filename, "OK" if checked else "not verified, no checksum"))
+                except (CRCError, NotImplementedError) as e:
+                    failed += 1
+                    print("%-60s FAILED: %s" % (h.Filename, e))
+        except READ_ERRORS as e:
+            # bad or encrypted headers, a truncated archive or a missing volume
+            failed += 1
+            print("%s: %s" % (filename, e))
+    elapsed = time.perf_counter() - start
+    print("Tested %d bytes in %.3fs (%.2f MB/s), %d errors" % (
+        total, elapsed, total / elapsed / 1e6 if elapsed > 0 else 0.0, failed))
+    return failed
+
+
+def read_file(filename, listonly=False, usemmap=True, destination=None, pipe=None, jobs=1, useindex=False,
+              writelog=True):
+    if useindex and destination is None and (listonly or pipe is not None):
+        try:
+            return read_index(filename, pipe)
+        except READ_ERRORS as e:
+            print("%s: %s" % (filename, e), file=sys.stderr)
+            return 1
+    if destination is not None and jobs > 1:
+        start = time.perf_counter()
+        try:
+            total = extract_parallel(filename, destination, jobs)
+        except READ_ERRORS as e:
+            print("%s: %s" % (filename, e))
+            return 1
+        elapsed = time.perf_counter() - start
+        print("Extracted %d bytes in %.3fs (%.2f MB/s) with %d jobs" % (
+            total, elapsed, total / elapsed / 1e6 if elapsed > 0 else 0.0, jobs))
+        return 0
+    if pipe is not None:
+        try:
+            if pipe_member(filename, pipe, usemmap):
+                return 0
+            print("%s: no member named %s" % (filename, pipe), file=sys.stderr)
+        except READ_ERRORS as e:
+            print("%s: %s" % (filename, e), file=sys.stderr)
+        return 1
+    f = open_archive(filename, usemmap)
     fmt = read_signature(f)
-    log = open(filename[:-4]+".log","w")
-    if fmt != RAR_FORMAT.RARFMT_NONE:
-        bb = BaseBlock(f)
-        while bb.HeaderType != HEADER_TYPE.HEAD3_ENDARC:
-            if bb.HeaderType == HEADER_TYPE.HEAD3_MAIN:
-                mh = MainHeader(bb, f)
-                print(mh)
-            elif bb.HeaderType == HEADER_TYPE.HEAD3_FILE:
-                fh = FileHeader(bb, f)
-                print(fh)
-                for r in fh.GetTableValues():
-                    log.write(r + "\n")
-            else:
-                pass
-            bb = BaseBlock(f)
+    log = None
+    if not listonly and destination is None and writelog:
+        log = TableDump(os.path.splitext(filename)[0] + DUMP_SUFFIX)
+    total = 0
+    failed = 0
+    decoder = SolidDecoder()
+    start = time.perf_counter()
+    try:
+        if fmt != RAR_FORMAT.RARFMT_NONE:
+            for h in stats.iterate("headers", read_volumes(f, filename, destination is not None, fmt, usemmap)):
+                print(h)
+                if h.HeaderType not in FILE_HEADERS:
+                    continue
+                if destination is not None:
+                    # as in test_file, a bad member is reported and the rest still come out
+                    try:
+                        total += extract_member(h, destination, decoder)
+                        if h.IsSymlink:
+                            print("%-60s skipped, symbolic link" % h.Filename)
+                    except READ_ERRORS as e:
+                        failed += 1
+                        print("%-60s FAILED: %s" % (h.Filename, e))
+                elif log is not None:
+                    tables = h.GetTables()
+                    if tables:
+                        log.Write(h.Filename, tables)
+    except READ_ERRORS as e:
+        failed += 1
+        print("%s: %s" % (filename, e))
     f.close()
-    log.close()
+    if log is not None:
+        log.close()
+    if destination is not None:
+        elapsed = time.perf_counter() - start
+        print("Extracted %d bytes in %.3fs (%.2f MB/s), %d errors" % (
+            total, elapsed, total / elapsed / 1e6 if elapsed > 0 else 0.0, failed))
+    return 1 if failed else 0
+
+def batch_files(args):
+    mode = "test" if args.test else "extract" if args.extract else "list" if args.list else "read"
+    failed = 0
+    results = []
+    start = time.perf_counter()
+    archives = list(expand_inputs(args.filename, args.recursive))
+    destinations = None
+    if args.extract is not None:
+        destinations, renamed = archive_destinations(archives, args.extract)
+        for filename, path in renamed:
+            print("%s: another archive extracts to the same directory, using %s" % (filename, path),
+                  file=sys.stderr)
+    for r in run_batch([filename for filename, _ in archives], mode, destinations,
+                       not args.no_log, not args.no_mmap, args.jobs):
+        print("%-60s %s" % (r["archive"], "FAILED: %s" % r["error"] if r["errors"] else "OK"))
+        failed += r["errors"] > 0
+        results.append(r)
+    elapsed = time.perf_counter() - start
+    print("%d archives, %d members, %d bytes in %.3fs, %d failed" % (
+        len(results), sum(r["members"] for r in results), sum(r["bytes"] for r in results), elapsed, failed))
+    if args.report:
+        write_report(results, args.report)
+    return 1 if failed else 0
+
 
 def main():
     parser = argparse.ArgumentParser(description='Unrar file')
     parser.add_argument('filename', nargs='+')
+    parser.add_argument('-l', '--list', action='store_true',
+                        help='list headers only, skipping packed data')
+    parser.add_argument('--no-mmap', action='store_true',
+                        help='read the archive with plain file reads')
+    parser.add_argument('-x', '--extract', metavar='DIR',
+                        help='extract members into DIR')
+    parser.add_argument('-p', '--pipe', metavar='NAME',
+                        help='stream member NAME to standard output')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help='extract independent members with N processes, '
+                             'or with several archives, work through them with N processes')
+    parser.add_argument('-t', '--test', action='store_true',
+                        help='decode every member and verify header and data CRCs')
+    parser.add_argument('--index', action='store_true',
+                        help='list and look up members through the cached header index')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='take archives from subdirectories of directory and ** inputs too')
+    parser.add_argument('--report', metavar='FILE',
+                        help='write a row per archive to FILE, JSON for a .json name and tab separated otherwise')
+    parser.add_argument('--no-log', action='store_true',
+                        help='do not write the decode table dump (.tbl) next to each archive')
+    parser.add_argument('--stats', action='store_true',
+                        help='report symbol, table and phase counters on standard error')
+    parser.add_argument('--profile', choices=('cprofile', 'tracemalloc'),
+                        help='run under cProfile or tracemalloc and report the top entries on standard error')
     args = parser.parse_args()
     filename = args.filename[0]
-    read_file(filename)
+    batch = (len(args.filename) > 1 or args.report is not None or
+             any(os.path.isdir(n) or is_pattern(n) for n in args.filename))
+    if batch and (args.pipe is not None or args.index):
+        parser.error("-p and --index take a single archive")
+    if args.stats:
+        stats.enable()
+
+    def run():
+        if batch:
+            return batch_files(args)
+        if args.test:
+            return 1 if test_file(filename, not args.no_mmap) else 0
+        return read_file(filename, args.list, not args.no_mmap, args.extract, args.pipe, args.jobs, args.index,
+                         not args.no_log)
+    status = stats.profile(run, args.profile)
+    if stats.STATS is not None:
+        stats.STATS.Report()
+    sys.exit(status)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+from archive import open_archive, read_signature, read_blocks, FILE_HEADERS
+from catalog import Catalog
+from index import ArchiveIndex
+from synth import write_archive, header_members
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def run(count, fmt, workdir):
+    path = os.path.join(workdir, "bench%d.rar" % fmt)
+    write_archive(path, header_members(count), fmt)
+    print("RAR %d.x, %d members, %d bytes" % (3 if fmt == 3 else 5, count, os.path.getsize(path)))
+
+    def headers():
+        with open_archive(path) as f:
+            return [h for h in read_blocks(f, fmt=read_signature(f)) if h.HeaderType in FILE_HEADERS]
+
+    def catalog():
+        with open_archive(path) as f:
+            return Catalog(f, read_signature(f))
+
+    def index():
+        # sqlite allocates outside the Python heap, this is the rows in flight
+        with ArchiveIndex(os.path.join(workdir, "index%d.sqlite" % fmt)) as idx:
+            return idx.Update(path)
+
+    for label, build in (("FileHeader list", headers), ("Catalog", catalog), ("ArchiveIndex build", index)):
+        result, current, peak = measure(build)
+        print("  %-20s %8.1f bytes/entry held, %8.1f peak" % (label, current / count, peak / count))
+        del result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per catalog entry")
+    parser.add_argument("-n", "--count", type=int, default=100000,
+                        help="members in the synthetic archive")
+    parser.add_argument("--format", type=int, choices=(3, 5), action="append",
+                        help="archive format to measure, both by default")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        for fmt in args.format or (3, 5):
+            run(args.count, fmt, workdir)
+
+if __name__ == '__main__':
+    main()
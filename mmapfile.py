@@ -0,0 +1,65 @@
+import mmap
+import os
+
+
+class MappedFile:
+    def __init__(self, filename = None):
+        self.__file = None
+        self.__map = None
+        self.__view = memoryview(b"")
+        self.__pos = 0
+        if filename is not None:
+            self.__open(filename)
+
+    def __open(self, filename):
+        self.__file = open(filename, "rb")
+        if os.fstat(self.__file.fileno()).st_size > 0:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__view = memoryview(self.__map)
+
+    def read(self, size = -1):
+        start = self.__pos
+        end = len(self.__view)
+        if size is not None and size >= 0:
+            end = min(start + size, end)
+        self.__pos = max(start, end)
+        return self.__view[start:end]
+
+    def seek(self, offset, whence = os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.__pos
+        elif whence == os.SEEK_END:
+            offset += len(self.__view)
+        if offset < 0:
+            raise ValueError("negative seek position %d" % offset)
+        self.__pos = offset
+        return self.__pos
+
+    def tell(self):
+        return self.__pos
+
+    def close(self):
+        self.__view.release()
+        if self.__map is not None:
+            try:
+                self.__map.close()
+            except BufferError:
+                pass # decoders still hold views, the map goes with them
+            self.__map = None
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def Buffer(self):
+        return self.__view
+
+    @property
+    def Size(self):
+        return len(self.__view)
@@ -0,0 +1,58 @@
+from structs import LHD_SOLID
+from archive import open_archive, read_signature, read_header, extract_member
+from archive import FILE_HEADERS
+from catalog import Catalog
+from solid import extract_solid
+from volume import read_volumes
+
+_archives = {}
+
+
+def worker_archive(filename):
+    f = _archives.get(filename)
+    if f is None:
+        f = _archives[filename] = open_archive(filename)
+    return f
+
+
+def solid_chains(headers):
+    # header offsets, grouped into runs a solid stream has to decode in order
+    chains = []
+    for fh in headers:
+        if chains and fh.Flags & LHD_SOLID:
+            chains[-1].append(fh.Offset)
+        else:
+            chains.append([fh.Offset])
+    return chains
+
+
+def extract_chain(filename, offsets, destination, fmt):
+    f = worker_archive(filename)
+    if len(offsets) > 1:
+        # read_header leaves the file past each member, so pin the
+        # headers first and let the pipeline decode from the offsets
+        return extract_solid([read_header(f, offset, fmt) for offset in offsets], destination)
+    return extract_member(read_header(f, offsets[0], fmt), destination)
+
+
+def extract_parallel(filename, destination, jobs):
+    with open_archive(filename) as f:
+        fmt = read_signature(f)
+        start = f.tell()
+        catalog = Catalog(f, fmt, True)
+        if catalog.IsVolume:
+            # members may run on into the next volume, so the set goes
+            # through one pipeline in order
+            f.seek(start)
+            return extract_solid((h for h in read_volumes(f, filename, True, fmt)
+                                  if h.HeaderType in FILE_HEADERS), destination)
+    tasks = solid_chains(catalog)
+    if not tasks:
+        return 0
+    # concurrent.futures brings in multiprocessing, tens of ms at start-up
+    # that runs without -j never need
+    from concurrent.futures import ProcessPoolExecutor
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(jobs) as pool:
+        return sum(pool.map(extract_chain, [filename] * len(tasks), tasks,
+                            [destination] * len(tasks), [fmt] * len(tasks), chunksize=chunksize))
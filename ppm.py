@@ -0,0 +1,786 @@
+import struct
+from bisect import bisect_right
+from itertools import accumulate, compress
+
+MAX_O = 64
+INT_BITS = 7
+PERIOD_BITS = 7
+TOT_BITS = INT_BITS + PERIOD_BITS
+INTERVAL = 1 << INT_BITS
+BIN_SCALE = 1 << TOT_BITS
+MAX_FREQ = 124
+TOP = 1 << 24
+BOT = 1 << 15
+
+# the model lives in one bytearray of 12 byte units, the layout PPMd
+# var.H was designed for. Offsets into it are the pointers, 0 is NULL.
+# context: NumStats u16, SummFreq u16 (or OneState), Stats u32, Suffix u32
+# state:   Symbol u8, Freq u8, Successor u32
+# free block while gluing: Stamp u16, NU u16, next u32, prev u32
+UNIT_SIZE = 12
+STATE_SIZE = 6
+N1 = 4
+N2 = 4
+N3 = 4
+N4 = (128 + 3 - 1 * N1 - 2 * N2 - 3 * N3) // 4
+N_INDEXES = N1 + N2 + N3 + N4
+
+INDX2UNITS = tuple(list(range(1, 5)) + list(range(6, 13, 2)) + list(range(15, 25, 3)) + list(range(28, 129, 4)))
+UNITS2INDX = tuple(next(i for i, nu in enumerate(INDX2UNITS) if nu >= k + 1) for k in range(128))
+NS2BSINDX = bytes([0, 2] + [4] * 9 + [6] * (256 - 11))
+HB2FLAG = bytes([0] * 0x40 + [8] * (0x100 - 0x40))
+INIT_BIN_ESC = (0x3cdd, 0x1f3f, 0x59bf, 0x48f3, 0x64a1, 0x5abc, 0x6632, 0x6051)
+EXP_ESCAPE = (25, 14, 9, 7, 5, 5, 4, 4, 4, 3, 3, 3, 2, 2, 2, 2)
+DUMMY_SEE2 = 25 * 16
+ONES = b"\1" * 256
+
+# initial model after every restart
+INIT_STATS = b"".join(bytes((i, 1, 0, 0, 0, 0)) for i in range(256))
+INIT_BINSUMM = [BIN_SCALE - INIT_BIN_ESC[k & 7] // (i + 2) for i in range(128) for k in range(64)]
+INIT_SEE2SUMM = [(5 * (i // 16) + 10) << (PERIOD_BITS - 4) for i in range(DUMMY_SEE2)] + [0]
+
+
+def make_ns2indx():
+    ns2indx = bytearray(range(3)) + bytearray(256 - 3)
+    m = 3
+    k = step = 1
+    for i in range(3, 256):
+        ns2indx[i] = m
+        k -= 1
+        if k == 0:
+            step += 1
+            k = step
+            m += 1
+    return bytes(ns2indx)
+
+
+NS2INDX = make_ns2indx()
+
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<I')
+
+
+class SubAllocator:
+    def __init__(self):
+        self.Heap = None
+        self.HeapStart = UNIT_SIZE  # the unit below it is the glue list head
+        self.HeapEnd = 0
+        self.Text = 0
+        self.UnitsStart = 0
+        self.FakeUnitsStart = 0
+        self.__size = 0
+        self.__lounit = 0
+        self.__hiunit = 0
+        self.__gluecount = 0
+        self.__freelist = [0] * N_INDEXES
+
+    def StartSubAllocator(self, sasize):
+        size = sasize << 20
+        if self.__size == size:
+            return True
+        self.StopSubAllocator()
+        allocsize = size // UNIT_SIZE * UNIT_SIZE + 2 * UNIT_SIZE
+        self.Heap = bytearray(self.HeapStart + allocsize)
+        self.HeapEnd = self.HeapStart + allocsize - UNIT_SIZE
+        self.__size = size
+        return True
+
+    def StopSubAllocator(self):
+        self.__size = 0
+        self.Heap = None
+
+    def InitSubAllocator(self):
+        self.__freelist = [0] * N_INDEXES
+        self.Text = self.HeapStart
+        size2 = UNIT_SIZE * (self.__size // 8 // UNIT_SIZE * 7)
+        size1 = self.__size - size2
+        self.__lounit = self.UnitsStart = self.HeapStart + size1 // UNIT_SIZE * UNIT_SIZE + UNIT_SIZE
+        self.FakeUnitsStart = self.HeapStart + size1
+        self.__hiunit = self.__lounit + size2
+        self.__gluecount = 0
+
+    def __insertnode(self, p, indx):
+        U32.pack_into(self.Heap, p, self.__freelist[indx])
+        self.__freelist[indx] = p
+
+    def __removenode(self, indx):
+        p = self.__freelist[indx]
+        self.__freelist[indx] = U32.unpack_from(self.Heap, p)[0]
+        return p
+
+    def __splitblock(self, p, oldindx, newindx):
+        udiff = INDX2UNITS[oldindx] - INDX2UNITS[newindx]
+        p += INDX2UNITS[newindx] * UNIT_SIZE
+        i = UNITS2INDX[udiff - 1]
+        if INDX2UNITS[i] != udiff:
+            i -= 1
+            self.__insertnode(p, i)
+            p += INDX2UNITS[i] * UNIT_SIZE
+            udiff -= INDX2UNITS[i]
+        self.__insertnode(p, UNITS2INDX[udiff - 1])
+
+    def __gluefreeblocks(self):
+        heap = self.Heap
+        s0 = 0
+        if self.__lounit != self.__hiunit:
+            heap[self.__lounit] = 0
+        U32.pack_into(heap, s0 + 4, s0)
+        U32.pack_into(heap, s0 + 8, s0)
+        for i in range(N_INDEXES):
+            while self.__freelist[i]:
+                p = self.__removenode(i)
+                nxt = U32.unpack_from(heap, s0 + 4)[0]
+                U32.pack_into(heap, p + 4, nxt)
+                U32.pack_into(heap, p + 8, s0)
+                U32.pack_into(heap, nxt + 8, p)
+                U32.pack_into(heap, s0 + 4, p)
+                U16.pack_into(heap, p, 0xffff)
+                U16.pack_into(heap, p + 2, INDX2UNITS[i])
+        p = U32.unpack_from(heap, s0 + 4)[0]
+        while p != s0:
+            while True:
+                nu = U16.unpack_from(heap, p + 2)[0]
+                p1 = p + nu * UNIT_SIZE
+                nu1 = U16.unpack_from(heap, p1 + 2)[0]
+                if U16.unpack_from(heap, p1)[0] != 0xffff or nu + nu1 >= 0x10000:
+                    break
+                self.__unlink(p1)
+                U16.pack_into(heap, p + 2, nu + nu1)
+            p = U32.unpack_from(heap, p + 4)[0]
+        while True:
+            p = U32.unpack_from(heap, s0 + 4)[0]
+            if p == s0:
+                break
+            self.__unlink(p)
+            sz = U16.unpack_from(heap, p + 2)[0]
+            while sz > 128:
+                self.__insertnode(p, N_INDEXES - 1)
+                sz -= 128
+                p += 128 * UNIT_SIZE
+            i = UNITS2INDX[sz - 1]
+            if INDX2UNITS[i] != sz:
+                i -= 1
+                k = sz - INDX2UNITS[i]
+                self.__insertnode(p + (sz - k) * UNIT_SIZE, k - 1)
+            self.__insertnode(p, i)
+
+    def __unlink(self, p):
+        heap = self.Heap
+        nxt = U32.unpack_from(heap, p + 4)[0]
+        prev = U32.unpack_from(heap, p + 8)[0]
+        U32.pack_into(heap, prev + 4, nxt)
+        U32.pack_into(heap, nxt + 8, prev)
+
+    def __allocunitsrare(self, indx):
+        if not self.__gluecount:
+            self.__gluecount = 255
+            self.__gluefreeblocks()
+            if self.__freelist[indx]:
+                return self.__removenode(indx)
+        i = indx
+        while True:
+            i += 1
+            if i == N_INDEXES:
+                self.__gluecount -= 1
+                size = INDX2UNITS[indx] * UNIT_SIZE
+                if self.FakeUnitsStart - self.Text > size:
+                    self.FakeUnitsStart -= size
+                    self.UnitsStart -= size
+                    return self.UnitsStart
+                return 0
+            if self.__freelist[i]:
+                break
+        p = self.__removenode(i)
+        self.__splitblock(p, i, indx)
+        return p
+
+    def AllocUnits(self, nu):
+        indx = UNITS2INDX[nu - 1]
+        if self.__freelist[indx]:
+            return self.__removenode(indx)
+        p = self.__lounit
+        lounit = p + INDX2UNITS[indx] * UNIT_SIZE
+        if lounit <= self.__hiunit:
+            self.__lounit = lounit
+            return p
+        return self.__allocunitsrare(indx)
+
+    def AllocContext(self):
+        if self.__hiunit != self.__lounit:
+            self.__hiunit -= UNIT_SIZE
+            return self.__hiunit
+        if self.__freelist[0]:
+            return self.__removenode(0)
+        return self.__allocunitsrare(0)
+
+    def ExpandUnits(self, oldptr, oldnu):
+        i0 = UNITS2INDX[oldnu - 1]
+        if i0 == UNITS2INDX[oldnu]:
+            return oldptr
+        ptr = self.AllocUnits(oldnu + 1)
+        if ptr:
+            size = oldnu * UNIT_SIZE
+            self.Heap[ptr:ptr+size] = self.Heap[oldptr:oldptr+size]
+            self.__insertnode(oldptr, i0)
+        return ptr
+
+    def ShrinkUnits(self, oldptr, oldnu, newnu):
+        i0 = UNITS2INDX[oldnu - 1]
+        i1 = UNITS2INDX[newnu - 1]
+        if i0 == i1:
+            return oldptr
+        if self.__freelist[i1]:
+            ptr = self.__removenode(i1)
+            size = newnu * UNIT_SIZE
+            self.Heap[ptr:ptr+size] = self.Heap[oldptr:oldptr+size]
+            self.__insertnode(oldptr, i0)
+            return ptr
+        self.__splitblock(oldptr, i0, i1)
+        return oldptr
+
+    def FreeUnits(self, ptr, oldnu):
+        self.__insertnode(ptr, UNITS2INDX[oldnu - 1])
+
+    @property
+    def AllocatedMemory(self):
+        return self.__size
+
+
+class ModelPPM:
+    def __init__(self):
+        self.__suballoc = SubAllocator()
+        self.__heap = None
+        self.__mincontext = 0
+        self.__maxcontext = 0
+        self.__foundstate = 0
+        self.__nummasked = 0
+        self.__initesc = 0
+        self.__orderfall = 0
+        self.__maxorder = 0
+        self.__runlength = 0
+        self.__initrl = 0
+        self.__charmask = bytearray(256)
+        self.__esccount = 0
+        self.__prevsuccess = 0
+        self.__hibitsflag = 0
+        self.__binsumm = [0] * (128 * 64)
+        # SEE2 contexts, 25 x 16 plus the dummy one for 256 symbol contexts
+        self.__see2summ = [0] * (DUMMY_SEE2 + 1)
+        self.__see2shift = [0] * (DUMMY_SEE2 + 1)
+        self.__see2count = [0] * (DUMMY_SEE2 + 1)
+        self.__low = 0
+        self.__code = 0
+        self.__range = 0
+        self.__lowcount = 0
+        self.__highcount = 0
+        self.__scale = 0
+        self.__getchar = None
+        self.EscChar = 2
+
+    def __restartmodelrare(self):
+        sa = self.__suballoc
+        self.__charmask[:] = bytes(256)
+        sa.InitSubAllocator()
+        heap = self.__heap = sa.Heap
+        self.__initrl = -min(self.__maxorder, 12) - 1
+        ctx = self.__mincontext = self.__maxcontext = sa.AllocContext()
+        U32.pack_into(heap, ctx + 8, 0)
+        self.__orderfall = self.__maxorder
+        U16.pack_into(heap, ctx, 256)
+        U16.pack_into(heap, ctx + 2, 257)
+        stats = self.__foundstate = sa.AllocUnits(256 // 2)
+        U32.pack_into(heap, ctx + 4, stats)
+        heap[stats:stats + 256 * STATE_SIZE] = INIT_STATS
+        self.__runlength = self.__initrl
+        self.__prevsuccess = 0
+        self.__binsumm[:] = INIT_BINSUMM
+        dummyshift = self.__see2shift[DUMMY_SEE2]
+        self.__see2summ[:] = INIT_SEE2SUMM
+        self.__see2shift[:] = [PERIOD_BITS - 4] * DUMMY_SEE2 + [dummyshift]
+        self.__see2count[:] = [4] * DUMMY_SEE2 + [0]
+
+    def __startmodelrare(self, maxorder):
+        self.__esccount = 1
+        self.__maxorder = maxorder
+        self.__restartmodelrare()
+        self.__see2shift[DUMMY_SEE2] = PERIOD_BITS
+
+    def __swapstates(self, a, b):
+        heap = self.__heap
+        heap[a:a+STATE_SIZE], heap[b:b+STATE_SIZE] = heap[b:b+STATE_SIZE], heap[a:a+STATE_SIZE]
+
+    def __rescale(self, ctx):
+        heap = self.__heap
+        oldns = numstats = U16.unpack_from(heap, ctx)[0]
+        stats = U32.unpack_from(heap, ctx + 4)[0]
+        # move the found state to the front
+        p = self.__foundstate
+        while p != stats:
+            self.__swapstates(p, p - STATE_SIZE)
+            p -= STATE_SIZE
+        heap[stats + 1] = (heap[stats + 1] + 4) & 0xff
+        summfreq = U16.unpack_from(heap, ctx + 2)[0] + 4
+        escfreq = summfreq - heap[p + 1]
+        adder = 1 if self.__orderfall != 0 else 0
+        heap[p + 1] = (heap[p + 1] + adder) >> 1
+        summfreq = heap[p + 1]
+        for _ in range(numstats - 1):
+            p += STATE_SIZE
+            escfreq -= heap[p + 1]
+            heap[p + 1] = (heap[p + 1] + adder) >> 1
+            summfreq += heap[p + 1]
+            if heap[p + 1] > heap[p - STATE_SIZE + 1]:
+                tmp = heap[p:p+STATE_SIZE]
+                p1 = p
+                while True:
+                    heap[p1:p1+STATE_SIZE] = heap[p1-STATE_SIZE:p1]
+                    p1 -= STATE_SIZE
+                    if p1 == stats or tmp[1] <= heap[p1 - STATE_SIZE + 1]:
+                        break
+                heap[p1:p1+STATE_SIZE] = tmp
+        if heap[p + 1] == 0:
+            i = 0
+            while True:
+                i += 1
+                p -= STATE_SIZE
+                if heap[p + 1] != 0:
+                    break
+            escfreq += i
+            numstats -= i
+            U16.pack_into(heap, ctx, numstats)
+            if numstats == 1:
+                tmp = bytearray(heap[stats:stats+STATE_SIZE])
+                while True:
+                    tmp[1] -= tmp[1] >> 1
+                    escfreq >>= 1
+                    if escfreq <= 1:
+                        break
+                self.__suballoc.FreeUnits(stats, (oldns + 1) >> 1)
+                self.__foundstate = ctx + 2
+                heap[ctx+2:ctx+2+STATE_SIZE] = tmp
+                return
+        escfreq -= escfreq >> 1
+        U16.pack_into(heap, ctx + 2, (summfreq + escfreq) & 0xffff)
+        n0 = (oldns + 1) >> 1
+        n1 = (numstats + 1) >> 1
+        if n0 != n1:
+            stats = self.__suballoc.ShrinkUnits(stats, n0, n1)
+            U32.pack_into(heap, ctx + 4, stats)
+        self.__foundstate = stats
+
+    def __findstate(self, ctx, symbol):
+        heap = self.__heap
+        numstats = U16.unpack_from(heap, ctx)[0]
+        if numstats == 1:
+            return ctx + 2
+        stats = U32.unpack_from(heap, ctx + 4)[0]
+        return stats + STATE_SIZE * heap[stats:stats + STATE_SIZE * numstats:STATE_SIZE].index(symbol)
+
+    def __createsuccessors(self, skip, p1):
+        heap = self.__heap
+        pc = self.__mincontext
+        fs = self.__foundstate
+        symbol = heap[fs]
+        upbranch = U32.unpack_from(heap, fs + 2)[0]
+        ps = []
+        if not skip:
+            ps.append(fs)
+        if skip or U32.unpack_from(heap, pc + 8)[0]:
+            first = True
+            while True:
+                pc = U32.unpack_from(heap, pc + 8)[0]
+                if first and p1:
+                    p = p1
+                else:
+                    p = self.__findstate(pc, symbol)
+                first = False
+                successor = U32.unpack_from(heap, p + 2)[0]
+                if successor != upbranch:
+                    pc = successor
+                    break
+                if len(ps) >= MAX_O:
+                    return 0
+                ps.append(p)
+                if not U32.unpack_from(heap, pc + 8)[0]:
+                    break
+        if not ps:
+            return pc
+        upsymbol = heap[upbranch]
+        upsuccessor = upbranch + 1
+        if U16.unpack_from(heap, pc)[0] != 1:
+            if pc <= self.__suballoc.Text:
+                return 0
+            p = self.__findstate(pc, upsymbol)
+            cf = heap[p + 1] - 1
+            s0 = U16.unpack_from(heap, pc + 2)[0] - U16.unpack_from(heap, pc)[0] - cf
+            if 2 * cf <= s0:
+                upfreq = 1 + (5 * cf > s0)
+            else:
+                upfreq = 1 + (2 * cf + 3 * s0 - 1) // (2 * s0)
+        else:
+            upfreq = heap[pc + 3]
+        upstate = bytes((upsymbol, upfreq)) + U32.pack(upsuccessor)
+        alloccontext = self.__suballoc.AllocContext
+        while ps:
+            child = alloccontext()
+            if not child:
+                return 0
+            U16.pack_into(heap, child, 1)
+            heap[child+2:child+2+STATE_SIZE] = upstate
+            U32.pack_into(heap, child + 8, pc)
+            U32.pack_into(heap, ps.pop() + 2, child)
+            pc = child
+        return pc
+
+    def __updatemodel(self):
+        heap = self.__heap
+        sa = self.__suballoc
+        fs = self.__foundstate
+        fssymbol = heap[fs]
+        fsfreq = heap[fs + 1]
+        fssuccessor = U32.unpack_from(heap, fs + 2)[0]
+        p = 0
+        mincontext = self.__mincontext
+        pc = U32.unpack_from(heap, mincontext + 8)[0]
+        if fsfreq < MAX_FREQ // 4 and pc:
+            if U16.unpack_from(heap, pc)[0] != 1:
+                p = U32.unpack_from(heap, pc + 4)[0]
+                if heap[p] != fssymbol:
+                    p = self.__findstate(pc, fssymbol)
+                    if heap[p + 1] >= heap[p - STATE_SIZE + 1]:
+                        self.__swapstates(p, p - STATE_SIZE)
+                        p -= STATE_SIZE
+                if heap[p + 1] < MAX_FREQ - 9:
+                    heap[p + 1] += 2
+                    U16.pack_into(heap, pc + 2, (U16.unpack_from(heap, pc + 2)[0] + 2) & 0xffff)
+            else:
+                p = pc + 2
+                if heap[p + 1] < 32:
+                    heap[p + 1] += 1
+        if not self.__orderfall:
+            successor = self.__createsuccessors(True, p)
+            self.__mincontext = self.__maxcontext = successor
+            U32.pack_into(heap, fs + 2, successor)
+            if not successor:
+                self.__restartmodel()
+            return
+        heap[sa.Text] = fssymbol
+        sa.Text += 1
+        successor = sa.Text
+        if sa.Text >= sa.FakeUnitsStart:
+            self.__restartmodel()
+            return
+        if fssuccessor:
+            if fssuccessor <= sa.Text:
+                fssuccessor = self.__createsuccessors(False, p)
+                if not fssuccessor:
+                    self.__restartmodel()
+                    return
+            self.__orderfall -= 1
+            if not self.__orderfall:
+                successor = fssuccessor
+                if self.__maxcontext != mincontext:
+                    sa.Text -= 1
+        else:
+            U32.pack_into(heap, fs + 2, successor)
+            fssuccessor = mincontext
+        ns = U16.unpack_from(heap, mincontext)[0]
+        s0 = U16.unpack_from(heap, mincontext + 2)[0] - ns - (fsfreq - 1)
+        pc = self.__maxcontext
+        while pc != mincontext:
+            ns1 = U16.unpack_from(heap, pc)[0]
+            if ns1 != 1:
+                stats = U32.unpack_from(heap, pc + 4)[0]
+                if ns1 & 1 == 0:
+                    stats = sa.ExpandUnits(stats, ns1 >> 1)
+                    if not stats:
+                        self.__restartmodel()
+                        return
+                    U32.pack_into(heap, pc + 4, stats)
+                summfreq = U16.unpack_from(heap, pc + 2)[0]
+                summfreq += (2 * ns1 < ns) + 2 * ((4 * ns1 <= ns) & (summfreq <= 8 * ns1))
+            else:
+                stats = sa.AllocUnits(1)
+                if not stats:
+                    self.__restartmodel()
+                    return
+                heap[stats:stats+STATE_SIZE] = heap[pc+2:pc+2+STATE_SIZE]
+                U32.pack_into(heap, pc + 4, stats)
+                freq = heap[stats + 1]
+                freq = freq + freq if freq < MAX_FREQ // 4 - 1 else MAX_FREQ - 4
+                heap[stats + 1] = freq
+                summfreq = freq + self.__initesc + (ns > 3)
+            cf = 2 * fsfreq * (summfreq + 6)
+            sf = s0 + summfreq
+            if cf < 6 * sf:
+                cf = 1 + (cf > sf) + (cf >= 4 * sf)
+                summfreq += 3
+            else:
+                cf = 4 + (cf >= 9 * sf) + (cf >= 12 * sf) + (cf >= 15 * sf)
+                summfreq += cf
+            U16.pack_into(heap, pc + 2, summfreq & 0xffff)
+            p = stats + ns1 * STATE_SIZE
+            heap[p] = fssymbol
+            heap[p + 1] = cf
+            U32.pack_into(heap, p + 2, successor)
+            U16.pack_into(heap, pc, ns1 + 1)
+            pc = U32.unpack_from(heap, pc + 8)[0]
+        self.__maxcontext = self.__mincontext = fssuccessor
+
+    def __restartmodel(self):
+        self.__restartmodelrare()
+        self.__esccount = 0
+
+    def __decodebinsymbol(self, ctx):
+        heap = self.__heap
+        rs = ctx + 2
+        self.__hibitsflag = HB2FLAG[heap[self.__foundstate]]
+        suffix = U32.unpack_from(heap, ctx + 8)[0]
+        index = (heap[rs + 1] - 1) * 64 + self.__prevsuccess + \
+                NS2BSINDX[U16.unpack_from(heap, suffix)[0] - 1] + \
+                self.__hibitsflag + 2 * HB2FLAG[heap[rs]] + ((self.__runlength >> 26) & 0x20)
+        bs = self.__binsumm[index]
+        self.__range >>= TOT_BITS
+        if ((self.__code - self.__low) & 0xffffffff) // self.__range < bs:
+            self.__foundstate = rs
+            if heap[rs + 1] < 128:
+                heap[rs + 1] += 1
+            self.__lowcount = 0
+            self.__highcount = bs
+            self.__binsumm[index] = (bs + INTERVAL - ((bs + 32) >> PERIOD_BITS)) & 0xffff
+            self.__prevsuccess = 1
+            self.__runlength += 1
+        else:
+            self.__lowcount = bs
+            bs = self.__binsumm[index] = (bs - ((bs + 32) >> PERIOD_BITS)) & 0xffff
+            self.__highcount = BIN_SCALE
+            self.__initesc = EXP_ESCAPE[bs >> 10]
+            self.__nummasked = 1
+            self.__charmask[heap[rs]] = self.__esccount
+            self.__prevsuccess = 0
+            self.__foundstate = 0
+
+    def __decodesymbol1(self, ctx):
+        heap = self.__heap
+        scale = self.__scale = U16.unpack_from(heap, ctx + 2)[0]
+        p = U32.unpack_from(heap, ctx + 4)[0]
+        self.__range //= scale
+        count = ((self.__code - self.__low) & 0xffffffff) // self.__range
+        if count >= scale:
+            return False
+        hicnt = heap[p + 1]
+        if count < hicnt:
+            self.__highcount = hicnt
+            self.__prevsuccess = 1 if 2 * hicnt > scale else 0
+            self.__runlength += self.__prevsuccess
+            self.__foundstate = p
+            hicnt += 4
+            heap[p + 1] = hicnt & 0xff
+            U16.pack_into(heap, ctx + 2, (scale + 4) & 0xffff)
+            if hicnt > MAX_FREQ:
+                self.__rescale(ctx)
+            self.__lowcount = 0
+            return True
+        if not self.__foundstate:
+            return False
+        self.__prevsuccess = 0
+        numstats = U16.unpack_from(heap, ctx)[0]
+        for _ in range(numstats - 1):
+            p += STATE_SIZE
+            hicnt += heap[p + 1]
+            if hicnt > count:
+                self.__highcount = hicnt
+                self.__lowcount = hicnt - heap[p + 1]
+                self.__update1(ctx, p)
+                return True
+        # escape, every symbol of this context is masked from now on
+        self.__hibitsflag = HB2FLAG[heap[self.__foundstate]]
+        self.__lowcount = hicnt
+        self.__highcount = scale
+        self.__nummasked = numstats
+        self.__foundstate = 0
+        charmask = self.__charmask
+        esccount = self.__esccount
+        stats = U32.unpack_from(heap, ctx + 4)[0]
+        for symbol in heap[stats:stats + STATE_SIZE * numstats:STATE_SIZE]:
+            charmask[symbol] = esccount
+        return True
+
+    def __update1(self, ctx, p):
+        heap = self.__heap
+        self.__foundstate = p
+        heap[p + 1] = (heap[p + 1] + 4) & 0xff
+        U16.pack_into(heap, ctx + 2, (U16.unpack_from(heap, ctx + 2)[0] + 4) & 0xffff)
+        if heap[p + 1] > heap[p - STATE_SIZE + 1]:
+            self.__swapstates(p, p - STATE_SIZE)
+            p -= STATE_SIZE
+            self.__foundstate = p
+            if heap[p + 1] > MAX_FREQ:
+                self.__rescale(ctx)
+
+    def __update2(self, ctx, p):
+        heap = self.__heap
+        self.__foundstate = p
+        heap[p + 1] = (heap[p + 1] + 4) & 0xff
+        U16.pack_into(heap, ctx + 2, (U16.unpack_from(heap, ctx + 2)[0] + 4) & 0xffff)
+        if heap[p + 1] > MAX_FREQ:
+            self.__rescale(ctx)
+        self.__esccount = (self.__esccount + 1) & 0xff
+        self.__runlength = self.__initrl
+
+    def __makeescfreq2(self, ctx, diff):
+        heap = self.__heap
+        numstats = U16.unpack_from(heap, ctx)[0]
+        if numstats == 256:
+            self.__scale = 1
+            return DUMMY_SEE2
+        suffix = U32.unpack_from(heap, ctx + 8)[0]
+        see = NS2INDX[diff - 1] * 16 + (diff < U16.unpack_from(heap, suffix)[0] - numstats) + \
+              2 * (U16.unpack_from(heap, ctx + 2)[0] < 11 * numstats) + \
+              4 * (self.__nummasked > diff) + self.__hibitsflag
+        # SEE2 getMean
+        summ = self.__see2summ[see]
+        mean = summ >> self.__see2shift[see]
+        self.__see2summ[see] = (summ - mean) & 0xffff
+        self.__scale = mean + (mean == 0)
+        return see
+
+    def __decodesymbol2(self, ctx):
+        heap = self.__heap
+        numstats = U16.unpack_from(heap, ctx)[0]
+        i = numstats - self.__nummasked
+        see = self.__makeescfreq2(ctx, i)
+        esccount = self.__esccount
+        stats = U32.unpack_from(heap, ctx + 4)[0]
+        end = stats + STATE_SIZE * numstats
+        symbols = heap[stats:end:STATE_SIZE]
+        # 1 for each state the escapes so far have not masked out
+        unmasked = symbols.translate(self.__charmask).translate(ONES[:esccount] + b"\0" + ONES[esccount+1:])
+        indexes = list(compress(range(numstats), unmasked))[:i]
+        if len(indexes) != i:
+            return False
+        counts = list(accumulate(compress(heap[stats+1:end+1:STATE_SIZE], unmasked)))[:i]
+        hicnt = counts[-1]
+        self.__scale += hicnt
+        scale = self.__scale
+        self.__range //= scale
+        count = ((self.__code - self.__low) & 0xffffffff) // self.__range
+        if count >= scale:
+            return False
+        if count < hicnt:
+            k = bisect_right(counts, count)
+            p = stats + STATE_SIZE * indexes[k]
+            self.__highcount = counts[k]
+            self.__lowcount = counts[k] - heap[p + 1]
+            # SEE2 update
+            if self.__see2shift[see] < PERIOD_BITS:
+                self.__see2count[see] -= 1
+                if self.__see2count[see] == 0:
+                    self.__see2summ[see] = (self.__see2summ[see] * 2) & 0xffff
+                    self.__see2count[see] = 3 << self.__see2shift[see]
+                    self.__see2shift[see] += 1
+            self.__update2(ctx, p)
+        else:
+            self.__lowcount = hicnt
+            self.__highcount = scale
+            charmask = self.__charmask
+            for k in indexes:
+                charmask[symbols[k]] = esccount
+            self.__see2summ[see] = (self.__see2summ[see] + scale) & 0xffff
+            self.__nummasked = numstats
+        return True
+
+    def __clearmask(self):
+        self.__esccount = 1
+        self.__charmask[:] = bytes(256)
+
+    def __decode(self):
+        self.__low = (self.__low + self.__range * self.__lowcount) & 0xffffffff
+        self.__range = (self.__range * (self.__highcount - self.__lowcount)) & 0xffffffff
+
+    def __normalize(self):
+        low = self.__low
+        rng = self.__range
+        code = self.__code
+        while True:
+            if (low ^ ((low + rng) & 0xffffffff)) >= TOP:
+                if rng >= BOT:
+                    break
+                rng = -low & (BOT - 1)
+            code = ((code << 8) | self.__getchar()) & 0xffffffff
+            rng = (rng << 8) & 0xffffffff
+            low = (low << 8) & 0xffffffff
+        self.__low = low
+        self.__range = rng
+        self.__code = code
+
+    def CleanUp(self):
+        # reset after corrupt data so later blocks start from a sane model
+        self.__suballoc.StopSubAllocator()
+        self.__suballoc.StartSubAllocator(1)
+        self.__startmodelrare(2)
+
+    def DecodeInit(self, getchar):
+        self.__getchar = getchar
+        maxorder = getchar()
+        reset = (maxorder & 0x20) != 0
+        if reset:
+            maxmb = getchar()
+        elif self.__suballoc.AllocatedMemory == 0:
+            return False
+        if maxorder & 0x40:
+            self.EscChar = getchar()
+        self.__low = self.__code = 0
+        self.__range = 0xffffffff
+        for _ in range(4):
+            self.__code = (self.__code << 8) | getchar()
+        if reset:
+            maxorder = (maxorder & 0x1f) + 1
+            if maxorder > 16:
+                maxorder = 16 + (maxorder - 16) * 3
+            if maxorder == 1:
+                self.__suballoc.StopSubAllocator()
+                return False
+            self.__suballoc.StartSubAllocator(maxmb + 1)
+            self.__startmodelrare(maxorder)
+        return self.__mincontext != 0
+
+    def DecodeChar(self):
+        sa = self.__suballoc
+        heap = self.__heap
+        ctx = self.__mincontext
+        if ctx <= sa.Text or ctx > sa.HeapEnd:
+            return -1
+        if U16.unpack_from(heap, ctx)[0] != 1:
+            stats = U32.unpack_from(heap, ctx + 4)[0]
+            if stats <= sa.Text or stats > sa.HeapEnd:
+                return -1
+            if not self.__decodesymbol1(ctx):
+                return -1
+        else:
+            self.__decodebinsymbol(ctx)
+        self.__decode()
+        while not self.__foundstate:
+            self.__normalize()
+            while True:
+                self.__orderfall += 1
+                ctx = U32.unpack_from(heap, ctx + 8)[0]
+                if ctx <= sa.Text or ctx > sa.HeapEnd:
+                    return -1
+                if U16.unpack_from(heap, ctx)[0] != self.__nummasked:
+                    break
+            self.__mincontext = ctx
+            if not self.__decodesymbol2(ctx):
+                return -1
+            self.__decode()
+        fs = self.__foundstate
+        symbol = heap[fs]
+        successor = U32.unpack_from(heap, fs + 2)[0]
+        if not self.__orderfall and successor > sa.Text:
+            self.__mincontext = self.__maxcontext = successor
+        else:
+            self.__updatemodel()
+            if self.__esccount == 0:
+                self.__clearmask()
+        self.__normalize()
+        return symbol
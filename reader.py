@@ -0,0 +1,158 @@
+import copy
+import pickle
+import zlib
+from array import array
+from io import BufferedReader
+from structs import RAR_FORMAT, LHD_SOLID, FormatError
+from archive import open_archive, read_signature, read_header, FILE_HEADERS
+from catalog import Catalog
+from crc import checked_chunks
+from stream import MemberStream
+from volume import read_volumes
+
+
+class Archive:
+    # members by name. A member of a non-solid archive is one seek and one
+    # decode away. A solid member needs the members before it in its solid
+    # run decoded first; the decoder is kept after each read, so reading
+    # in order costs nothing extra, and with checkpoint set its state is
+    # saved every that many members of a run for a later read to resume
+    # from. A checkpoint holds a whole window, compressed, and lives only
+    # as long as the Archive: unpickling a state from a cache file would
+    # run whatever that file says. One member is read at a time
+    def __init__(self, filename, usemmap = True, checkpoint = 0):
+        self.__filename = filename
+        self.__usemmap = usemmap
+        self.__checkpoint = checkpoint
+        self.__f = open_archive(filename, usemmap)
+        self.__fmt = read_signature(self.__f)
+        if self.__fmt == RAR_FORMAT.RARFMT_NONE:
+            self.__f.close()
+            raise FormatError("%s: not a RAR archive" % filename)
+        self.__start = self.__f.tell()
+        self.__entries = Catalog(self.__f, self.__fmt)
+        self.__isvolume = self.__entries.IsVolume
+        if self.__isvolume:
+            # the set is read in order, members come out after their last part
+            self.__f.seek(self.__start)
+            self.__entries = Catalog()
+            for h in read_volumes(self.__f, filename, fmt=self.__fmt, usemmap=usemmap):
+                if h.HeaderType in FILE_HEADERS:
+                    self.__entries.Append(h)
+        # member position to state, shared with clones
+        self.__checkpoints = {}
+        self.__live = None
+        self.__names = {}
+        self.__runstart = array("Q")
+        for i, e in enumerate(self.__entries):
+            self.__names.setdefault(e.Filename, i)
+            self.__runstart.append(self.__runstart[-1] if i and e.Flags & LHD_SOLID else i)
+
+    def namelist(self):
+        return [e.Filename for e in self.__entries]
+
+    def infolist(self):
+        return list(self.__entries)
+
+    def getinfo(self, name):
+        return self.__entries[self.__find(name)]
+
+    def read(self, name):
+        return b"".join(self.__chunks(self.__find(name)))
+
+    def chunks(self, name):
+        return self.__chunks(self.__find(name))
+
+    def open(self, name):
+        return BufferedReader(MemberStream(self.__chunks(self.__find(name))))
+
+    def __find(self, name):
+        i = self.__names.get(name)
+        if i is None:
+            raise KeyError("there is no member named %r in %s" % (name, self.__filename))
+        return i
+
+    def __resume(self, first, i):
+        # the decoder after the latest member of the run before i we can
+        # get at: the one kept from the last read, or a checkpoint
+        done, unpacker = first - 1, None
+        if self.__live is not None and first <= self.__live[0] < i:
+            done, unpacker = self.__live
+        saved = [k for k in self.__checkpoints if done < k < i]
+        if saved:
+            done = max(saved)
+            unpacker = pickle.loads(zlib.decompress(self.__checkpoints[done]))
+        return done, unpacker
+
+    def __save(self, k, first, unpacker):
+        if (self.__checkpoint <= 0 or unpacker is None or k == first or
+                (k - first) % self.__checkpoint or k in self.__checkpoints):
+            return
+        self.__checkpoints[k] = zlib.compress(pickle.dumps(unpacker, pickle.HIGHEST_PROTOCOL), 1)
+
+    def __chunks(self, i):
+        if self.__isvolume:
+            yield from self.__volumechunks(i)
+            return
+        first = self.__runstart[i]
+        done, unpacker = self.__resume(first, i)
+        self.__live = None
+        for k in range(done + 1, i + 1):
+            h = read_header(self.__f, self.__entries[k].Offset, self.__fmt)
+            if h.IsDirectory or h.Method == 0x30:
+                chunks = h.Chunks()
+            else:
+                if unpacker is None:
+                    unpacker = h.CreateUnpacker()
+                chunks = h.Chunks(unpacker)
+            if k == i:
+                yield from checked_chunks(h, chunks)
+            else:
+                for _ in chunks:
+                    pass
+            self.__save(k, first, unpacker)
+        self.__live = (i, unpacker)
+
+    def __volumechunks(self, i):
+        # a volume set has no single file to seek in, go through it in order
+        # and decode only the solid run member i is in
+        first = self.__runstart[i]
+        unpacker = None
+        self.__f.seek(self.__start)
+        headers = (h for h in read_volumes(self.__f, self.__filename, fmt=self.__fmt, usemmap=self.__usemmap)
+                   if h.HeaderType in FILE_HEADERS)
+        for k, h in enumerate(headers):
+            if k < first:
+                continue
+            if h.IsDirectory or h.Method == 0x30:
+                chunks = h.Chunks()
+            else:
+                if unpacker is None:
+                    unpacker = h.CreateUnpacker()
+                chunks = h.Chunks(unpacker)
+            if k == i:
+                yield from checked_chunks(h, chunks)
+                return
+            for _ in chunks:
+                pass
+
+    def clone(self):
+        # another handle for reading alongside this one: its own file and
+        # decoder, the catalog and checkpoints shared. Close it on its own
+        other = copy.copy(self)
+        other.__f = open_archive(self.__filename, self.__usemmap)
+        other.__live = None
+        return other
+
+    def close(self):
+        self.__f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def Filename(self):
+        return self.__filename
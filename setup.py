@@ -0,0 +1,7 @@
+from setuptools import setup, Extension
+
+# optional accelerator: python setup.py build_ext --inplace
+setup(
+    name="minirar",
+    ext_modules=[Extension("_accel", ["_accel.c"], optional=True)],
+)
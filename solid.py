@@ -0,0 +1,120 @@
+import os
+import threading
+from queue import Queue
+from structs import LHD_SPLIT_AFTER, LHD_SOLID
+from archive import member_path
+from crc import CRCError, new_checksum, checksum_error
+
+PIPELINE_DEPTH = 8
+
+_DONE = object()
+
+
+class SolidDecoder:
+    def __init__(self):
+        self.__unpacker = None
+
+    def Chunks(self, fh):
+        if not fh.Flags & LHD_SOLID and self.__unpacker is not None:
+            # the run is over, its tables go to the next decoder
+            self.__unpacker.Release()
+            self.__unpacker = None
+        if fh.IsDirectory or fh.Method == 0x30:
+            yield from fh.Chunks()
+            return
+        if self.__unpacker is None:
+            self.__unpacker = fh.CreateUnpacker()
+        yield from fh.Chunks(self.__unpacker)
+
+    def Extract(self, fh, write):
+        total = 0
+        for chunk in self.Chunks(fh):
+            write(chunk)
+            total += len(chunk)
+        return total
+
+
+def _decode(headers, out, stop):
+    decoder = SolidDecoder()
+    try:
+        for fh in headers:
+            out.put(("open", fh))
+            for chunk in decoder.Chunks(fh):
+                if stop.is_set():
+                    return
+                out.put(("data", chunk))
+            out.put(("close", fh))
+    except BaseException as e:
+        out.put(("error", e))
+    finally:
+        out.put(_DONE)
+
+
+def _checksum(inq, out):
+    checksum = None
+    item = inq.get()
+    while item is not _DONE:
+        kind, value = item
+        if kind == "open":
+            checksum = None if value.IsDirectory else new_checksum(value)
+        elif kind == "data":
+            if checksum is not None:
+                checksum.Update(value)
+        elif kind == "close":
+            item = ("close", (value, checksum))
+        out.put(item)
+        item = inq.get()
+    out.put(_DONE)
+
+
+def extract_solid(headers, destination, depth = PIPELINE_DEPTH):
+    decoded = Queue(depth)
+    checked = Queue(depth)
+    stop = threading.Event()
+    threads = [threading.Thread(target=_decode, args=(headers, decoded, stop), daemon=True),
+               threading.Thread(target=_checksum, args=(decoded, checked), daemon=True)]
+    for t in threads:
+        t.start()
+    total = 0
+    bad = []
+    out = None
+    item = checked.get()
+    try:
+        while item is not _DONE:
+            kind, value = item
+            if kind == "open":
+                path = member_path(destination, value)
+                if value.IsSymlink:
+                    # not made, as in extract_member; the data is only checked
+                    pass
+                elif value.IsDirectory:
+                    os.makedirs(path, exist_ok=True)
+                else:
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    out = open(path, "wb")
+            elif kind == "data":
+                if out is not None:
+                    out.write(value)
+                    total += len(value)
+            elif kind == "close":
+                fh, checksum = value
+                if out is not None:
+                    out.close()
+                    out = None
+                if not fh.IsDirectory and (fh.Flags & LHD_SPLIT_AFTER or
+                                           checksum_error(fh, checksum) is not None):
+                    bad.append(fh.Filename)
+            else:
+                raise value
+            item = checked.get()
+    finally:
+        if out is not None:
+            out.close()
+        stop.set()
+        while item is not _DONE:
+            item = checked.get()
+        for t in threads:
+            t.join()
+    if bad:
+        raise CRCError("CRC mismatch in %s" % ", ".join(bad))
+    return total
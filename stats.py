@@ -0,0 +1,173 @@
+import functools
+import os
+import sys
+import time
+
+STATS_ENV = "MINIRAR_STATS"
+
+# None unless enabled: the decoders look here once per Chunks call and
+# only swap in the counting wrappers below when it is set, so the hot
+# loops run untouched otherwise
+STATS = None
+
+
+class Stats:
+    def __init__(self):
+        # MINIRAR_STATS enables this while unpack is still importing
+        cache = getattr(sys.modules.get("unpack"), "TABLE_CACHE", None)
+        self.__cachebase = (0, 0) if cache is None else (cache.Hits, cache.Misses)
+        self.__start = time.perf_counter()
+        self.Members = 0
+        self.BytesWritten = 0
+        self.ExtraBits = 0
+        self.Phases = {}
+        # code lengths of the decoded symbols, per table
+        self.CodeLengths = {}
+
+    def AddTime(self, phase, seconds):
+        self.Phases[phase] = self.Phases.get(phase, 0.0) + seconds
+
+    def Iterate(self, phase, items):
+        # time spent producing each item goes to phase
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.AddTime(phase, time.perf_counter() - start)
+                return
+            self.AddTime(phase, time.perf_counter() - start)
+            yield item
+
+    def Chunks(self, chunks):
+        self.Members += 1
+        for chunk in self.Iterate("decode", chunks):
+            self.BytesWritten += len(chunk)
+            yield chunk
+
+    def Decoder(self, br, tables):
+        # DecodeEntry that first peeks the code length of the next symbol.
+        # Build refills the Table arrays in place, so their ids stay put
+        names = {id(t.Table): name for name, t in tables.items()}
+        for name in names.values():
+            self.CodeLengths.setdefault(name, [0] * 16)
+        lengths = self.CodeLengths
+        decodeentry = br.DecodeEntry
+        read16 = br.Read16
+
+        def decode(table):
+            lengths[names[id(table)]][table[read16() >> 1] & 0xf] += 1
+            return decodeentry(table)
+        return decode
+
+    def GetBits(self, br):
+        getbits = br.GetBits
+
+        def counted(bits):
+            self.ExtraBits += bits
+            return getbits(bits)
+        return counted
+
+    @property
+    def TableBuilds(self):
+        from unpack import TABLE_CACHE
+        return TABLE_CACHE.Hits + TABLE_CACHE.Misses - sum(self.__cachebase)
+
+    @property
+    def TableCacheHits(self):
+        from unpack import TABLE_CACHE
+        return TABLE_CACHE.Hits - self.__cachebase[0]
+
+    @property
+    def Elapsed(self):
+        return time.perf_counter() - self.__start
+
+    def QuickHits(self, name, quickbits):
+        # symbols a quick table of quickbits would resolve in one lookup
+        lengths = self.CodeLengths[name]
+        return sum(lengths[:quickbits + 1])
+
+    def Report(self, out = sys.stderr):
+        from unpack import MAX_QUICK_DECODE_BITS
+        elapsed = self.Elapsed
+        print("stats: %d members, %d bytes written in %.3fs" % (self.Members, self.BytesWritten, elapsed), file=out)
+        # tables are read from within decode, other is CRCs, output and setup
+        phases = dict(self.Phases)
+        phases["other"] = elapsed - phases.get("headers", 0.0) - phases.get("decode", 0.0)
+        for phase in ("headers", "decode", "tables", "other"):
+            seconds = phases.get(phase, 0.0)
+            print("  %-8s %9.3fs %5.1f%%" % (phase, seconds, 100.0 * seconds / elapsed if elapsed > 0 else 0.0), file=out)
+        codebits = 0
+        for name, lengths in sorted(self.CodeLengths.items()):
+            symbols = sum(lengths)
+            if not symbols:
+                continue
+            bits = sum(i * n for i, n in enumerate(lengths))
+            codebits += bits
+            quickbits = MAX_QUICK_DECODE_BITS if name == "LD" else MAX_QUICK_DECODE_BITS - 3
+            print("  %-4s %12d symbols, %5.2f bits each, %5.1f%% within %d quick bits" % (
+                name, symbols, bits / symbols, 100.0 * self.QuickHits(name, quickbits) / symbols, quickbits), file=out)
+        print("  bits read: %d in codes, %d extra" % (codebits, self.ExtraBits), file=out)
+        print("  table builds: %d, %d from the cache" % (self.TableBuilds, self.TableCacheHits), file=out)
+
+
+def enable():
+    global STATS
+    STATS = Stats()
+    return STATS
+
+
+def disable():
+    global STATS
+    stats, STATS = STATS, None
+    return stats
+
+
+def iterate(phase, items):
+    return items if STATS is None else STATS.Iterate(phase, items)
+
+
+def profile(run, mode = None, out = sys.stderr, limit = 25):
+    # run() under cProfile or tracemalloc, the top entries go to out
+    if mode == "cprofile":
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        result = profiler.runcall(run)
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return result
+    if mode == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            result = run()
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        print("tracemalloc: %d bytes held, %d peak" % (current, peak), file=out)
+        for stat in snapshot.statistics("lineno")[:limit]:
+            print("  %s" % stat, file=out)
+        return result
+    return run()
+
+
+def timed(phase):
+    # charges the wrapped call to phase while stats are on
+    def wrap(func):
+        @functools.wraps(func)
+        def timedfunc(*args, **kwargs):
+            if STATS is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STATS.AddTime(phase, time.perf_counter() - start)
+        return timedfunc
+    return wrap
+
+
+if os.environ.get(STATS_ENV, "0") not in ("", "0"):
+    enable()
@@ -0,0 +1,126 @@
+import io
+import os
+import threading
+
+PREFETCH_CHUNK = 0x100000
+
+
+class MemberSource:
+    def __init__(self, f, offset, size):
+        self.__file = f
+        self.__pos = offset
+        self.__end = offset + size
+
+    def __call__(self, size):
+        size = min(size, self.__end - self.__pos)
+        if size <= 0:
+            return b""
+        self.__file.seek(self.__pos)
+        data = self.__file.read(size)
+        self.__pos += len(data)
+        return data
+
+
+class Prefetch(threading.Thread):
+    # reads a file range into the page cache ahead of the decoder, the
+    # data itself is dropped
+    def __init__(self, filename, offset = 0, size = None):
+        super().__init__(daemon=True)
+        self.__filename = filename
+        self.__offset = offset
+        self.__size = size
+        self.__stopped = threading.Event()
+        self.start()
+
+    def run(self):
+        left = self.__size
+        try:
+            with open(self.__filename, "rb", buffering=0) as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), self.__offset, left or 0, os.POSIX_FADV_WILLNEED)
+                f.seek(self.__offset)
+                buf = bytearray(PREFETCH_CHUNK)
+                while not self.__stopped.is_set() and (left is None or left > 0):
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    if left is not None:
+                        left -= n
+        except OSError:
+            pass # opening the volume for real reports the error
+
+    def Stop(self):
+        self.__stopped.set()
+
+
+class VolumeSource:
+    # packed data of a member split over volumes, read part after part.
+    # Parts given by file name are opened only while they are read, and
+    # the next one is prefetched meanwhile
+    def __init__(self, parts, size):
+        self.__parts = list(parts)
+        self.__index = 0
+        self.__source = None
+        self.__opened = None
+        self.__ahead = None
+        self.__left = size
+
+    def __close(self):
+        if self.__opened is not None:
+            self.__opened.close()
+            self.__opened = None
+
+    def __next(self):
+        self.__close()
+        if self.__index >= len(self.__parts):
+            return None
+        f, offset, size = self.__parts[self.__index]
+        self.__index += 1
+        if self.__index < len(self.__parts) and isinstance(self.__parts[self.__index][0], str):
+            if self.__ahead is not None:
+                self.__ahead.Stop()
+            self.__ahead = Prefetch(*self.__parts[self.__index])
+        if isinstance(f, str):
+            f = self.__opened = open(f, "rb")
+        return MemberSource(f, offset, size)
+
+    def __call__(self, size):
+        while self.__left > 0:
+            if self.__source is None:
+                self.__source = self.__next()
+                if self.__source is None:
+                    break
+            data = self.__source(min(size, self.__left))
+            if data:
+                self.__left -= len(data)
+                return data
+            self.__source = None
+        self.__close()
+        if self.__ahead is not None:
+            self.__ahead.Stop()
+        return b""
+
+
+class MemberStream(io.RawIOBase):
+    def __init__(self, chunks):
+        self.__chunks = iter(chunks)
+        self.__pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self.__pending) == 0:
+            chunk = next(self.__chunks, None)
+            if chunk is None:
+                return 0
+            self.__pending = memoryview(chunk).cast("B")
+        n = min(len(b), len(self.__pending))
+        b[:n] = self.__pending[:n]
+        self.__pending = self.__pending[n:]
+        return n
+
+    def close(self):
+        self.__chunks = iter(())
+        self.__pending = memoryview(b"")
+        super().close()
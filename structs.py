@@ -1,8 +1,17 @@
-from binascii import hexlify
+import stat
 from enum import Enum, IntFlag, Flag
 from struct import unpack
 from datetime import datetime, timedelta
-from unpack import Unpack29
+from io import BufferedReader
+from unpack import Unpack29, UNPACK_MAX_WRITE
+from mmapfile import MappedFile
+from stream import MemberSource, VolumeSource, MemberStream
+from tabledump import table_lines
+
+# unpack versions of the RAR 2.9 compression Unpack29 decodes; the 1.5
+# and 2.0 compressions are not implemented
+UNPACK_VERSIONS = (29, 36)
+
 
 class RAR_FORMAT(Enum):
     RARFMT_NONE =   0
@@ -32,6 +41,11 @@ class HEADER_TYPE(Enum):
     HEAD3_ENDARC =      0x7B
 
 
+class BASEBLOCK_FLAGS(IntFlag):
+    SKIP_IF_UNKNOWN =   0x4000
+    LONG_BLOCK =        0x8000
+
+
 class HOST_SYSTEM(Enum):
     MSDOS =     0
     OS2 =       1
@@ -78,8 +92,45 @@ class FILEHEADER_MASKS(IntFlag):
     DIRECTORY =     0x00E0
 
 
+# Making or combining Enum and IntFlag members costs around a microsecond
+# each, so what is looked up or tested on every header goes by plain ints
+# and the enums are built only for display
+HEADER_TYPES = {t.value: t for t in HEADER_TYPE}
+HOST_SYSTEMS = {h.value: h for h in HOST_SYSTEM}
+LONG_BLOCK = BASEBLOCK_FLAGS.LONG_BLOCK.value
+MHD_VOLUME = MAINHEADER_FLAGS.VOLUME.value
+MHD_COMMENT = MAINHEADER_FLAGS.COMMENT.value
+MHD_PASSWORD = MAINHEADER_FLAGS.PASSWORD.value
+MHD_NEWNUMBERING = MAINHEADER_FLAGS.NEWNUMBERING.value
+LHD_SPLIT_BEFORE = FILEHEADER_FLAGS.SPLIT_BEFORE.value
+LHD_SPLIT_AFTER = FILEHEADER_FLAGS.SPLIT_AFTER.value
+LHD_PASSWORD = FILEHEADER_FLAGS.PASSWORD.value
+LHD_COMMENT = FILEHEADER_FLAGS.COMMENT.value
+LHD_SOLID = FILEHEADER_FLAGS.SOLID.value
+LHD_LARGE = FILEHEADER_FLAGS.LARGE.value
+LHD_UNICODE = FILEHEADER_FLAGS.UNICODE.value
+LHD_SALT = FILEHEADER_FLAGS.SALT.value
+LHD_EXTTIME = FILEHEADER_FLAGS.EXTTIME.value
+LHD_WINDOWMASK = FILEHEADER_MASKS.WINDOWMASK.value
+LHD_DIRECTORY = FILEHEADER_MASKS.DIRECTORY.value
+SIZEOF_SHORTBLOCKHEAD = 7
+
+
+class FormatError(ValueError):
+    # a header that cannot be part of a well formed archive
+    pass
+
+
+def host_system(value):
+    host = HOST_SYSTEMS.get(value)
+    return HOST_SYSTEM(value) if host is None else host
+
+
 class BaseBlock:
+    __slots__ = ("__offset", "__headcrc", "__headertype", "__flags", "__headsize")
+
     def __init__(self, f = None):
+        self.__offset = 0
         self.__headcrc = 0
         self.__headertype = None
         self.__flags = 0
@@ -88,13 +139,31 @@ class BaseBlock:
             self.__readbytes(f)
 
     def __readbytes(self, f):
+        self.__offset = f.tell()
         bytes = f.read(7)
+        if len(bytes) < 7:
+            raise EOFError("truncated block header at %d" % self.__offset)
         crc, type, flags, size =  unpack('<HBHH', bytes)
+        if type not in HEADER_TYPES:
+            raise FormatError("unknown header type %d at offset %d" % (type, self.__offset))
+        if size < SIZEOF_SHORTBLOCKHEAD:
+            raise FormatError("bad header size %d at offset %d" % (size, self.__offset))
         self.__headcrc = crc
-        self.__headertype = HEADER_TYPE(type)
+        self.__headertype = HEADER_TYPES[type]
         self.__flags = flags
         self.__headsize = size
 
+    def Skip(self, f):
+        addsize = 0
+        if self.__flags & LONG_BLOCK:
+            f.seek(self.__offset + 7)
+            addsize = unpack("<I", f.read(4))[0]
+        f.seek(self.__offset + self.__headsize + addsize)
+
+    @property
+    def Offset(self):
+        return self.__offset
+
     @property
     def HeadCRC(self):
         return self.__headcrc
@@ -129,6 +198,8 @@ class BaseBlock:
 
 
 class MainHeader:
+    __slots__ = ("__baseblock", "__highposav", "__posav")
+
     def __init__(self, bb = None, f = None):
         self.__baseblock = None
         self.__highposav = 0
@@ -141,6 +212,11 @@ class MainHeader:
     def __readbytes(self, f):
         bytes = f.read(6)
         self.__highposav, self.__posav = unpack("<HI", bytes)
+        f.seek(self.__baseblock.Offset + self.__baseblock.HeadSize)
+
+    @property
+    def Offset(self):
+        return self.__baseblock.Offset
 
     @property
     def HeadCRC(self):
@@ -154,6 +230,14 @@ class MainHeader:
     def Flags(self):
         return MAINHEADER_FLAGS(self.__baseblock.Flags)
 
+    @property
+    def IsVolume(self):
+        return bool(self.__baseblock.Flags & MHD_VOLUME)
+
+    @property
+    def NewNumbering(self):
+        return bool(self.__baseblock.Flags & MHD_NEWNUMBERING)
+
     @property
     def HeadSize(self):
         return self.__baseblock.HeadSize
@@ -176,10 +260,18 @@ class MainHeader:
 
 
 class FileHeader:
+    # catalogs keep one of these per member, so no __dict__ and the
+    # dates are only built when asked for
+    __slots__ = ("__baseblock", "__file", "__dataoffset", "__datasize", "__unpsize", "__host",
+                 "__filecrc", "__filetime", "__unpver", "__method", "__fileattr", "__winsize",
+                 "__filename", "__salt", "__exttime", "__unpacker", "__parts")
+
     def __init__(self, bb = None, f = None):
         self.__baseblock = None
+        self.__file = None
+        self.__dataoffset = 0
         self.__datasize = 0
-        self.__lowunpsize = 0
+        self.__unpsize = 0
         self.__host = 0
         self.__filecrc = 0
         self.__filetime = 0
@@ -188,54 +280,130 @@ class FileHeader:
         self.__fileattr = 0
         self.__winsize = 0
         self.__filename = ""
-        self.__filedata = None
-        self.__dates = None
+        self.__salt = None
+        self.__exttime = None
         self.__unpacker = None
+        self.__parts = ()
         if bb is not None:
             self.__baseblock = bb
         if f is not None:
             self.__readbytes(f)
 
     def __readbytes(self, f):
-        bytes = f.read(25)
-        ds, lus, hs, fc, ft, uv, m, ns, fa = unpack("<IIBIIBBHI", bytes)
-        fn = f.read(ns).decode("utf-8")
-        d = (self.__baseblock.Flags & FILEHEADER_MASKS.WINDOWMASK) == FILEHEADER_MASKS.DIRECTORY
+        header = f.read(25)
+        ds, lus, hs, fc, ft, uv, m, ns, fa = unpack("<IIBIIBBHI", header)
+        flags = self.__baseblock.Flags
+        if flags & LHD_LARGE:
+            hps, hus = unpack("<II", f.read(8))
+            ds |= hps << 32
+            lus |= hus << 32
+        fn = self.__decodename(bytes(f.read(ns)))
+        if flags & LHD_SALT:
+            self.__salt = bytes(f.read(8))
+        d = (flags & LHD_WINDOWMASK) == LHD_DIRECTORY
         self.__datasize = ds
-        self.__lowunpsize = lus
-        self.__hos = hs
+        self.__unpsize = lus
+        self.__host = hs
         self.__filecrc = fc
         self.__filetime = ft
         self.__unpver = uv
         self.__method = m
         self.__fileattr = fa
-        self.__winsize = 0 if d else 0x10000 << ((self.__baseblock.Flags & FILEHEADER_MASKS.WINDOWMASK) >> 5)
+        self.__winsize = 0 if d else 0x10000 << ((flags & LHD_WINDOWMASK) >> 5)
         self.__filename = fn
         self.__readexttime(f)
-        self.__unpacker = Unpack29(f.read(ds))
+        self.__file = f
+        self.__dataoffset = self.__baseblock.Offset + self.__baseblock.HeadSize
+        f.seek(self.__dataoffset + ds)
+
+    def __decodename(self, name):
+        if not self.__baseblock.Flags & LHD_UNICODE:
+            return name.decode("utf-8", "replace")
+        zero = name.find(0)
+        if zero < 0:
+            return name.decode("utf-8", "replace")
+        encname = name[zero+1:]
+        name = name[:zero]
+        result = []
+        if len(encname) == 0:
+            return name.decode("utf-8", "replace")
+        highbyte = encname[0]
+        encpos = 1
+        flags = 0
+        flagbits = 0
+        while encpos < len(encname):
+            if flagbits == 0:
+                flags = encname[encpos]
+                encpos += 1
+                flagbits = 8
+                if encpos >= len(encname):
+                    break
+            flagbits -= 2
+            mode = (flags >> flagbits) & 3
+            if mode == 0:
+                result.append(encname[encpos])
+                encpos += 1
+            elif mode == 1:
+                result.append(encname[encpos] + (highbyte << 8))
+                encpos += 1
+            elif mode == 2:
+                if encpos + 1 >= len(encname):
+                    break
+                result.append(encname[encpos] | (encname[encpos+1] << 8))
+                encpos += 2
+            else:
+                length = encname[encpos]
+                encpos += 1
+                if length & 0x80:
+                    if encpos >= len(encname):
+                        break
+                    correction = encname[encpos]
+                    encpos += 1
+                    for _ in range((length & 0x7f) + 2):
+                        if len(result) >= len(name):
+                            break
+                        result.append(((name[len(result)] + correction) & 0xff) + (highbyte << 8))
+                else:
+                    for _ in range(length + 2):
+                        if len(result) >= len(name):
+                            break
+                        result.append(name[len(result)])
+        return "".join(map(chr, result)).encode("utf-16", "surrogatepass").decode("utf-16", "replace")
 
     def __readexttime(self, f):
+        if not self.__baseblock.Flags & LHD_EXTTIME:
+            return
+        flags = bytes(f.read(2))
+        size = 0
+        for i in range(4):
+            rmode = int.from_bytes(flags, 'little') >> ((3-i) * 4)
+            if rmode & 8:
+                size += (4 if i != 0 else 0) + (rmode & 3)
+        self.__exttime = flags + bytes(f.read(size))
+
+    def __getdates(self):
         tbl = [None] * 4
         tbl[0] = self.__gettime(self.__filetime)
-        if self.Flags & FILEHEADER_FLAGS.EXTTIME:
-            flags = f.read(2)
+        raw = self.__exttime
+        if raw is not None:
+            pos = 2
             for i in range(4):
-                ms = 0
-                rmode = int.from_bytes(flags, 'little') >> ((3-i) * 4)
+                frac = 0
+                rmode = int.from_bytes(raw[:2], 'little') >> ((3-i) * 4)
                 if (rmode & 8) == 0:
                     continue
                 if i != 0:
-                    dostime = f.read(4)
-                    dostimeint = int.from_bytes(dostime, 'little')
-                    tbl[i] = self.__gettime(dostimeint)
+                    tbl[i] = self.__gettime(int.from_bytes(raw[pos:pos+4], 'little'))
+                    pos += 4
                 if rmode & 4:
                     tbl[i] += timedelta(seconds=1)
+                # up to three bytes of 100 ns units, the high ones stored
                 count = rmode & 3
                 for j in range(count):
-                    cb = int.from_bytes(f.read(1), 'little')
-                    ms |= ((cb) << ((j+3-count)*8))
-                tbl[i] += timedelta(milliseconds=ms)
-        self.__dates = tbl
+                    frac |= raw[pos] << ((j+3-count)*8)
+                    pos += 1
+                tbl[i] += timedelta(microseconds=frac // 10)
+        return tbl
 
     def __gettime(self, t):
         s = (t & 0x1f) * 2
@@ -246,23 +414,81 @@ class FileHeader:
         y = (t >> 25) + 1980
         return datetime(y,mm,d, h,m,s)
 
+    def __source(self, size):
+        if not self.__parts:
+            return MemberSource(self.__file, self.__dataoffset, size)
+        return VolumeSource(((self.__file, self.__dataoffset, self.__datasize),) + self.__parts, size)
+
+    def __input(self):
+        if isinstance(self.__file, MappedFile) and not self.__parts:
+            return self.__file.Buffer[self.__dataoffset:self.__dataoffset + self.__datasize], None
+        return None, self.__source(self.DataSize)
+
+    def AppendPart(self, fh, filename = None):
+        # fh continues this member in the next volume; only the last
+        # part carries the CRC of the whole file
+        self.__parts += ((fh.__file if filename is None else filename, fh.__dataoffset, fh.__datasize),)
+        self.__filecrc = fh.__filecrc
+
+    def __newunpacker(self):
+        data, source = self.__input()
+        return Unpack29(data, self.__winsize, source)
+
+    def CreateUnpacker(self):
+        return Unpack29(None, self.__winsize)
+
+    def Chunks(self, unpacker = None):
+        if self.IsDirectory:
+            return
+        if self.__baseblock.Flags & LHD_PASSWORD:
+            raise NotImplementedError("encrypted files are not supported")
+        if self.__method == 0x30:
+            source = self.__source(min(self.DataSize, self.__unpsize))
+            chunk = source(UNPACK_MAX_WRITE)
+            while chunk:
+                yield chunk
+                chunk = source(UNPACK_MAX_WRITE)
+            return
+        if self.__unpver not in UNPACK_VERSIONS:
+            raise NotImplementedError("%s: unpack version %d.%d is not supported" % (
+                self.__filename, self.__unpver // 10, self.__unpver % 10))
+        if unpacker is not None:
+            unpacker.SetInput(*self.__input())
+            yield from unpacker.Chunks(self.__unpsize)
+            return
+        # a decoder of our own goes back to the table pool with the member
+        unpacker = self.__newunpacker()
+        try:
+            yield from unpacker.Chunks(self.__unpsize)
+        finally:
+            unpacker.Release()
+
+    def Open(self, unpacker = None):
+        return BufferedReader(MemberStream(self.Chunks(unpacker)))
+
+    def Extract(self, write, unpacker = None):
+        total = 0
+        for chunk in self.Chunks(unpacker):
+            write(chunk)
+            total += len(chunk)
+        return total
+
+    def GetTables(self):
+        # an encrypted member's tables would be read from ciphertext
+        if self.__baseblock.Flags & LHD_PASSWORD:
+            return {}
+        return self.Unpacker.UnpackBlockTables
+
     def GetTableValues(self):
         result = []
-        for k, v in self.Unpacker.UnpackBlockTables.items():
-            result.append("%s\t%s\t%s\t%d\t%d" % (self.Filename,k, "MaxNum", 0, v.MaxNum))
-            for i in range(len(v.DecodeLen)):
-                result.append("%s\t%s\t%s\t%d\t%d" % (self.Filename,k, "DecodeLen", i, v.DecodeLen[i]))
-            for i in range(len(v.DecodePos)):
-                result.append("%s\t%s\t%s\t%d\t%d" % (self.Filename,k, "DecodePos", i, v.DecodePos[i]))
-            result.append("%s\t%s\t%s\t%d\t%d" % (self.Filename,k, "QuickBits", 0, v.QuickBits))
-            for i in range(len(v.QuickLen)):
-                result.append("%s\t%s\t%s\t%d\t%d" % (self.Filename,k, "QuickLen", i, v.QuickLen[i]))
-            for i in range(len(v.QuickNum)):
-                result.append("%s\t%s\t%s\t%d\t%d" % (self.Filename,k, "QuickNum", i, v.QuickNum[i]))
-            for i in range(len(v.DecodeNum)):
-                result.append("%s\t%s\t%s\t%d\t%d" % (self.Filename,k, "DecodeNum", i, v.DecodeNum[i]))
+        for k, v in self.GetTables().items():
+            result.extend(table_lines(self.Filename, k, v))
         return result
 
+    @property
+    def Offset(self):
+        return self.__baseblock.Offset
+
     @property
     def HeadCRC(self):
         return self.__baseblock.HeadCRC
@@ -273,7 +499,11 @@ class FileHeader:
 
     @property
     def Flags(self):
-        return FILEHEADER_FLAGS(self.__baseblock.Flags)
+        # a plain int, FILEHEADER_FLAGS(Flags) for the names
+        flags = self.__baseblock.Flags
+        if self.__parts:
+            flags &= ~LHD_SPLIT_AFTER
+        return flags
 
     @property
     def HeadSize(self):
@@ -281,15 +511,36 @@ class FileHeader:
 
     @property
     def DataSize(self):
-        return self.__datasize
+        return self.__datasize + sum(part[2] for part in self.__parts)
+
+    @property
+    def Parts(self):
+        return len(self.__parts) + 1
 
     @property
     def LowUnpSize(self):
-        return self.__lowunpsize
+        return self.__unpsize & 0xffffffff
+
+    @property
+    def UnpSize(self):
+        return self.__unpsize
+
+    @property
+    def DataOffset(self):
+        return self.__dataoffset
+
+    @property
+    def Salt(self):
+        return self.__salt
+
+    @property
+    def Hash(self):
+        # only RAR5 members carry a BLAKE2sp hash
+        return None
 
     @property
     def HostOS(self):
-        return HOST_SYSTEM(self.__host)
+        return host_system(self.__host)
 
     @property
     def FileCRC(self):
@@ -315,16 +566,29 @@ class FileHeader:
     def WinSize(self):
         return self.__winsize
 
+    @property
+    def IsDirectory(self):
+        return (self.__baseblock.Flags & LHD_WINDOWMASK) == LHD_DIRECTORY
+
+    @property
+    def IsSymlink(self):
+        # a Unix symbolic link, its data is the target
+        return self.__host == HOST_SYSTEM.UNIX.value and stat.S_ISLNK(self.__fileattr)
+
     @property
     def Filename(self):
         return self.__filename
 
     @property
     def ModifiedDate(self):
-        return self.__dates[0]
+        return self.__getdates()[0]
 
     @property
     def Unpacker(self):
+        if self.__unpacker is None and self.__file is not None:
+            pos = self.__file.tell()
+            self.__unpacker = self.__newunpacker()
+            self.__file.seek(pos)
         return self.__unpacker
 
 
@@ -333,7 +597,7 @@ class FileHeader:
         formatstring += " CRC: %s\n Time: %s\n Ver: %s\n Method: %s\n"
         formatstring += " FileAttr: %s\n WinSize: %s\n Filename: \"%s\"\n"
         return "File " + str(self.__baseblock) + formatstring % (
-            self.Flags.name,
+            FILEHEADER_FLAGS(self.Flags).name,
             "{0:#0{1}x}".format(self.DataSize, 10),
             "{0:#0{1}x}".format(self.LowUnpSize, 6),
             self.HostOS.name,
@@ -0,0 +1,685 @@
+from enum import Enum, IntFlag
+from struct import unpack_from
+from datetime import datetime, timedelta
+from io import BufferedReader
+import zlib
+from structs import HEADER_TYPE, HEADER_TYPES, HOST_SYSTEM, FILEHEADER_FLAGS, FormatError
+from structs import LHD_SPLIT_BEFORE, LHD_SPLIT_AFTER, LHD_PASSWORD, LHD_SOLID
+from unpack import UNPACK_MAX_WRITE
+from unpack50 import Unpack50
+from mmapfile import MappedFile
+from stream import MemberSource, VolumeSource, MemberStream
+
+MAX_HEADER_SIZE5 = 0x200000
+# RAR 7 headers can ask for up to 2^48 bytes of dictionary; past 4 GB
+# the window is not worth trying to map
+MAX_WINDOW5 = 0x100000000
+
+
+class HEADER5_FLAGS(IntFlag):
+    EXTRA =             0x0001
+    DATA =              0x0002
+    SKIP_IF_UNKNOWN =   0x0004
+    SPLIT_BEFORE =      0x0008
+    SPLIT_AFTER =       0x0010
+    CHILD =             0x0020
+    INHERITED =         0x0040
+
+
+class MAINHEADER5_FLAGS(IntFlag):
+    VOLUME =        0x0001
+    VOLNUMBER =     0x0002
+    SOLID =         0x0004
+    PROTECT =       0x0008
+    LOCK =          0x0010
+
+
+class MAINHEADER5_EXTRA(Enum):
+    LOCATOR =       0x01
+
+
+class LOCATOR_FLAGS(IntFlag):
+    QLIST =         0x0001
+    RR =            0x0002
+
+
+class FILEHEADER5_FLAGS(IntFlag):
+    DIRECTORY =         0x0001
+    UTIME =             0x0002
+    CRC32 =             0x0004
+    UNPSIZE_UNKNOWN =   0x0008
+
+
+class FILEHEADER5_EXTRA(Enum):
+    CRYPT =     0x01
+    HASH =      0x02
+    HTIME =     0x03
+    VERSION =   0x04
+    REDIR =     0x05
+    UOWNER =    0x06
+    SUBDATA =   0x07
+
+
+class REDIR_TYPE(Enum):
+    UNIXSYMLINK =   0x0001
+    WINSYMLINK =    0x0002
+    JUNCTION =      0x0003
+    HARDLINK =      0x0004
+    FILECOPY =      0x0005
+
+
+class HTIME_FLAGS(IntFlag):
+    UNIXTIME =  0x0001
+    MTIME =     0x0002
+    CTIME =     0x0004
+    ATIME =     0x0008
+    UNIX_NS =   0x0010
+
+
+class HOST_SYSTEM5(Enum):
+    WINDOWS =   0
+    UNIX =      1
+
+
+# plain ints for the per-header tests, as in structs
+HFL_EXTRA = HEADER5_FLAGS.EXTRA.value
+HFL_DATA = HEADER5_FLAGS.DATA.value
+HFL_SPLITBEFORE = HEADER5_FLAGS.SPLIT_BEFORE.value
+HFL_SPLITAFTER = HEADER5_FLAGS.SPLIT_AFTER.value
+FHFL_DIRECTORY = FILEHEADER5_FLAGS.DIRECTORY.value
+FHFL_UTIME = FILEHEADER5_FLAGS.UTIME.value
+FHFL_CRC32 = FILEHEADER5_FLAGS.CRC32.value
+FHFL_UNPSIZE_UNKNOWN = FILEHEADER5_FLAGS.UNPSIZE_UNKNOWN.value
+FHEXTRA_CRYPT = FILEHEADER5_EXTRA.CRYPT.value
+FHEXTRA_HASH = FILEHEADER5_EXTRA.HASH.value
+FHEXTRA_HTIME = FILEHEADER5_EXTRA.HTIME.value
+FHEXTRA_REDIR = FILEHEADER5_EXTRA.REDIR.value
+SYMLINK_REDIRS = (REDIR_TYPE.UNIXSYMLINK.value, REDIR_TYPE.WINSYMLINK.value, REDIR_TYPE.JUNCTION.value)
+
+
+def read_vint(buf, pos):
+    value = 0
+    shift = 0
+    while pos < len(buf):
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return value, pos
+        shift += 7
+        if shift > 63:
+            break
+    raise EOFError("truncated variable length integer")
+
+
+def read_extras(buf, pos, end):
+    # each record is size, type, then size - len(type) bytes of payload
+    while pos < end:
+        size, pos = read_vint(buf, pos)
+        recend = pos + size
+        rtype, pos = read_vint(buf, pos)
+        yield rtype, pos
+        pos = recend
+
+
+def filetime(value):
+    return datetime(1601, 1, 1) + timedelta(microseconds=value // 10)
+
+
+def unixtime(value):
+    return datetime(1970, 1, 1) + timedelta(seconds=value)
+
+
+class BaseBlock5:
+    __slots__ = ("__raw", "__offset", "__headcrc", "__headertype", "__type", "__flags",
+                 "__extrasize", "__datasize", "__bodypos")
+
+    def __init__(self, f = None, raw = None, offset = 0):
+        self.__raw = b""
+        self.__offset = offset
+        self.__headcrc = 0
+        self.__headertype = HEADER_TYPE.HEAD_UNKNOWN
+        self.__type = 0
+        self.__flags = 0
+        self.__extrasize = 0
+        self.__datasize = 0
+        self.__bodypos = 0
+        if raw is None and f is not None:
+            self.__offset = f.tell()
+            raw = self.__readraw(f)
+        if raw is not None:
+            self.__parse(raw)
+
+    def __readraw(self, f):
+        raw = bytearray(f.read(4))
+        while len(raw) < 4 + 3:
+            b = f.read(1)
+            if len(b) == 0:
+                break
+            raw += b
+            if not b[0] & 0x80:
+                break
+        if len(raw) < 5:
+            raise EOFError("truncated block header at offset %d" % self.__offset)
+        size, pos = read_vint(raw, 4)
+        if size == 0 or size > MAX_HEADER_SIZE5:
+            raise FormatError("bad header size %d at offset %d" % (size, self.__offset))
+        rest = f.read(size)
+        if len(rest) < size:
+            raise EOFError("truncated block header at offset %d" % self.__offset)
+        return bytes(raw) + bytes(rest)
+
+    def __parse(self, raw):
+        self.__raw = raw
+        self.__headcrc = unpack_from("<I", raw)[0]
+        size, pos = read_vint(raw, 4)
+        if pos + size != len(raw):
+            raise EOFError("truncated block header at offset %d" % self.__offset)
+        self.__type, pos = read_vint(raw, pos)
+        self.__flags, pos = read_vint(raw, pos)
+        if self.__flags & HFL_EXTRA:
+            self.__extrasize, pos = read_vint(raw, pos)
+        if self.__flags & HFL_DATA:
+            self.__datasize, pos = read_vint(raw, pos)
+        self.__bodypos = pos
+        self.__headertype = HEADER_TYPES.get(self.__type, HEADER_TYPE.HEAD_UNKNOWN)
+
+    def VerifyCRC(self):
+        return zlib.crc32(self.__raw[4:]) == self.__headcrc
+
+    def Skip(self, f):
+        f.seek(self.DataOffset + self.__datasize)
+
+    @property
+    def Raw(self):
+        return self.__raw
+
+    @property
+    def Offset(self):
+        return self.__offset
+
+    @property
+    def HeadCRC(self):
+        return self.__headcrc
+
+    @property
+    def HeaderType(self):
+        return self.__headertype
+
+    @property
+    def Type(self):
+        return self.__type
+
+    @property
+    def Flags(self):
+        # a plain int like BaseBlock.Flags, HEADER5_FLAGS(Flags) for the names
+        return self.__flags
+
+    @property
+    def HeadSize(self):
+        return len(self.__raw)
+
+    @property
+    def ExtraSize(self):
+        return self.__extrasize
+
+    @property
+    def DataSize(self):
+        return self.__datasize
+
+    @property
+    def DataOffset(self):
+        return self.__offset + len(self.__raw)
+
+    @property
+    def BodyPos(self):
+        return self.__bodypos
+
+    def __str__(self):
+        return "CRC: %s Type: %s Flags: %s Size:%s" % (
+            "{0:#0{1}x}".format(self.__headcrc, 10),
+            self.__headertype.name,
+            "{0:#0{1}x}".format(self.__flags, 6),
+            "{0:#0{1}x}".format(len(self.__raw), 6)
+            )
+
+    def __repr__(self):
+        return str(self)
+
+
+class MainHeader5:
+    __slots__ = ("__baseblock", "__archflags", "__volnumber", "__qopenoffset", "__rroffset")
+
+    def __init__(self, bb = None, f = None):
+        self.__baseblock = None
+        self.__archflags = 0
+        self.__volnumber = 0
+        self.__qopenoffset = None
+        self.__rroffset = None
+        if bb is not None:
+            self.__baseblock = bb
+            self.__parse(bb.Raw)
+        if f is not None:
+            f.seek(bb.DataOffset + bb.DataSize)
+
+    def __parse(self, raw):
+        bb = self.__baseblock
+        self.__archflags, pos = read_vint(raw, bb.BodyPos)
+        if self.__archflags & MAINHEADER5_FLAGS.VOLNUMBER:
+            self.__volnumber, pos = read_vint(raw, pos)
+        end = len(raw)
+        for rtype, pos in read_extras(raw, end - bb.ExtraSize, end):
+            if rtype == MAINHEADER5_EXTRA.LOCATOR.value:
+                flags, pos = read_vint(raw, pos)
+                # locator offsets count from the start of this header
+                if flags & LOCATOR_FLAGS.QLIST:
+                    offset, pos = read_vint(raw, pos)
+                    if offset:
+                        self.__qopenoffset = bb.Offset + offset
+                if flags & LOCATOR_FLAGS.RR:
+                    offset, pos = read_vint(raw, pos)
+                    if offset:
+                        self.__rroffset = bb.Offset + offset
+
+    @property
+    def Offset(self):
+        return self.__baseblock.Offset
+
+    @property
+    def HeadCRC(self):
+        return self.__baseblock.HeadCRC
+
+    @property
+    def HeaderType(self):
+        return self.__baseblock.HeaderType
+
+    @property
+    def Flags(self):
+        return MAINHEADER5_FLAGS(self.__archflags)
+
+    @property
+    def IsVolume(self):
+        return bool(self.__archflags & MAINHEADER5_FLAGS.VOLUME)
+
+    @property
+    def NewNumbering(self):
+        return True
+
+    @property
+    def HeadSize(self):
+        return self.__baseblock.HeadSize
+
+    @property
+    def VolNumber(self):
+        return self.__volnumber
+
+    @property
+    def QOpenOffset(self):
+        return self.__qopenoffset
+
+    @property
+    def RROffset(self):
+        return self.__rroffset
+
+    def __str__(self):
+        formatstring = " VolNumber: %s QOpen: %s MainFlags: %s"
+        return "MainHeader " + str(self.__baseblock) + formatstring % (
+            self.__volnumber,
+            "-" if self.__qopenoffset is None else "{0:#0{1}x}".format(self.__qopenoffset, 10),
+            self.Flags.name
+        )
+
+
+class FileHeader5:
+    # the dates stay in the raw header until asked for, like FileHeader
+    __slots__ = ("__baseblock", "__fileflags", "__unpsize", "__fileattr", "__filetime", "__filecrc",
+                 "__compinfo", "__host", "__filename", "__salt", "__encrypted", "__hash", "__htime",
+                 "__redir", "__file", "__parts")
+
+    def __init__(self, bb = None, f = None):
+        self.__baseblock = None
+        self.__fileflags = 0
+        self.__unpsize = 0
+        self.__fileattr = 0
+        self.__filetime = 0
+        self.__filecrc = None
+        self.__compinfo = 0
+        self.__host = 0
+        self.__filename = ""
+        self.__salt = None
+        self.__encrypted = False
+        self.__hash = None
+        self.__htime = None
+        self.__redir = None
+        self.__file = f
+        self.__parts = ()
+        if bb is not None:
+            self.__baseblock = bb
+            self.__parse(bb.Raw)
+        if f is not None:
+            f.seek(bb.DataOffset + bb.DataSize)
+
+    def __parse(self, raw):
+        bb = self.__baseblock
+        self.__fileflags, pos = read_vint(raw, bb.BodyPos)
+        self.__unpsize, pos = read_vint(raw, pos)
+        self.__fileattr, pos = read_vint(raw, pos)
+        if self.__fileflags & FHFL_UTIME:
+            self.__filetime = unpack_from("<I", raw, pos)[0]
+            pos += 4
+        if self.__fileflags & FHFL_CRC32:
+            self.__filecrc = unpack_from("<I", raw, pos)[0]
+            pos += 4
+        self.__compinfo, pos = read_vint(raw, pos)
+        self.__host, pos = read_vint(raw, pos)
+        ns, pos = read_vint(raw, pos)
+        self.__filename = bytes(raw[pos:pos+ns]).decode("utf-8", "replace")
+        end = len(raw)
+        for rtype, pos in read_extras(raw, end - bb.ExtraSize, end):
+            if rtype == FHEXTRA_CRYPT:
+                self.__encrypted = True
+                version, pos = read_vint(raw, pos)
+                flags, pos = read_vint(raw, pos)
+                self.__salt = bytes(raw[pos+1:pos+17])
+            elif rtype == FHEXTRA_HASH:
+                htype, pos = read_vint(raw, pos)
+                if htype == 0:
+                    self.__hash = bytes(raw[pos:pos+32])
+            elif rtype == FHEXTRA_HTIME:
+                self.__htime = pos
+            elif rtype == FHEXTRA_REDIR:
+                self.__redir, pos = read_vint(raw, pos)
+
+    def __getdates(self):
+        dates = [None, None, None]
+        if self.__fileflags & FHFL_UTIME:
+            dates[0] = unixtime(self.__filetime)
+        if self.__htime is not None:
+            self.__readhtime(self.__baseblock.Raw, self.__htime, dates)
+        return dates
+
+    def __readhtime(self, raw, pos, dates):
+        flags, pos = read_vint(raw, pos)
+        times = []
+        for bit in (HTIME_FLAGS.MTIME, HTIME_FLAGS.CTIME, HTIME_FLAGS.ATIME):
+            if not flags & bit:
+                times.append(None)
+            elif flags & HTIME_FLAGS.UNIXTIME:
+                times.append(unpack_from("<I", raw, pos)[0])
+                pos += 4
+            else:
+                times.append(unpack_from("<Q", raw, pos)[0])
+                pos += 8
+        for i, t in enumerate(times):
+            if t is None:
+                continue
+            if flags & HTIME_FLAGS.UNIXTIME:
+                date = unixtime(t)
+                if flags & HTIME_FLAGS.UNIX_NS:
+                    date += timedelta(microseconds=(unpack_from("<I", raw, pos)[0] & 0x3fffffff) // 1000)
+                    pos += 4
+                dates[i] = date
+            else:
+                dates[i] = filetime(t)
+
+    def __source(self, size):
+        bb = self.__baseblock
+        if not self.__parts:
+            return MemberSource(self.__file, bb.DataOffset, size)
+        return VolumeSource(((self.__file, bb.DataOffset, bb.DataSize),) + self.__parts, size)
+
+    def __input(self):
+        bb = self.__baseblock
+        if isinstance(self.__file, MappedFile) and not self.__parts:
+            return self.__file.Buffer[bb.DataOffset:bb.DataOffset + bb.DataSize], None
+        return None, self.__source(self.DataSize)
+
+    def AppendPart(self, fh, filename = None):
+        # fh continues this member in the next volume; only the last
+        # part carries the checksums of the whole file
+        bb = fh.__baseblock
+        self.__parts += ((fh.__file if filename is None else filename, bb.DataOffset, bb.DataSize),)
+        self.__filecrc = fh.__filecrc
+        self.__hash = fh.__hash
+
+    def __dictsize(self):
+        # a non-solid member never reaches back past its own start
+        winsize = self.WinSize
+        if not self.IsSolid and not self.__fileflags & FHFL_UNPSIZE_UNKNOWN:
+            winsize = min(winsize, self.__unpsize)
+        if winsize > MAX_WINDOW5:
+            raise NotImplementedError("%s: a %d MB dictionary is over the %d MB limit" % (
+                self.__filename, winsize >> 20, MAX_WINDOW5 >> 20))
+        return winsize
+
+    def __newunpacker(self):
+        data, source = self.__input()
+        return Unpack50(data, self.__dictsize(), source, self.UnpVer == 70)
+
+    def CreateUnpacker(self):
+        # the decoder for a run of members starting with this one; later
+        # solid members grow its window as they need
+        return Unpack50(None, self.__dictsize(), None, self.UnpVer == 70)
+
+    def Chunks(self, unpacker = None):
+        if self.IsDirectory:
+            return
+        if self.__encrypted:
+            raise NotImplementedError("encrypted files are not supported")
+        if self.Method == 0x30:
+            source = self.__source(min(self.DataSize, self.__unpsize))
+            chunk = source(UNPACK_MAX_WRITE)
+            while chunk:
+                yield chunk
+                chunk = source(UNPACK_MAX_WRITE)
+            return
+        if unpacker is not None:
+            unpacker.GrowWindow(self.__dictsize())
+            unpacker.SetInput(*self.__input())
+            yield from unpacker.Chunks(self.__unpsize)
+            return
+        # a decoder of our own goes back to the table pool with the member
+        unpacker = self.__newunpacker()
+        try:
+            yield from unpacker.Chunks(self.__unpsize)
+        finally:
+            unpacker.Release()
+
+    def Open(self, unpacker = None):
+        return BufferedReader(MemberStream(self.Chunks(unpacker)))
+
+    def Extract(self, write, unpacker = None):
+        total = 0
+        for chunk in self.Chunks(unpacker):
+            write(chunk)
+            total += len(chunk)
+        return total
+
+    def GetTables(self):
+        return {}
+
+    def GetTableValues(self):
+        return []
+
+    @property
+    def Offset(self):
+        return self.__baseblock.Offset
+
+    @property
+    def HeadCRC(self):
+        return self.__baseblock.HeadCRC
+
+    @property
+    def HeaderType(self):
+        return self.__baseblock.HeaderType
+
+    @property
+    def Flags(self):
+        # the RAR 1.5 flag bits, so solid and split checks work on both
+        # formats; a plain int as there
+        blockflags = self.__baseblock.Flags
+        flags = 0
+        if blockflags & HFL_SPLITBEFORE:
+            flags |= LHD_SPLIT_BEFORE
+        if blockflags & HFL_SPLITAFTER and not self.__parts:
+            flags |= LHD_SPLIT_AFTER
+        if self.__encrypted:
+            flags |= LHD_PASSWORD
+        if self.IsSolid:
+            flags |= LHD_SOLID
+        return flags
+
+    @property
+    def BlockFlags(self):
+        return self.__baseblock.Flags
+
+    @property
+    def FileFlags(self):
+        return FILEHEADER5_FLAGS(self.__fileflags)
+
+    @property
+    def HeadSize(self):
+        return self.__baseblock.HeadSize
+
+    @property
+    def DataSize(self):
+        return self.__baseblock.DataSize + sum(part[2] for part in self.__parts)
+
+    @property
+    def Parts(self):
+        return len(self.__parts) + 1
+
+    @property
+    def LowUnpSize(self):
+        return self.__unpsize & 0xffffffff
+
+    @property
+    def UnpSize(self):
+        return self.__unpsize
+
+    @property
+    def DataOffset(self):
+        return self.__baseblock.DataOffset
+
+    @property
+    def Salt(self):
+        return self.__salt
+
+    @property
+    def Hash(self):
+        return self.__hash
+
+    @property
+    def HostOS(self):
+        return HOST_SYSTEM.WIN32 if self.__host == HOST_SYSTEM5.WINDOWS.value else HOST_SYSTEM.UNIX
+
+    @property
+    def FileCRC(self):
+        return self.__filecrc
+
+    @property
+    def FileTime(self):
+        return self.__filetime
+
+    @property
+    def UnpVer(self):
+        # version 1 streams flagged as v5 compatible skip the wider distance table
+        if self.__compinfo & 0x3f == 0 or self.__compinfo & 0x100000:
+            return 50
+        return 70
+
+    @property
+    def Method(self):
+        return 0x30 + ((self.__compinfo >> 7) & 7)
+
+    @property
+    def IsSolid(self):
+        return bool(self.__compinfo & 0x40)
+
+    @property
+    def FileAttribute(self):
+        return self.__fileattr
+
+    @property
+    def WinSize(self):
+        if self.IsDirectory:
+            return 0
+        winsize = 0x20000 << ((self.__compinfo >> 10) & 0x1f)
+        return winsize + winsize // 32 * ((self.__compinfo >> 15) & 0x1f)
+
+    @property
+    def IsDirectory(self):
+        return bool(self.__fileflags & FHFL_DIRECTORY)
+
+    @property
+    def IsSymlink(self):
+        # symbolic links and junctions; hard links and file copies are not
+        return self.__redir in SYMLINK_REDIRS
+
+    @property
+    def Filename(self):
+        return self.__filename
+
+    @property
+    def ModifiedDate(self):
+        return self.__getdates()[0]
+
+    def __str__(self):
+        formatstring = "\nFlags: %s\n Packed: %s Unpacked: %s HostOS: %s\n"
+        formatstring += " CRC: %s\n Time: %s\n Ver: %s\n Method: %s\n"
+        formatstring += " FileAttr: %s\n WinSize: %s\n Filename: \"%s\"\n"
+        return "File " + str(self.__baseblock) + formatstring % (
+            self.FileFlags.name,
+            "{0:#0{1}x}".format(self.DataSize, 10),
+            "{0:#0{1}x}".format(self.LowUnpSize, 6),
+            self.HostOS.name,
+            "-" if self.__filecrc is None else "{0:#0{1}x}".format(self.__filecrc, 10),
+            self.ModifiedDate,
+            self.UnpVer,
+            "{0:#0{1}x}".format(self.Method, 4),
+            "{0:#0{1}x}".format(self.__fileattr, 10),
+            "{0:#0{1}x}".format(self.WinSize, 10),
+            self.__filename
+            )
+
+
+class QuickOpen:
+    def __init__(self, f = None, mainheader = None):
+        self.__headers = {}
+        if f is not None and mainheader is not None and mainheader.QOpenOffset is not None:
+            self.__load(f, mainheader.QOpenOffset)
+
+    def __load(self, f, offset):
+        pos = f.tell()
+        f.seek(offset)
+        bb = BaseBlock5(f)
+        if bb.HeaderType != HEADER_TYPE.HEAD_SERVICE:
+            f.seek(pos)
+            return
+        qo = FileHeader5(bb)
+        if qo.Filename != "QO" or qo.Method != 0x30 or qo.Salt is not None:
+            f.seek(pos)
+            return
+        f.seek(bb.DataOffset)
+        data = bytes(f.read(bb.DataSize))
+        f.seek(pos)
+        # records are crc32, size, then flags, offset back from the QO
+        # header, and the raw cached header
+        pos = 0
+        while pos + 4 < len(data):
+            crc = unpack_from("<I", data, pos)[0]
+            size, start = read_vint(data, pos + 4)
+            end = start + size
+            if end > len(data) or zlib.crc32(data[pos+4:end]) != crc:
+                break
+            flags, p = read_vint(data, start)
+            back, p = read_vint(data, p)
+            hsize, p = read_vint(data, p)
+            self.__headers[offset - back] = data[p:p+hsize]
+            pos = end
+
+    def Get(self, offset):
+        return self.__headers.get(offset)
+
+    def __len__(self):
+        return len(self.__headers)
@@ -0,0 +1,316 @@
+import heapq
+import random
+import struct
+import zlib
+from unpack import NC30, DC30, LDC30, RC30, BC30, LDecode, LBits, DBitLengthCounts
+
+# deterministic inputs for the benchmarks: everything is drawn from a
+# seeded random.Random, so the same arguments give the same bytes
+
+MAX_CODE_BITS = 15
+WORDS = (b"the", b"of", b"and", b"archive", b"volume", b"header", b"block", b"table",
+         b"window", b"filter", b"solid", b"stream", b"member", b"offset", b"length",
+         b"distance", b"symbol", b"decode", b"rar", b"data", b"size", b"name", b"crc")
+
+
+def block3(htype, flags, body):
+    raw = struct.pack("<BHH", htype, flags, 7 + len(body)) + body
+    return struct.pack("<H", zlib.crc32(raw) & 0xffff) + raw
+
+
+def vint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def block5(htype, flags, body, datasize = None):
+    head = vint(htype) + vint(flags | (2 if datasize is not None else 0))
+    if datasize is not None:
+        head += vint(datasize)
+    raw = vint(len(head) + len(body)) + head + body
+    return struct.pack("<I", zlib.crc32(raw)) + raw
+
+
+class BitWriter:
+    # MSB first, the order BitReader takes bits back out
+    def __init__(self):
+        self.__out = bytearray()
+        self.__acc = 0
+        self.__count = 0
+
+    def Put(self, value, bits):
+        self.__acc = (self.__acc << bits) | value
+        self.__count += bits
+        while self.__count >= 8:
+            self.__count -= 8
+            self.__out.append((self.__acc >> self.__count) & 0xff)
+        self.__acc &= (1 << self.__count) - 1
+
+    def Data(self):
+        # pads the last byte with zero bits
+        if self.__count:
+            return bytes(self.__out) + bytes(((self.__acc << (8 - self.__count)) & 0xff,))
+        return bytes(self.__out)
+
+
+def huffman_lengths(freqs, maxbits = MAX_CODE_BITS):
+    freqs = list(freqs)
+    while True:
+        heap = [(f, i, (i,)) for i, f in enumerate(freqs) if f]
+        lengths = [0] * len(freqs)
+        if len(heap) == 1:
+            # a lone code still needs a sibling to be a complete tree
+            other = 1 if heap[0][1] == 0 else 0
+            lengths[heap[0][1]] = lengths[other] = 1
+            return lengths
+        heapq.heapify(heap)
+        while len(heap) > 1:
+            f1, i1, s1 = heapq.heappop(heap)
+            f2, i2, s2 = heapq.heappop(heap)
+            for s in s1 + s2:
+                lengths[s] += 1
+            heapq.heappush(heap, (f1 + f2, min(i1, i2), s1 + s2))
+        if max(lengths) <= maxbits:
+            return lengths
+        # flatten the distribution until the tree fits
+        freqs = [(f + 1) >> 1 if f else 0 for f in freqs]
+
+
+def canonical_codes(lengths):
+    # codes are handed out by length, then by symbol, as DecodeTable expects
+    codes = [0] * len(lengths)
+    code = 0
+    for bits in range(1, MAX_CODE_BITS + 1):
+        for symbol, length in enumerate(lengths):
+            if length == bits:
+                codes[symbol] = code
+                code += 1
+        code <<= 1
+    return codes
+
+
+def random_lengths(size, seed = 0):
+    # a skewed symbol distribution, like the literal tables of real data
+    rnd = random.Random(seed)
+    return huffman_lengths([int(1000 * rnd.paretovariate(1.2)) if rnd.random() < 0.8 else 0
+                            for _ in range(size)])
+
+
+def make_bitstream(lengths, count, seed = 0):
+    # count symbols drawn from the table, encoded with its canonical codes
+    rnd = random.Random(seed)
+    codes = canonical_codes(lengths)
+    symbols = [s for s, length in enumerate(lengths) if length]
+    weights = [1.0 / (1 << lengths[s]) for s in symbols]
+    bw = BitWriter()
+    for s in rnd.choices(symbols, weights, k=count):
+        bw.Put(codes[s], lengths[s])
+    return bw.Data() + bytes(8)
+
+
+def text_data(size, seed = 0):
+    # word salad: compresses a few times over, with matches of all distances
+    rnd = random.Random(seed)
+    out = bytearray()
+    while len(out) < size:
+        line = b" ".join(rnd.choices(WORDS, k=rnd.randint(4, 16)))
+        out += line + (b" %d\n" % rnd.randint(0, 99999))
+    return bytes(out[:size])
+
+
+def random_data(size, seed = 0):
+    return random.Random(seed).randbytes(size)
+
+
+def _distance_slots():
+    slots = []
+    dist = 0
+    for bits, count in enumerate(DBitLengthCounts):
+        for _ in range(count):
+            slots.append((dist, bits))
+            dist += 1 << bits
+    return slots
+
+
+def _slot(slots, value):
+    lo, hi = 0, len(slots) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) >> 1
+        if slots[mid][0] <= value:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _write_table(bw, lengths):
+    # the table as bit length codes: plain lengths and runs of zeros,
+    # against an all zero previous table
+    tokens = []
+    i = 0
+    while i < len(lengths):
+        run = 0
+        while i + run < len(lengths) and lengths[i + run] == 0 and run < 138:
+            run += 1
+        if run >= 11:
+            tokens.append((19, run - 11, 7))
+            i += run
+        elif run >= 3:
+            tokens.append((18, run - 3, 3))
+            i += run
+        else:
+            tokens.append((lengths[i], 0, 0))
+            i += 1
+    freqs = [0] * BC30
+    for symbol, _, _ in tokens:
+        freqs[symbol] += 1
+    bdlengths = huffman_lengths(freqs)
+    for length in bdlengths:
+        bw.Put(length, 4)
+        if length == 15:
+            bw.Put(0, 4)
+    codes = canonical_codes(bdlengths)
+    for symbol, extra, bits in tokens:
+        bw.Put(codes[symbol], bdlengths[symbol])
+        if bits:
+            bw.Put(extra, bits)
+
+
+def compress29(data, winsize = 0x400000):
+    return compress29_solid((data,), winsize)[0]
+
+
+def compress29_solid(members, winsize = 0x400000):
+    # LZ blocks of literals and plain matches, found greedily through a
+    # hash of the next four bytes; no repeat or short distance codes, which
+    # keeps the encoder small while still exercising every table. Matches
+    # reach back into earlier members, the tables go out once with the
+    # first member and every member ends with its own end of file code
+    lslots = list(zip(LDecode, LBits))
+    dslots = _distance_slots()
+    data = b"".join(members)
+    heads = {}
+    tokens = []
+    i = 0
+    for member in members:
+        end = i + len(member)
+        part = []
+        while i < end:
+            key = data[i:i + 4]
+            cand = heads.get(key)
+            heads[key] = i
+            length = 0
+            if cand is not None and len(key) == 4 and i - cand < winsize:
+                dist = i - cand
+                extra = (dist >= 0x2000) + (dist >= 0x40000)
+                limit = min(258 + extra, end - i)
+                while length < limit and data[cand + length] == data[i + length]:
+                    length += 1
+                if length < 3 + extra:
+                    length = 0
+            if length:
+                part.append((length - 3 - extra, dist - 1))
+                for p in range(i + 1, min(i + length, len(data) - 3)):
+                    heads[data[p:p + 4]] = p
+                i += length
+            else:
+                part.append(data[i])
+                i += 1
+        tokens.append(part)
+
+    ldfreq = [0] * NC30
+    ddfreq = [0] * DC30
+    lddfreq = [0] * LDC30
+    ldfreq[256] = 1
+    for token in (t for part in tokens for t in part):
+        if isinstance(token, int):
+            ldfreq[token] += 1
+            continue
+        length, dist = token
+        ds = _slot(dslots, dist)
+        ldfreq[271 + _slot(lslots, length)] += 1
+        ddfreq[ds] += 1
+        if ds > 9:
+            lddfreq[(dist - dslots[ds][0]) & 0xf] += 1
+    ld, dd, ldd = huffman_lengths(ldfreq), huffman_lengths(ddfreq), huffman_lengths(lddfreq)
+    rd = [0] * RC30
+    ldc, ddc, lddc = canonical_codes(ld), canonical_codes(dd), canonical_codes(ldd)
+
+    packed = []
+    for part in tokens:
+        bw = BitWriter()
+        if not packed:
+            bw.Put(0, 2)        # LZ block, previous table discarded
+            _write_table(bw, ld + dd + ldd + rd)
+        for token in part:
+            if isinstance(token, int):
+                bw.Put(ldc[token], ld[token])
+                continue
+            length, dist = token
+            ls = _slot(lslots, length)
+            ds = _slot(dslots, dist)
+            bw.Put(ldc[271 + ls], ld[271 + ls])
+            if lslots[ls][1]:
+                bw.Put(length - lslots[ls][0], lslots[ls][1])
+            bw.Put(ddc[ds], dd[ds])
+            bits = dslots[ds][1]
+            dextra = dist - dslots[ds][0]
+            if ds > 9:
+                if bits > 4:
+                    bw.Put(dextra >> 4, bits - 4)
+                bw.Put(lddc[dextra & 0xf], ldd[dextra & 0xf])
+            elif bits:
+                bw.Put(dextra, bits)
+        bw.Put(ldc[256], ld[256])
+        bw.Put(0, 2)            # end of file, the tables carry on
+        packed.append(bw.Data())
+    return packed
+
+
+def member_name(i):
+    return "dir%04d/file%07d.txt" % (i % 1000, i)
+
+
+def header_members(count):
+    # a few bytes each, so headers are all there is to read
+    for i in range(count):
+        yield member_name(i), b"%d" % i
+
+
+def write_archive(path, members, fmt = 3, compress = False, winbits = 6, solid = False):
+    # members are (name, data) pairs; compressed members are RAR 2.9 LZ
+    # with a 64 KB << winbits window, so RAR 3.x archives only
+    if compress and fmt == 5:
+        raise ValueError("compressed members are only generated for RAR 3.x")
+    packed = None
+    if compress and solid:
+        members = list(members)
+        packed = compress29_solid([data for _, data in members], 0x10000 << winbits)
+    with open(path, "wb") as out:
+        if fmt == 5:
+            out.write(b"Rar!\x1a\x07\x01\x00" + block5(1, 0, vint(0)))
+        else:
+            out.write(b"Rar!\x1a\x07\x00" + block3(0x73, 0x0008 if packed else 0, bytes(6)))
+        for i, (name, data) in enumerate(members):
+            name = name.encode()
+            crc = zlib.crc32(data)
+            if fmt == 5:
+                body = vint(0x6) + vint(len(data)) + vint(0o100644) + struct.pack("<II", 1600000000, crc)
+                out.write(block5(2, 0, body + vint(0) + vint(1) + vint(len(name)) + name, len(data)))
+            else:
+                flags = 0x8000 | (winbits << 5)
+                if packed:
+                    flags |= 0x0010 if i else 0
+                    unpsize, data = len(data), packed[i]
+                else:
+                    unpsize = len(data)
+                    data = compress29(data, 0x10000 << winbits) if compress else data
+                body = struct.pack("<IIBIIBBHI", len(data), unpsize, 3, crc, 0x50221866,
+                                   29, 0x33 if compress else 0x30, len(name), 0o100644)
+                out.write(block3(0x74, flags, body + name))
+            out.write(data)
+        out.write(block5(5, 0, vint(0)) if fmt == 5 else block3(0x7b, 0x4000, b""))
@@ -0,0 +1,154 @@
+import argparse
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+from itertools import zip_longest
+from unpack import DecodeTable, LARGEST_TABLE_SIZE
+
+# A table dump is DUMP_MAGIC and then a record per member: the name and a
+# fixed size entry per decode table with MaxNum, QuickBits, a CRC32 of the
+# 15 bit lookup table and the DecodeLen, DecodePos and DecodeNum arrays,
+# all little endian. The quick tables of the old TSV log follow from
+# these and are rebuilt when reading, so a member is a few KB
+
+DUMP_MAGIC = b"RARTBL\x00\x01"
+DUMP_SUFFIX = ".tbl"
+_RECORD = struct.Struct("<HB")
+_TABLE = struct.Struct("<4sIBI16I16I%dH" % LARGEST_TABLE_SIZE)
+_FIELDS = ("MaxNum", "QuickBits", "TableCRC", "DecodeLen", "DecodePos", "DecodeNum")
+
+TableRecord = namedtuple("TableRecord", ("Name",) + _FIELDS)
+
+
+def table_lines(filename, name, table):
+    # one table in the TSV log layout
+    row = "%s\t%s\t%%s\t%%d\t%%d" % (filename, name)
+    yield row % ("MaxNum", 0, table.MaxNum)
+    for field in ("DecodeLen", "DecodePos"):
+        for i, v in enumerate(getattr(table, field)):
+            yield row % (field, i, v)
+    yield row % ("QuickBits", 0, table.QuickBits)
+    for field in ("QuickLen", "QuickNum", "DecodeNum"):
+        for i, v in enumerate(getattr(table, field)):
+            yield row % (field, i, v)
+
+
+def table_crc(table):
+    data = array("H", table.Table)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return zlib.crc32(data)
+
+
+class TableDump:
+    # writes a dump, one Write per member
+    def __init__(self, filename):
+        self.__out = open(filename, "wb")
+        self.__out.write(DUMP_MAGIC)
+
+    def Write(self, filename, tables):
+        name = filename.encode("utf-8", "surrogatepass")
+        parts = [_RECORD.pack(len(name), len(tables)), name]
+        for k, t in tables.items():
+            parts.append(_TABLE.pack(k.encode(), t.MaxNum, t.QuickBits, table_crc(t),
+                                     *t.DecodeLen, *t.DecodePos, *t.DecodeNum))
+        self.__out.write(b"".join(parts))
+
+    def close(self):
+        self.__out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_dump(f):
+    # (member name, [TableRecord]) for each record of the dump in f
+    if f.read(len(DUMP_MAGIC)) != DUMP_MAGIC:
+        raise ValueError("not a table dump")
+    while True:
+        head = f.read(_RECORD.size)
+        if not head:
+            return
+        try:
+            namelen, count = _RECORD.unpack(head)
+            name = f.read(namelen)
+            entries = [_TABLE.unpack(f.read(_TABLE.size)) for _ in range(count)]
+        except struct.error:
+            raise EOFError("table dump ends inside a record") from None
+        yield name.decode("utf-8", "surrogatepass"), [
+            TableRecord(v[0].rstrip(b"\0").decode(), v[1], v[2], v[3], v[4:20], v[20:36], v[36:]) for v in entries]
+
+
+def record_table(record):
+    # a DecodeTable with the dumped arrays, enough for the quick tables
+    table = DecodeTable()
+    table.MaxNum = record.MaxNum
+    table.QuickBits = record.QuickBits
+    table.DecodeLen[:] = array("I", record.DecodeLen)
+    table.DecodePos[:] = array("I", record.DecodePos)
+    table.DecodeNum[:] = array("H", record.DecodeNum)
+    return table
+
+
+def dump_lines(f):
+    for name, records in read_dump(f):
+        for record in records:
+            yield from table_lines(name, record.Name, record_table(record))
+
+
+def diff_dumps(a, b):
+    # (member, table, field, index, a value, b value) for every difference;
+    # members and tables are paired in order, a member only one dump has
+    # is listed as missing from the other
+    for left, right in zip_longest(a, b):
+        if right is None:
+            yield left[0], "", "member", 0, "present", "missing"
+            continue
+        if left is None:
+            yield right[0], "", "member", 0, "missing", "present"
+            continue
+        (name, records), (othername, others) = left, right
+        if name != othername:
+            yield name, "", "Filename", 0, name, othername
+            continue
+        for r, o in zip(records, others):
+            for field in _FIELDS:
+                x, y = getattr(r, field), getattr(o, field)
+                if x == y:
+                    continue
+                if isinstance(x, tuple):
+                    for i, (u, v) in enumerate(zip(x, y)):
+                        if u != v:
+                            yield name, r.Name, field, i, u, v
+                else:
+                    yield name, r.Name, field, 0, x, y
+        if len(records) != len(others):
+            yield name, "", "tables", 0, len(records), len(others)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a table dump as the TSV log, or compare two dumps")
+    parser.add_argument("dump")
+    parser.add_argument("other", nargs="?",
+                        help="list the differences between the two dumps instead")
+    args = parser.parse_args()
+    out = sys.stdout
+    with open(args.dump, "rb") as f:
+        if args.other is None:
+            for line in dump_lines(f):
+                out.write(line + "\n")
+            return 0
+        with open(args.other, "rb") as g:
+            differences = 0
+            for difference in diff_dumps(read_dump(f), read_dump(g)):
+                out.write("%s\t%s\t%s\t%d\t%s\t%s\n" % difference)
+                differences += 1
+    return 1 if differences else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+import os
+import sys
+
+# the modules sit at the top of the tree, not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# files/ holds archives made by RAR itself, taken from the test suite of
+# rarfile 4.5 (ISC licence, see files/LICENSE.rarfile)
+FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files")
+
+
+def fixture(name):
+    return os.path.join(FILES, name)
@@ -0,0 +1,145 @@
+import os
+import zlib
+import pytest
+from conftest import fixture
+from archive import open_archive, read_signature, extract_member, FILE_HEADERS
+from archive import test_member as check_member
+from batch import archive_destinations
+from crc import Blake2sp
+from main import test_file as check_file
+from parallel import extract_parallel
+from reader import Archive
+from solid import SolidDecoder
+from structs import LHD_SOLID
+from synth import write_archive, text_data
+from volume import read_volumes
+
+# (archive, what it covers, member count)
+GOOD = (
+    ("rar3-solid.rar", "RAR 3.x solid with VM filters", 2),
+    ("rar5-solid.rar", "RAR5 solid with filters", 2),
+    ("rar3-vols.part1.rar", "RAR 3.x volume set", 2),
+    ("rar5-vols.part1.rar", "RAR5 volume set", 2),
+    ("seektest.rar", "RAR 3.x VM filters", 2),
+    ("rar5-crc.rar", "RAR5 filters with CRC32", 2),
+    ("rar5-blake.rar", "RAR5 with BLAKE2sp", 2),
+    ("unicode.rar", "RAR 3.x PPMd", 2),
+    ("rar3-subdirs.rar", "RAR 3.x directories", 10),
+    ("rar5-quick-open.rar", "RAR5 quick open", 2),
+    ("rar3-comment-plain.rar", "RAR 3.x comment headers", 2),
+)
+
+
+def file_headers(f, path):
+    # later volumes close as the scan moves on, decode members as they come
+    fmt = read_signature(f)
+    return (h for h in read_volumes(f, path, True, fmt) if h.HeaderType in FILE_HEADERS)
+
+
+def headers(name):
+    # only for the header fields, the data goes with the file
+    with open(fixture(name), "rb") as f:
+        return list(file_headers(f, fixture(name)))
+
+
+def check_data(h, data):
+    # the data against the checksum RAR stored for it
+    assert len(data) == h.UnpSize
+    if h.FileCRC is not None:
+        assert zlib.crc32(data) == h.FileCRC
+    if h.Hash is not None:
+        blake = Blake2sp()
+        blake.Update(data)
+        assert blake.Value == h.Hash
+
+
+@pytest.mark.parametrize("name,covers,count", GOOD)
+def test_test_file(name, covers, count, capsys):
+    assert check_file(fixture(name)) == 0
+    out = capsys.readouterr().out
+    assert "FAILED" not in out and "not verified" not in out
+
+
+@pytest.mark.parametrize("name,covers,count", GOOD)
+def test_members(name, covers, count):
+    decoder = SolidDecoder()
+    found = 0
+    with open_archive(fixture(name)) as f:
+        for h in file_headers(f, fixture(name)):
+            check_member(h, decoder)
+            found += 1
+    assert found == count
+
+
+@pytest.mark.parametrize("name,covers,count", GOOD)
+def test_archive_read(name, covers, count):
+    members = [h for h in headers(name) if not h.IsDirectory]
+    with Archive(fixture(name)) as archive:
+        assert len(archive.namelist()) == count
+        # backwards, so solid members are decoded out of order
+        for h in reversed(members):
+            check_data(h, archive.read(h.Filename))
+
+
+@pytest.mark.parametrize("name", ("rar3-solid.rar", "rar5-solid.rar", "rar5-vols.part1.rar", "seektest.rar"))
+def test_extract_parallel(name, tmp_path):
+    serial = tmp_path / "serial"
+    decoder = SolidDecoder()
+    with open_archive(fixture(name)) as f:
+        for h in file_headers(f, fixture(name)):
+            extract_member(h, str(serial), decoder)
+    extract_parallel(fixture(name), str(tmp_path / "parallel"), 2)
+    for h in headers(name):
+        if not h.IsDirectory:
+            a = (serial / h.Filename).read_bytes()
+            assert a == (tmp_path / "parallel" / h.Filename).read_bytes()
+            check_data(h, a)
+
+
+def test_solid_checkpoints(tmp_path):
+    path = str(tmp_path / "solid.rar")
+    members = [("m%02d.txt" % i, text_data(3000 + i * 97, i)) for i in range(24)]
+    write_archive(path, members, compress=True, solid=True)
+    with Archive(path, checkpoint=5) as archive:
+        assert all(archive.getinfo(n).Flags & LHD_SOLID for n, _ in members[1:])
+        for i in (17, 3, 23, 9, 9, 0, 12):
+            assert archive.read(members[i][0]) == members[i][1]
+        other = archive.clone()
+        try:
+            assert other.read(members[21][0]) == members[21][1]
+        finally:
+            other.close()
+
+
+def test_extended_time():
+    # the fraction is in 100 ns units; unrar lists 23:13:58,1254531
+    h = next(h for h in headers("rar3-symlink-unix.rar") if h.Filename == "data_link")
+    assert h.ModifiedDate.isoformat() == "2020-07-26T23:13:58.125453"
+
+
+def test_backslash_names(tmp_path):
+    decoder = SolidDecoder()
+    with open_archive(fixture("rar3-subdirs.rar")) as f:
+        for h in file_headers(f, fixture("rar3-subdirs.rar")):
+            extract_member(h, str(tmp_path), decoder)
+    assert (tmp_path / "sub" / "dir1" / "file1.txt").is_file()
+    assert not any("\\" in p for p in os.listdir(tmp_path))
+
+
+def test_blake2sp_chunks():
+    data = text_data(200000, 7)
+    whole = Blake2sp()
+    whole.Update(data)
+    for size in (1, 63, 64, 511, 512, 4097):
+        blake = Blake2sp()
+        for i in range(0, len(data), size * 37):
+            blake.Update(data[i:i + size * 37])
+        assert blake.Value == whole.Value
+    assert Blake2sp().Value.hex().startswith("dd0e8917")
+
+
+def test_archive_destinations():
+    archives = [(os.path.join("d1", "x.rar"), "d1"), (os.path.join("d2", "x.rar"), "d2"), ("y.rar", "")]
+    destinations, renamed = archive_destinations(archives, "out")
+    assert destinations == [os.path.join("out", "x"), os.path.join("out", "x-2"), os.path.join("out", "y")]
+    assert renamed == [(os.path.join("d2", "x.rar"), os.path.join("out", "x-2"))]
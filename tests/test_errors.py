@@ -0,0 +1,139 @@
+import os
+import struct
+import subprocess
+import sys
+import pytest
+from conftest import ROOT, fixture
+from main import read_file
+from main import test_file as check_file
+from reader import Archive
+from structs import FormatError
+from structs5 import BaseBlock5, FileHeader5
+from tabledump import diff_dumps
+from synth import write_archive, block5, vint, text_data
+
+
+def corrupt(tmp_path, name, offset, value):
+    # a copy of fixture name with one byte changed
+    data = bytearray(open(fixture(name), "rb").read())
+    data[offset] = value
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def stored_archive(tmp_path):
+    # three stored members, the middle one with a bad byte
+    members = [("a.txt", text_data(2000, 1)), ("b.txt", text_data(3000, 2)), ("c.txt", text_data(1000, 3))]
+    path = tmp_path / "stored.rar"
+    write_archive(str(path), members)
+    data = bytearray(path.read_bytes())
+    data[data.index(members[1][1]) + 100] ^= 0xff
+    path.write_bytes(data)
+    return str(path), members
+
+
+def run_main(*args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, "main.py")] + list(args),
+                          capture_output=True, cwd=ROOT)
+
+
+@pytest.mark.parametrize("name", ("rar3-comment-hpsw.rar", "rar5-hpsw.rar"))
+def test_encrypted_headers(name, capsys):
+    assert check_file(fixture(name)) == 1
+    assert "encrypted headers are not supported" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("name", ("rar3-comment-psw.rar", "rar5-psw.rar"))
+def test_encrypted_members(name, capsys):
+    assert check_file(fixture(name)) == 2
+    assert capsys.readouterr().out.count("FAILED: encrypted files are not supported") == 2
+    with Archive(fixture(name)) as archive:
+        with pytest.raises(NotImplementedError):
+            archive.read(archive.namelist()[0])
+
+
+def test_unsupported_version(capsys):
+    # the second member is stored and still tests
+    assert check_file(fixture("rar15-comment.rar")) == 1
+    out = capsys.readouterr().out
+    assert "FILE1.TXT: unpack version 1.5 is not supported" in out and out.count(" OK") == 1
+
+
+def test_unknown_header_type(tmp_path, capsys):
+    # the type byte of the main header
+    assert check_file(corrupt(tmp_path, "rar3-comment-plain.rar", 9, 0x3a)) == 1
+    assert "unknown header type 58" in capsys.readouterr().out
+
+
+def test_bad_header_size5(tmp_path, capsys):
+    # the size of the main header, right after its CRC
+    assert check_file(corrupt(tmp_path, "rar5-blake.rar", 12, 0)) == 1
+    assert "bad header size 0" in capsys.readouterr().out
+    with pytest.raises(FormatError):
+        Archive(corrupt(tmp_path, "rar5-blake.rar", 12, 0))
+
+
+def test_bad_member(tmp_path, capsys):
+    path, members = stored_archive(tmp_path)
+    assert check_file(path) == 1
+    out = capsys.readouterr().out
+    assert "b.txt: CRC mismatch" in out and out.count(" OK") == 2
+
+
+def test_extract_bad_member(tmp_path, capsys):
+    path, members = stored_archive(tmp_path)
+    destination = tmp_path / "out"
+    assert read_file(path, destination=str(destination)) == 1
+    assert "FAILED" in capsys.readouterr().out
+    # the members after the bad one still come out
+    assert (destination / "a.txt").read_bytes() == members[0][1]
+    assert (destination / "c.txt").read_bytes() == members[2][1]
+
+
+def test_extract_encrypted(tmp_path):
+    destination = tmp_path / "out"
+    assert read_file(fixture("rar5-psw.rar"), destination=str(destination)) == 1
+    assert not os.path.exists(destination) or not os.listdir(destination)
+
+
+def test_symlink_traversal(tmp_path, capsys):
+    destination = tmp_path / "out"
+    assert read_file(fixture("rar5-evil-symlink-traversal.rar"), destination=str(destination)) == 0
+    assert "skipped, symbolic link" in capsys.readouterr().out
+    assert not os.path.islink(destination / "up")
+    assert (destination / "up" / "pwned.txt").is_file()
+    assert not (tmp_path / "pwned.txt").exists()
+
+
+def test_pipe_bad_member(tmp_path):
+    path, members = stored_archive(tmp_path)
+    result = run_main("-p", "b.txt", path)
+    assert result.returncode == 1
+    assert b"CRC mismatch" in result.stderr and b"no member named" not in result.stderr
+
+
+def test_pipe_missing_member(tmp_path):
+    path, members = stored_archive(tmp_path)
+    result = run_main("-p", "nothing.txt", path)
+    assert result.returncode == 1
+    assert b"no member named nothing.txt" in result.stderr
+    result = run_main("-p", "c.txt", path)
+    assert result.returncode == 0 and result.stdout == members[2][1]
+
+
+def test_dictionary_limit():
+    # a solid RAR 7 member asking for a 2^48 byte dictionary
+    compinfo = 0x40 | (3 << 7) | (31 << 10)
+    body = vint(0x6) + vint(1000) + vint(0o100644) + struct.pack("<II", 1600000000, 0)
+    body += vint(compinfo) + vint(1) + vint(5) + b"x.txt"
+    h = FileHeader5(BaseBlock5(raw=block5(2, 0, body, 10)))
+    assert h.WinSize == 1 << 48
+    with pytest.raises(NotImplementedError, match="dictionary"):
+        h.CreateUnpacker()
+
+
+def test_diff_missing_member():
+    a = [("a.txt", []), ("b.txt", [])]
+    assert list(diff_dumps(a, a[:1])) == [("b.txt", "", "member", 0, "present", "missing")]
+    assert list(diff_dumps(a[:1], a)) == [("b.txt", "", "member", 0, "missing", "present")]
@@ -1,12 +1,25 @@
-from bitreader import BitReader
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from accel import _accel
+from bitreader import BitReader, READ_SIZE
+from filters import UnpackFilter, FILTER_NONE, VM_MEMSIZE, MAX3_UNPACK_CHANNELS
+from filters import read_vm_data, vm_filter_type, execute_filter30
+from ppm import ModelPPM
+import stats
 
 MAX_QUICK_DECODE_BITS = 10
+DECODE_TABLE_BITS = 15
 MAX_UNPACK_FILTERS = 8192
 MAX3_UNPACK_FILTERS = 8192
-MAX3_UNPACK_CHANNELS = 1024
 MAX_FILTER_BLOCK_SIZE = 0x400000
 UNPACK_MAX_WRITE = 0x400000
 
+TABLE_CACHE_ENV = "MINIRAR_TABLE_CACHE"
+TABLE_CACHE_SIZE = 64
+TABLE_POOL_SIZE = 20
+
 NC    = 306
 DC    = 64
 LDC   = 16
@@ -23,66 +36,368 @@ HUFF_TABLE_SIZE30 = NC30 + DC30 + RC30 + LDC30
 
 LARGEST_TABLE_SIZE = 306
 
+MAX_LZ_MATCH = 0x1001
+MAX_INC_LZ_MATCH = MAX_LZ_MATCH + 3
+LOW_DIST_REP_COUNT = 16
+INPUT_CHECK_BYTES = 16
+INPUT_CHECK_RATIO = 8
+
+BLOCK_LZ = 0
+BLOCK_PPM = 1
+
 LDecode = (0,1,2,3,4,5,6,7,8,10,12,14,16,20,24,28,32,40,48,56,64,80,96,112,128,160,192,224)
 LBits = (0,0,0,0,0,0,0,0,1,1,1,1,2,2,2,2,3,3,3,3,4,4,4,4,5,5,5,5)
 DBitLengthCounts = (4,2,2,2,2,2,2,2,2,2,2,2,2,2,2,2,14,0,12)
 SDDecode = (0,4,8,16,32,64,128,192)
 SDBits = (2,2,3,4,5,6,6,6)
+BLOCK_TABLES = ("LD", "DD", "LDD", "RD", "BD")
+
+
+def _distance_slots():
+    # base distance and extra bits of each RAR 3.x distance slot, padded to DC
+    ddecode, dbits = [0] * DC, [0] * DC
+    dist = 0
+    slot = 0
+    for bitlength, count in enumerate(DBitLengthCounts):
+        for _ in range(count):
+            ddecode[slot] = dist
+            dbits[slot] = bitlength
+            slot += 1
+            dist += 1 << bitlength
+    return tuple(ddecode), tuple(dbits)
+
+
+DDecode, DBits = _distance_slots()
+
+
+def copy_string(window, winsize, unpptr, length, distance):
+    src = (unpptr - distance) & (winsize - 1)
+    if src + length <= winsize and unpptr + length <= winsize:
+        if distance >= length:
+            window[unpptr:unpptr+length] = window[src:src+length]
+        elif src < unpptr:
+            pattern = window[src:unpptr]
+            window[unpptr:unpptr+length] = (pattern * (length // distance + 1))[:length]
+        else:
+            for i in range(length):
+                window[unpptr+i] = window[src+i]
+        return
+    mask = winsize - 1
+    for _ in range(length):
+        window[unpptr] = window[src]
+        src = (src + 1) & mask
+        unpptr = (unpptr + 1) & mask
+
+
+def window_block(window, winsize, start, length):
+    end = start + length
+    if end <= winsize:
+        return bytearray(window[start:end])
+    return bytearray(window[start:]) + window[:end - winsize]
+
+
+class TableCache:
+    # built tables keyed by size and code lengths, least recently used
+    # dropped first. A table is copied in only when its lengths come round
+    # a second time, so one-off tables cost a key and nothing more. About
+    # 66 KB an entry, nearly all of it the Table
+    def __init__(self, maxentries = TABLE_CACHE_SIZE):
+        self.__entries = OrderedDict()
+        self.__seen = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__maxentries = maxentries
+        self.__hits = 0
+        self.__misses = 0
+
+    def Load(self, key, table):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return False
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+        table.DecodeLen[:], table.DecodePos[:], table.DecodeNum[:], table.Table[:] = entry
+        return True
+
+    def Store(self, key, table):
+        if self.__maxentries <= 0:
+            return
+        with self.__lock:
+            if self.__seen.pop(key, None) is None:
+                self.__seen[key] = True
+                if len(self.__seen) > 4 * self.__maxentries:
+                    self.__seen.popitem(last=False)
+                return
+        entry = (array('I', table.DecodeLen), array('I', table.DecodePos),
+                 array('H', table.DecodeNum), array('H', table.Table))
+        with self.__lock:
+            self.__entries[key] = entry
+            while len(self.__entries) > self.__maxentries:
+                self.__entries.popitem(last=False)
+
+    def Clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__seen.clear()
+            self.__hits = 0
+            self.__misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def MaxEntries(self):
+        return self.__maxentries
+
+    @property
+    def Hits(self):
+        return self.__hits
+
+    @property
+    def Misses(self):
+        return self.__misses
+
+
+TABLE_CACHE = TableCache(int(os.environ.get(TABLE_CACHE_ENV, TABLE_CACHE_SIZE)))
+
 
 class DecodeTable:
     def __init__(self):
         self.MaxNum = 0
-        self.DecodeLen = [0] * 16
-        self.DecodePos = [0] * 16
+        self.DecodeLen = array('I', bytes(4 * 16))
+        self.DecodePos = array('I', bytes(4 * 16))
+        self.QuickBits = 0
+        self.DecodeNum = array('H', bytes(2 * LARGEST_TABLE_SIZE))
+        self.Table = array('H', bytes(2 << DECODE_TABLE_BITS))
+        self.__quicklen = None
+        self.__quicknum = None
+
+    def Reset(self):
+        # back to how a new table starts, without allocating
+        self.MaxNum = 0
         self.QuickBits = 0
-        self.QuickLen = [0] * (1 << MAX_QUICK_DECODE_BITS)
-        self.QuickNum = [0] * (1 << MAX_QUICK_DECODE_BITS)
-        self.DecodeNum = [0] * LARGEST_TABLE_SIZE
+        self.DecodeLen[:] = _ZERO_DECODELEN
+        self.DecodePos[:] = _ZERO_DECODELEN
+        self.DecodeNum[:] = _ZERO_DECODENUM
+        self.Table[:] = _ZERO_TABLE
+        self.__quicklen = None
+        self.__quicknum = None
+
+    def Build(self, lengthtable, size):
+        self.MaxNum = size
+        if size in (NC, NC30):
+            self.QuickBits = MAX_QUICK_DECODE_BITS
+        else:
+            self.QuickBits = MAX_QUICK_DECODE_BITS - 3
+        self.__quicklen = None
+        self.__quicknum = None
+        # blocks and small members keep sending the same lengths, the BD
+        # table most of all, and a copy is far cheaper than a build
+        key = (size, bytes(lengthtable[:size]))
+        if TABLE_CACHE.Load(key, self):
+            return
+        self.__build(lengthtable, size)
+        TABLE_CACHE.Store(key, self)
+
+    def __build(self, lengthtable, size):
+        if _accel is not None:
+            _accel.build_table(lengthtable, size, self.DecodeLen, self.DecodePos, self.DecodeNum, self.Table)
+            return
+        buckets = [[] for _ in range(16)]
+        for i in range(size):
+            buckets[lengthtable[i] & 0xf].append(i)
+        decodelen = self.DecodeLen
+        decodepos = self.DecodePos
+        decodenum = []
+        decodelen[0] = 0
+        decodepos[0] = 0
+        upperlimit = 0
+        for i in range(1, 16):
+            upperlimit += len(buckets[i])
+            decodelen[i] = upperlimit << (16 - i)
+            upperlimit *= 2
+            decodepos[i] = decodepos[i-1] + (len(buckets[i-1]) if i > 1 else 0)
+            decodenum += buckets[i]
+        self.DecodeNum[:] = array('H', decodenum) + array('H', bytes(2 * (LARGEST_TABLE_SIZE - len(decodenum))))
+        # every 15 bit prefix maps straight to (symbol << 4) | length,
+        # canonical codes fill the table in DecodeNum order
+        table = self.Table
+        tablesize = len(table)
+        pos = 0
+        for length in range(1, 16):
+            span = 1 << (DECODE_TABLE_BITS - length)
+            for symbol in buckets[length]:
+                if pos >= tablesize:
+                    break
+                table[pos:pos+span] = array('H', ((symbol << 4) | length,)) * min(span, tablesize - pos)
+                pos += span
+        if pos < tablesize:
+            # unused codes decode like DecodeNumber does: past the assigned
+            # symbols DecodeNum reads zero, past MaxNum it falls back to slot 0
+            fill = min(tablesize - pos, size - len(decodenum))
+            table[pos:pos+fill] = array('H', (15,)) * fill
+            pos += fill
+            table[pos:] = array('H', ((self.DecodeNum[0] << 4) | 15,)) * (tablesize - pos)
+
+    def Decode(self, bitreader):
+        return bitreader.DecodeEntry(self.Table)
+
+    def __makequicktables(self):
+        quickdatasize = 1 << self.QuickBits
+        self.__quicklen = array('B', bytes(1 << MAX_QUICK_DECODE_BITS))
+        self.__quicknum = array('H', bytes(2 << MAX_QUICK_DECODE_BITS))
+        curbitlength = 1
+        for code in range(quickdatasize):
+            bitfield = code << (16 - self.QuickBits)
+            while curbitlength < len(self.DecodeLen) and \
+                  bitfield >= self.DecodeLen[curbitlength]:
+                curbitlength += 1
+            self.__quicklen[code] = curbitlength
+            dist = bitfield - self.DecodeLen[curbitlength - 1]
+            dist >>= (16 - curbitlength)
+            if curbitlength < len(self.DecodePos):
+                pos = self.DecodePos[curbitlength] + dist
+                if pos < self.MaxNum:
+                    self.__quicknum[code] = self.DecodeNum[pos]
+
+    @property
+    def QuickLen(self):
+        if self.__quicklen is None:
+            self.__makequicktables()
+        return self.__quicklen
+
+    @property
+    def QuickNum(self):
+        if self.__quicknum is None:
+            self.__makequicktables()
+        return self.__quicknum
+
+
+_ZERO_DECODELEN = array('I', bytes(4 * 16))
+_ZERO_DECODENUM = array('H', bytes(2 * LARGEST_TABLE_SIZE))
+_ZERO_TABLE = array('H', bytes(2 << DECODE_TABLE_BITS))
+
+
+class TablePool:
+    # DecodeTables given back by decoders that are done, for the next
+    # decoder to take instead of allocating five 64 KB lookup tables per
+    # member. Only the owner of a decoder may give its tables back, and
+    # must not use the decoder afterwards
+    def __init__(self, maxtables = TABLE_POOL_SIZE):
+        self.__free = []
+        self.__lock = threading.Lock()
+        self.__maxtables = maxtables
+
+    def Take(self):
+        with self.__lock:
+            table = self.__free.pop() if self.__free else None
+        if table is None:
+            return DecodeTable()
+        table.Reset()
+        return table
+
+    def Give(self, tables):
+        with self.__lock:
+            for table in tables:
+                if len(self.__free) >= self.__maxtables:
+                    break
+                self.__free.append(table)
+
+    def __len__(self):
+        return len(self.__free)
+
+
+TABLE_POOL = TablePool()
+
+
+def block_tables():
+    return {name: TABLE_POOL.Take() for name in BLOCK_TABLES}
 
 
 class Unpack29:
-    def __init__(self, data):
-        self.__DDecode = [0] * 64 ## DC
-        self.__DBits = [0] * 64
+    def __init__(self, data, winsize = 0x400000, source = None):
         self.__Bits = 0
-        self.__initarrays()
         self.__bitreader : BitReader = None
+        self.__readtop = 0
+        self.__readborder = 0
         self.__tablesread3 = False
-        self.__unpackblocktables = {
-            "LD": DecodeTable(),
-            "DD": DecodeTable(),
-            "LDD": DecodeTable(),
-            "RD": DecodeTable(),
-            "BD": DecodeTable()
-        }
+        self.__blocktype = BLOCK_LZ
+        self.__unpoldtable = bytearray(HUFF_TABLE_SIZE30)
+        self.__winsize = winsize
+        self.__window = None
+        self.__unpptr = 0
+        self.__wrptr = 0
+        self.__olddist = [0] * 4
+        self.__lastlength = 0
+        self.__written = 0
+        self.__destsize = 0
+        self.__unpackblocktables = block_tables()
         self.__prevlowdist = 0
         self.__lowdistrepcount = 0
-        if data is not None:
-            self.__bitreader = BitReader(data)
-            self.__readTables30()
-
-    def __initarrays(self):
-        if self.__DDecode[1] == 0:
-            Dist = 0
-            BitLength = 0
-            Slot = 0
-            for I in range(len(DBitLengthCounts)):
-                for _ in range(DBitLengthCounts[I]):
-                    self.__DDecode[Slot] = Dist
-                    self.__DBits[Slot] = BitLength
-                    Slot += 1
-                    Dist += (1 << BitLength)
-                BitLength += 1
+        self.__filters30 = []
+        self.__oldfilterlengths = []
+        self.__lastfilter = 0
+        self.__prgstack = []
+        self.__ppm = None
+        self.__blockok = False
+        if data or source is not None:
+            self.SetInput(data, source)
 
+    def __getstate__(self):
+        # what a solid member leaves the next one, for checkpoints; the
+        # input comes with SetInput and a BitReader does not pickle
+        bitreader, self.__bitreader = self.__bitreader, None
+        state = self.__dict__.copy()
+        self.__bitreader = bitreader
+        return state
+
+    def SetInput(self, data, source = None):
+        # solid members continue in the same window with the old tables,
+        # only the packed input is replaced. Without LZ tables to go on
+        # with, the member opens with a block header
+        self.__bitreader = None
+        self.__initfilters30(True)
+        self.__blockok = False
+        if data or source is not None:
+            self.__bitreader = BitReader(data, source)
+            self.__readbuf()
+            self.__blockok = self.__tablesread3 or self.__readTables30()
+
+    def __readbuf(self):
+        br = self.__bitreader
+        if br.Addr > br.Size:
+            return False
+        if br.Streaming:
+            br.Fill(READ_SIZE)
+        self.__readtop = br.Size
+        self.__readborder = br.Size - 30 - INPUT_CHECK_BYTES * INPUT_CHECK_RATIO if br.Streaming else br.Size
+        return br.Addr <= br.Size
+
+    def __getchar(self):
+        br = self.__bitreader
+        if br.Addr > self.__readborder:
+            self.__readbuf()
+        return br.GetBits(8)
+
+    @stats.timed("tables")
     def __readTables30(self):
         BitLength = bytearray(BC)
         Table = bytearray(HUFF_TABLE_SIZE30)
-        UnpOldTable = bytearray(HUFF_TABLE_SIZE30)
+        UnpOldTable = self.__unpoldtable
+        if self.__bitreader.Addr > self.__readtop - 25:
+            if not self.__readbuf():
+                return False
+        self.__bitreader.AddBits((8 - self.__bitreader.Bit) & 7)
         BitField = self.__bitreader.Read16()
         if BitField & 0x8000:
-            pass # BLOCK_PPM
+            self.__blocktype = BLOCK_PPM
+            if self.__ppm is None:
+                self.__ppm = ModelPPM()
+            return self.__ppm.DecodeInit(self.__getchar)
+        self.__blocktype = BLOCK_LZ
         if (BitField & 0x4000) == 0: ##reset old table
-            UnpOldTable = bytearray(HUFF_TABLE_SIZE30)
+            UnpOldTable[:] = bytes(HUFF_TABLE_SIZE30)
         self.__prevlowdist = 0
         self.__lowdistrepcount = 0
         self.__bitreader.AddBits(2)
@@ -105,11 +420,14 @@ class Unpack29:
             else:
                 BitLength[I] = Length
             I += 1
-        self.__makedecodetables(BitLength,self.__unpackblocktables["BD"], BC30)
+        self.__unpackblocktables["BD"].Build(BitLength, BC30)
         tablesize = HUFF_TABLE_SIZE30
         i = 0
         while i < tablesize:
-            number = self.__decodenumber(self.__unpackblocktables["BD"])
+            if self.__bitreader.Addr > self.__readtop - 5:
+                if not self.__readbuf():
+                    return False
+            number = self.__unpackblocktables["BD"].Decode(self.__bitreader)
             if number < 16:
                 Table[i] = (number + UnpOldTable[i]) & 0xf
                 i += 1
@@ -142,86 +460,413 @@ class Unpack29:
                         Table[i] = 0
                         i += 1
         self.__tablesread3 = True
-        self.__makedecodetables(Table, self.__unpackblocktables['LD'], NC30)
-        self.__makedecodetables(Table[NC30:], self.__unpackblocktables['DD'], DC30)
-        self.__makedecodetables(Table[NC30+DC30:], self.__unpackblocktables['LDD'], LDC30)
-        self.__makedecodetables(Table[NC30+DC30+LDC30:], self.__unpackblocktables['RD'], RC30)
+        if self.__bitreader.Addr > self.__readtop:
+            return False
+        self.__unpackblocktables['LD'].Build(Table, NC30)
+        self.__unpackblocktables['DD'].Build(Table[NC30:], DC30)
+        self.__unpackblocktables['LDD'].Build(Table[NC30+DC30:], LDC30)
+        self.__unpackblocktables['RD'].Build(Table[NC30+DC30+LDC30:], RC30)
         UnpOldTable[:] = Table
         return True
 
-    def __makedecodetables(self, lengthtable, decodetable : DecodeTable, size):
-        decodetable.MaxNum = size
-        lengthcount = [0] * 16
-        for i in range(size):
-            lengthcount[lengthtable[i] & 0xf] += 1
-        lengthcount[0] = 0
-        decodetable.DecodeNum = [0] * len(decodetable.DecodeNum)
-        decodetable.DecodePos[0] = 0
-        decodetable.DecodeLen[0] = 0
-        upperlimit = 0
-        for i in range(1,16):
-            upperlimit += lengthcount[i]
-            leftaligned = upperlimit << (16-i)
-            upperlimit *= 2
-            decodetable.DecodeLen[i] = leftaligned
-            decodetable.DecodePos[i] = decodetable.DecodePos[i-1]+lengthcount[i-1]
-        copydecodepos = [0] * len(decodetable.DecodePos)
-        copydecodepos[:] = decodetable.DecodePos
-        for i in range(size):
-            curbitlength = lengthtable[i] & 0xf
-            if curbitlength !=0:
-                LastPos = copydecodepos[curbitlength]
-                decodetable.DecodeNum[LastPos] = i
-                copydecodepos[curbitlength] += 1
-        if size in (NC, NC30):
-            decodetable.QuickBits = MAX_QUICK_DECODE_BITS
+    def Unpack(self, write, destsize):
+        for chunk in self.Chunks(destsize):
+            write(chunk)
+        return min(self.__written, destsize)
+
+    def Chunks(self, destsize):
+        self.__destsize = destsize
+        self.__written = 0
+        if self.__window is None:
+            self.__window = bytearray(self.__winsize)
+        if self.__bitreader is None or not self.__blockok:
+            return
+        br = self.__bitreader
+        getbits = br.GetBits
+        decodeentry = br.DecodeEntry
+        winsize = self.__winsize
+        tables = self.__unpackblocktables
+        if stats.STATS is not None:
+            getbits = stats.STATS.GetBits(br)
+            decodeentry = stats.STATS.Decoder(br, tables)
+        LD, DD, LDD, RD = tables["LD"], tables["DD"], tables["LDD"], tables["RD"]
+        ldtable, ddtable, lddtable, rdtable = LD.Table, DD.Table, LDD.Table, RD.Table
+        olddist = self.__olddist
+        window = self.__window
+        mask = self.__winsize - 1
+        flushlimit = min(UNPACK_MAX_WRITE, self.__winsize - MAX_INC_LZ_MATCH)
+        readborder = self.__readborder
+        # unpptr runs unmasked here so one compare against border covers
+        # the input, flush and wrap checks; every symbol emits at least one
+        # byte and reads at most INPUT_CHECK_RATIO bytes per byte emitted.
+        # A filter waiting for its block holds wrptr back, writeborder
+        # never lets unpptr overrun it
+        unpptr = self.__unpptr
+        wrptr = unpptr - ((unpptr - self.__wrptr) & mask)
+        writeborder = min(unpptr + flushlimit, wrptr + winsize - MAX_INC_LZ_MATCH)
+        border = unpptr
+        ppm = self.__blocktype == BLOCK_PPM
+        while True:
+            if unpptr >= border:
+                if br.Addr > readborder:
+                    if not self.__readbuf():
+                        break
+                    readborder = self.__readborder
+                if unpptr >= writeborder:
+                    yield from self.__writebuf(unpptr & mask)
+                    if self.__written > destsize:
+                        break
+                    wrptr = unpptr - ((unpptr - self.__wrptr) & mask)
+                    writeborder = min(unpptr + flushlimit, wrptr + winsize - MAX_INC_LZ_MATCH)
+                    if writeborder <= unpptr:
+                        break
+                if ppm:
+                    # border stays behind unpptr, PPM takes this path per symbol
+                    nextptr = self.__ppmsymbol(unpptr)
+                    if nextptr is None:
+                        break
+                    unpptr = nextptr
+                    ppm = self.__blocktype == BLOCK_PPM
+                    readborder = self.__readborder
+                    continue
+                border = min(unpptr + INPUT_CHECK_BYTES, writeborder)
+            number = decodeentry(ldtable)
+            if number < 256:
+                window[unpptr & mask] = number
+                unpptr += 1
+                continue
+            if number >= 271:
+                number -= 271
+                length = LDecode[number] + 3
+                bits = LBits[number]
+                if bits > 0:
+                    length += getbits(bits)
+                distnumber = decodeentry(ddtable)
+                distance = DDecode[distnumber] + 1
+                bits = DBits[distnumber]
+                if bits > 0:
+                    if distnumber > 9:
+                        if bits > 4:
+                            distance += getbits(bits - 4) << 4
+                        if self.__lowdistrepcount > 0:
+                            self.__lowdistrepcount -= 1
+                            distance += self.__prevlowdist
+                        else:
+                            lowdist = decodeentry(lddtable)
+                            if lowdist == 16:
+                                self.__lowdistrepcount = LOW_DIST_REP_COUNT - 1
+                                distance += self.__prevlowdist
+                            else:
+                                distance += lowdist
+                                self.__prevlowdist = lowdist
+                    else:
+                        distance += getbits(bits)
+                if distance >= 0x2000:
+                    length += 1
+                    if distance >= 0x40000:
+                        length += 1
+                olddist[3] = olddist[2]
+                olddist[2] = olddist[1]
+                olddist[1] = olddist[0]
+                olddist[0] = distance
+                self.__lastlength = length
+                copy_string(window, winsize, unpptr & mask, length, distance)
+                unpptr += length
+                continue
+            border = unpptr
+            if number == 256:
+                if not self.__readendofblock():
+                    break
+                ppm = self.__blocktype == BLOCK_PPM
+                continue
+            if number == 257:
+                if not self.__readvmcode(unpptr & mask):
+                    break
+                continue
+            if number == 258:
+                if self.__lastlength != 0:
+                    copy_string(window, winsize, unpptr & mask, self.__lastlength, olddist[0])
+                    unpptr += self.__lastlength
+                continue
+            if number < 263:
+                distnum = number - 259
+                distance = olddist[distnum]
+                for i in range(distnum, 0, -1):
+                    olddist[i] = olddist[i-1]
+                olddist[0] = distance
+                lengthnumber = decodeentry(rdtable)
+                length = LDecode[lengthnumber] + 2
+                bits = LBits[lengthnumber]
+                if bits > 0:
+                    length += getbits(bits)
+                self.__lastlength = length
+                copy_string(window, winsize, unpptr & mask, length, distance)
+                unpptr += length
+                continue
+            number -= 263
+            distance = SDDecode[number] + 1
+            bits = SDBits[number]
+            if bits > 0:
+                distance += getbits(bits)
+            olddist[3] = olddist[2]
+            olddist[2] = olddist[1]
+            olddist[1] = olddist[0]
+            olddist[0] = distance
+            self.__lastlength = 2
+            copy_string(window, winsize, unpptr & mask, 2, distance)
+            unpptr += 2
+        unpptr &= mask
+        self.__unpptr = unpptr
+        yield from self.__writebuf(unpptr)
+
+    def __decodeppmchar(self):
+        ch = self.__ppm.DecodeChar()
+        if ch == -1:
+            # broken PPM data, the next block starts from a fresh model
+            self.__ppm.CleanUp()
+            self.__blocktype = BLOCK_LZ
+        return ch
+
+    def __ppmsymbol(self, unpptr):
+        # the escape char introduces a new block header, filter code or a
+        # match, followed by 1 it stands for itself
+        mask = self.__winsize - 1
+        ch = self.__decodeppmchar()
+        if ch == -1:
+            return None
+        if ch == self.__ppm.EscChar:
+            nextch = self.__decodeppmchar()
+            if nextch == 0:
+                return unpptr if self.__readTables30() else None
+            if nextch == -1 or nextch == 2:
+                return None
+            if nextch == 3:
+                return unpptr if self.__readvmcodeppm(unpptr & mask) else None
+            if nextch == 4:
+                distance = 0
+                for _ in range(3):
+                    ch = self.__decodeppmchar()
+                    if ch == -1:
+                        return None
+                    distance = (distance << 8) + ch
+                length = self.__decodeppmchar()
+                if length == -1:
+                    return None
+                copy_string(self.__window, self.__winsize, unpptr & mask, length + 32, distance + 2)
+                return unpptr + length + 32
+            if nextch == 5:
+                length = self.__decodeppmchar()
+                if length == -1:
+                    return None
+                copy_string(self.__window, self.__winsize, unpptr & mask, length + 4, 1)
+                return unpptr + length + 4
+        self.__window[unpptr & mask] = ch
+        return unpptr + 1
+
+    def __readendofblock(self):
+        bitfield = self.__bitreader.Read16()
+        newfile = False
+        if bitfield & 0x8000:
+            newtable = True
+            self.__bitreader.AddBits(1)
         else:
-            decodetable.QuickBits = MAX_QUICK_DECODE_BITS - 3
-        quickdatasize = 1 << decodetable.QuickBits
-        curbitlength = 1
-        for code in range(quickdatasize):
-            bitfield = code << (16-decodetable.QuickBits)
-            while curbitlength < len(decodetable.DecodeLen) and \
-                  bitfield>=decodetable.DecodeLen[curbitlength]:
-                curbitlength += 1
-            decodetable.QuickLen[code] = curbitlength
-            dist = bitfield - decodetable.DecodeLen[curbitlength - 1]
-            dist >>= (16 - curbitlength)
-            if curbitlength < len(decodetable.DecodePos):
-                pos = decodetable.DecodePos[curbitlength] + dist
-                if pos < size:
-                    decodetable.QuickNum[code] = decodetable.DecodeNum[pos]
-                else:
-                    decodetable.QuickNum[code] = 0
+            newfile = True
+            newtable = (bitfield & 0x4000) != 0
+            self.__bitreader.AddBits(2)
+        self.__tablesread3 = not newtable
+        if newfile:
+            return False
+        return not newtable or self.__readTables30()
+
+    def __readvmcode(self, unpptr):
+        br = self.__bitreader
+        firstbyte = br.Read16() >> 8
+        br.AddBits(8)
+        length = (firstbyte & 7) + 1
+        if length == 7:
+            length = (br.Read16() >> 8) + 7
+            br.AddBits(8)
+        elif length == 8:
+            length = br.Read16()
+            br.AddBits(16)
+        if length == 0:
+            return False
+        vmcode = bytearray(length)
+        for i in range(length):
+            if br.Addr >= self.__readtop - 1 and not self.__readbuf() and i < length - 1:
+                return False
+            vmcode[i] = br.Read16() >> 8
+            br.AddBits(8)
+        return self.__addvmcode(firstbyte, bytes(vmcode), unpptr)
+
+    def __readvmcodeppm(self, unpptr):
+        firstbyte = self.__decodeppmchar()
+        if firstbyte == -1:
+            return False
+        length = (firstbyte & 7) + 1
+        if length == 7:
+            b1 = self.__decodeppmchar()
+            if b1 == -1:
+                return False
+            length = b1 + 7
+        elif length == 8:
+            b1 = self.__decodeppmchar()
+            b2 = self.__decodeppmchar() if b1 != -1 else -1
+            if b2 == -1:
+                return False
+            length = b1 * 256 + b2
+        if length == 0:
+            return False
+        vmcode = bytearray(length)
+        for i in range(length):
+            ch = self.__decodeppmchar()
+            if ch == -1:
+                return False
+            vmcode[i] = ch
+        return self.__addvmcode(firstbyte, bytes(vmcode), unpptr)
+
+    def __initfilters30(self, solid):
+        if not solid:
+            self.__oldfilterlengths = []
+            self.__lastfilter = 0
+            self.__filters30 = []
+        self.__prgstack = []
+
+    def __addvmcode(self, firstbyte, vmcode, unpptr):
+        br = BitReader(vmcode)
+        if firstbyte & 0x80:
+            filtpos = read_vm_data(br)
+            if filtpos == 0:
+                self.__initfilters30(False)
             else:
-                decodetable.QuickNum[code] = 0
-
-    def __decodenumber(self, decodetable : DecodeTable):
-        bitfield = self.__bitreader.Read16() & 0xfffe
-        if bitfield < decodetable.DecodeLen[decodetable.QuickBits]:
-            code = bitfield >> (16 - decodetable.QuickBits)
-            self.__bitreader.AddBits(decodetable.QuickLen[code])
-            return decodetable.QuickNum[code]
-        bits = 15
-        for i in range(decodetable.QuickBits + 1, 15):
-            if bitfield < decodetable.DecodeLen[i]:
-                bits = i
-                break
-        self.__bitreader.AddBits(bits)
-        dist = bitfield - decodetable.DecodeLen[bits - 1]
-        dist >>= (16 - bits)
-        pos = decodetable.DecodePos[bits] + dist
-        if pos > decodetable.MaxNum:
-            pos = 0
-        return decodetable.DecodeNum[pos]
+                filtpos -= 1
+        else:
+            filtpos = self.__lastfilter
+        if filtpos > len(self.__filters30) or filtpos > len(self.__oldfilterlengths):
+            return False
+        self.__lastfilter = filtpos
+        newfilter = filtpos == len(self.__filters30)
+        if newfilter:
+            if filtpos > MAX3_UNPACK_FILTERS:
+                return False
+            # the program type is known once its code is read below
+            self.__filters30.append(FILTER_NONE)
+            self.__oldfilterlengths.append(0)
+        # finished filters leave holes in the stack, keep the order
+        self.__prgstack = [flt for flt in self.__prgstack if flt is not None]
+        if len(self.__prgstack) > MAX3_UNPACK_FILTERS:
+            return False
+        blockstart = read_vm_data(br)
+        if firstbyte & 0x40:
+            blockstart += 258
+        if firstbyte & 0x20:
+            blocklength = read_vm_data(br)
+            self.__oldfilterlengths[filtpos] = blocklength
+        else:
+            blocklength = self.__oldfilterlengths[filtpos]
+        mask = self.__winsize - 1
+        flt = UnpackFilter(FILTER_NONE, (blockstart + unpptr) & mask, blocklength)
+        flt.ParentFilter = filtpos
+        flt.NextWindow = self.__wrptr != unpptr and ((self.__wrptr - unpptr) & mask) <= blockstart
+        flt.InitR = [0] * 7
+        flt.InitR[4] = blocklength
+        if firstbyte & 0x10:
+            initmask = br.Read16() >> 9
+            br.AddBits(7)
+            for i in range(7):
+                if initmask & (1 << i):
+                    flt.InitR[i] = read_vm_data(br)
+        if newfilter:
+            codesize = read_vm_data(br)
+            if codesize >= 0x10000 or codesize == 0 or br.Addr + codesize > len(vmcode):
+                return False
+            code = bytes(br.GetBits(8) for _ in range(codesize))
+            self.__filters30[filtpos] = vm_filter_type(code)
+        flt.Type = self.__filters30[filtpos]
+        self.__prgstack.append(flt)
+        return True
+
+    def __writebuf(self, unpptr):
+        # UnpWriteBuf30: filtered blocks go out through the VM in place of
+        # the window bytes, chained filters on the same block run in turn
+        mask = self.__winsize - 1
+        writtenborder = self.__wrptr
+        writesize = (unpptr - writtenborder) & mask
+        stack = self.__prgstack
+        i = 0
+        while i < len(stack):
+            flt = stack[i]
+            if flt is None:
+                i += 1
+                continue
+            if flt.NextWindow:
+                flt.NextWindow = False
+                i += 1
+                continue
+            blockstart = flt.BlockStart
+            blocklength = flt.BlockLength
+            if ((blockstart - writtenborder) & mask) < writesize:
+                if writtenborder != blockstart:
+                    yield from self.__writearea(writtenborder, blockstart)
+                    writtenborder = blockstart
+                    writesize = (unpptr - writtenborder) & mask
+                if blocklength > writesize:
+                    # the block is not fully decoded yet, write up to it
+                    for later in stack[i:]:
+                        if later is not None:
+                            later.NextWindow = False
+                    self.__wrptr = writtenborder
+                    return
+                data = window_block(self.__window, self.__winsize, blockstart, min(blocklength, VM_MEMSIZE))
+                out = execute_filter30(flt, data, self.__written)
+                stack[i] = None
+                while i + 1 < len(stack):
+                    nextflt = stack[i+1]
+                    if nextflt is None or nextflt.BlockStart != blockstart or \
+                       nextflt.BlockLength != len(out) or nextflt.NextWindow:
+                        break
+                    out = execute_filter30(nextflt, out, self.__written)
+                    i += 1
+                    stack[i] = None
+                yield from self.__writefiltered(out)
+                writtenborder = (blockstart + blocklength) & mask
+                writesize = (unpptr - writtenborder) & mask
+            i += 1
+        yield from self.__writearea(writtenborder, unpptr)
+        self.__wrptr = unpptr
+
+    def __writearea(self, start, end):
+        if end < start:
+            yield from self.__writedata(start, self.__winsize)
+            start = 0
+        yield from self.__writedata(start, end)
+
+    def __writedata(self, start, end):
+        left = self.__destsize - self.__written
+        self.__written += end - start
+        if left > 0:
+            end = min(end, start + left)
+            for pos in range(start, end, UNPACK_MAX_WRITE):
+                yield bytes(self.__window[pos:min(pos + UNPACK_MAX_WRITE, end)])
+
+    def __writefiltered(self, data):
+        left = self.__destsize - self.__written
+        self.__written += len(data)
+        if left > 0:
+            yield bytes(data[:left])
+
+    def Release(self):
+        # hand the tables to the next decoder; this one is done with
+        TABLE_POOL.Give(self.__unpackblocktables.values())
+        self.__unpackblocktables = {}
 
     @property
     def DDecode(self):
-        return self.__DDecode
+        return DDecode
 
     @property
     def DBits(self):
-        return self.__DBits
+        return DBits
 
     @property
     def UnpackBlockTables(self):
@@ -0,0 +1,473 @@
+import mmap
+import tempfile
+from bitreader import BitReader, READ_SIZE
+from filters import UnpackFilter, FILTER_DELTA, FILTER_NONE, apply_filter
+from unpack import TABLE_POOL, block_tables, copy_string, window_block
+from unpack import NC, DC, LDC, RC, BC, HUFF_TABLE_SIZE
+from unpack import MAX_INC_LZ_MATCH, MAX_UNPACK_FILTERS, MAX_FILTER_BLOCK_SIZE, UNPACK_MAX_WRITE
+import stats
+
+DCX = 80
+HUFF_TABLE_SIZEX = NC + DCX + LDC + RC
+
+MIN_WINDOW5 = 0x40000
+WINDOW_MMAP_SIZE = 0x10000000
+
+# longest symbol: main code, 9 length bits, distance code, 34 distance
+# bits and the low distance code, rounded up
+MAX_SYMBOL_BITS5 = 96
+READ_BORDER5 = 16
+
+LENGTH_BASE5 = tuple(2 + (s if s < 8 else (4 | (s & 3)) << ((s >> 2) - 1)) for s in range(RC))
+LENGTH_BITS5 = tuple(0 if s < 8 else (s >> 2) - 1 for s in range(RC))
+DIST_BASE5 = tuple(1 + (s if s < 4 else (2 | (s & 1)) << ((s >> 1) - 1)) for s in range(DCX))
+DIST_BITS5 = tuple(0 if s < 4 else (s >> 1) - 1 for s in range(DCX))
+
+
+def alloc_window(size):
+    if size <= WINDOW_MMAP_SIZE:
+        return bytearray(size)
+    # very large dictionaries go to a sparse temp file so untouched
+    # pages cost neither RAM nor swap
+    tmp = tempfile.TemporaryFile()
+    try:
+        tmp.truncate(size)
+        return mmap.mmap(tmp.fileno(), size)
+    finally:
+        tmp.close()
+
+
+class Unpack50:
+    def __init__(self, data, winsize = 0x400000, source = None, extradist = False):
+        self.__bitreader : BitReader = None
+        self.__readtop = 0
+        self.__readborder = 0
+        self.__tablesread5 = False
+        self.__extradist = extradist
+        self.__winsize = 1 << (max(winsize, MIN_WINDOW5) - 1).bit_length()
+        self.__window = None
+        self.__unpptr = 0
+        self.__wrptr = 0
+        self.__olddist = [0] * 4
+        self.__lastlength = 0
+        self.__written = 0
+        self.__destsize = 0
+        self.__blockendbit = -1
+        self.__blockbits = 0
+        self.__lastblock = False
+        self.__tablepresent = False
+        self.__filters = []
+        self.__unpackblocktables = block_tables()
+        if data or source is not None:
+            self.SetInput(data, source)
+
+    def __getstate__(self):
+        # as for Unpack29, a mapped window goes out as bytes
+        saved = self.__bitreader, self.__window
+        self.__bitreader = None
+        if isinstance(self.__window, mmap.mmap):
+            self.__window = bytes(self.__window)
+        state = self.__dict__.copy()
+        self.__bitreader, self.__window = saved
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.__window, bytes):
+            window = alloc_window(len(self.__window))
+            window[:] = self.__window
+            self.__window = window
+
+    def GrowWindow(self, winsize):
+        # a solid member may want more dictionary than the member that
+        # started the run was given. The bytes before unpptr keep their
+        # places and the older ones, from the last wrap, go to the top of
+        # the new window, so every distance still reaches the same byte
+        winsize = 1 << (max(winsize, MIN_WINDOW5) - 1).bit_length()
+        oldsize = self.__winsize
+        if winsize <= oldsize:
+            return
+        self.__winsize = winsize
+        old = self.__window
+        if old is None:
+            return
+        window = alloc_window(winsize)
+        unpptr = self.__unpptr
+        window[:unpptr] = old[:unpptr]
+        window[winsize - oldsize + unpptr:] = old[unpptr:oldsize]
+        if self.__wrptr > unpptr:
+            self.__wrptr += winsize - oldsize
+        self.__window = window
+
+    def SetInput(self, data, source = None):
+        # solid members keep the window, distances and tables, every
+        # member starts with its own block header; filters never span files
+        self.__bitreader = None
+        self.__blockendbit = -1
+        self.__filters = []
+        if data or source is not None:
+            self.__bitreader = BitReader(data, source)
+            self.__readbuf()
+
+    def __bitpos(self):
+        br = self.__bitreader
+        return br.Addr * 8 + br.Bit
+
+    def __readbuf(self):
+        br = self.__bitreader
+        if br.Addr > br.Size:
+            return False
+        if br.Streaming:
+            # Fill restarts the buffer at the first unread byte, keep the
+            # block end where it was relative to the read position
+            left = self.__blockendbit - self.__bitpos()
+            if br.Fill(READ_SIZE) and self.__blockendbit >= 0:
+                self.__blockendbit = self.__bitpos() + left
+        self.__readtop = br.Size
+        self.__readborder = br.Size - READ_BORDER5 if br.Streaming else br.Size
+        return br.Addr <= br.Size
+
+    def __readblockheader(self):
+        br = self.__bitreader
+        if br.Addr > self.__readtop - 7:
+            if not self.__readbuf():
+                return False
+        br.AddBits((8 - br.Bit) & 7)
+        blockflags = br.Read16() >> 8
+        br.AddBits(8)
+        bytecount = ((blockflags >> 3) & 3) + 1
+        if bytecount == 4:
+            return False
+        savedchecksum = br.Read16() >> 8
+        br.AddBits(8)
+        blocksize = 0
+        for i in range(bytecount):
+            blocksize += (br.Read16() >> 8) << (i * 8)
+            br.AddBits(8)
+        checksum = (0x5a ^ blockflags ^ blocksize ^ (blocksize >> 8) ^ (blocksize >> 16)) & 0xff
+        if checksum != savedchecksum:
+            return False
+        self.__blockbits = (blockflags & 7) + 1
+        self.__blockendbit = (br.Addr + blocksize - 1) * 8 + self.__blockbits
+        self.__lastblock = (blockflags & 0x40) != 0
+        self.__tablepresent = (blockflags & 0x80) != 0
+        return True
+
+    @stats.timed("tables")
+    def __readtables(self):
+        if not self.__tablepresent:
+            return True
+        br = self.__bitreader
+        if br.Addr > self.__readtop - 25:
+            if not self.__readbuf():
+                return False
+        BitLength = bytearray(BC)
+        I = 0
+        while I < BC:
+            Length = br.Read16() >> 12
+            br.AddBits(4)
+            if Length == 15:
+                ZeroCount = br.Read16() >> 12
+                br.AddBits(4)
+                if ZeroCount == 0:
+                    BitLength[I] = 15
+                else:
+                    ZeroCount += 2
+                    while ZeroCount > 0 and I < len(BitLength):
+                        BitLength[I] = 0
+                        I += 1
+                        ZeroCount -= 1
+                    I -= 1
+            else:
+                BitLength[I] = Length
+            I += 1
+        tables = self.__unpackblocktables
+        tables["BD"].Build(BitLength, BC)
+        dc = DCX if self.__extradist else DC
+        tablesize = NC + dc + LDC + RC
+        Table = bytearray(tablesize)
+        i = 0
+        while i < tablesize:
+            if br.Addr > self.__readtop - 5:
+                if not self.__readbuf():
+                    return False
+            number = tables["BD"].Decode(br)
+            if number < 16:
+                Table[i] = number
+                i += 1
+            elif number < 18:
+                if number == 16:
+                    n = (br.Read16() >> 13) + 3
+                    br.AddBits(3)
+                else:
+                    n = (br.Read16() >> 9) + 11
+                    br.AddBits(7)
+                if i == 0:
+                    return False
+                while n > 0 and i < tablesize:
+                    n -= 1
+                    Table[i] = Table[i-1]
+                    i += 1
+            else:
+                if number == 18:
+                    n = (br.Read16() >> 13) + 3
+                    br.AddBits(3)
+                else:
+                    n = (br.Read16() >> 9) + 11
+                    br.AddBits(7)
+                while n > 0 and i < tablesize:
+                    n -= 1
+                    Table[i] = 0
+                    i += 1
+        self.__tablesread5 = True
+        if br.Addr > self.__readtop:
+            return False
+        tables["LD"].Build(Table, NC)
+        tables["DD"].Build(Table[NC:], dc)
+        tables["LDD"].Build(Table[NC+dc:], LDC)
+        tables["RD"].Build(Table[NC+dc+LDC:], RC)
+        return True
+
+    def __readfilterdata(self):
+        br = self.__bitreader
+        bytecount = (br.Read16() >> 14) + 1
+        br.AddBits(2)
+        data = 0
+        for i in range(bytecount):
+            data += (br.Read16() >> 8) << (i * 8)
+            br.AddBits(8)
+        return data
+
+    def __readfilter(self, unpptr):
+        br = self.__bitreader
+        if br.Addr > self.__readtop - 16:
+            if not self.__readbuf():
+                return False
+        blockstart = self.__readfilterdata()
+        blocklength = self.__readfilterdata()
+        if blocklength > MAX_FILTER_BLOCK_SIZE:
+            blocklength = 0
+        filtertype = br.Read16() >> 13
+        br.AddBits(3)
+        channels = 0
+        if filtertype == FILTER_DELTA:
+            channels = (br.Read16() >> 11) + 1
+            br.AddBits(5)
+        return self.__addfilter(UnpackFilter(filtertype, blockstart, blocklength, channels), unpptr)
+
+    def __addfilter(self, flt, unpptr):
+        if len(self.__filters) >= MAX_UNPACK_FILTERS:
+            # the loop flushes once the list fills, if that could not
+            # drain it the pending filters are dropped
+            self.__filters = []
+        # a block start past the unwritten data wrapped around the window
+        # and belongs to the next pass over it
+        wrptr = self.__wrptr
+        flt.NextWindow = wrptr != unpptr and ((wrptr - unpptr) & (self.__winsize - 1)) <= flt.BlockStart
+        flt.BlockStart = (flt.BlockStart + unpptr) % self.__winsize
+        self.__filters.append(flt)
+        return True
+
+    def Unpack(self, write, destsize):
+        for chunk in self.Chunks(destsize):
+            write(chunk)
+        return min(self.__written, destsize)
+
+    def Chunks(self, destsize):
+        self.__destsize = destsize
+        self.__written = 0
+        if self.__window is None:
+            self.__window = alloc_window(self.__winsize)
+        if self.__bitreader is None:
+            return
+        if not self.__readblockheader() or not self.__readtables() or not self.__tablesread5:
+            return
+        br = self.__bitreader
+        getbits = br.GetBits
+        decodeentry = br.DecodeEntry
+        tables = self.__unpackblocktables
+        if stats.STATS is not None:
+            getbits = stats.STATS.GetBits(br)
+            decodeentry = stats.STATS.Decoder(br, tables)
+        # Build refills these arrays in place, so new tables need no reload
+        ldtable, ddtable = tables["LD"].Table, tables["DD"].Table
+        lddtable, rdtable = tables["LDD"].Table, tables["RD"].Table
+        olddist = self.__olddist
+        window = self.__window
+        winsize = self.__winsize
+        mask = winsize - 1
+        flushlimit = min(UNPACK_MAX_WRITE, winsize - MAX_INC_LZ_MATCH)
+        # as in Unpack29, unpptr runs unmasked and one compare against
+        # border covers input, block end, flush and wrap; every symbol but
+        # a filter emits a byte and reads at most MAX_SYMBOL_BITS5
+        unpptr = self.__unpptr
+        wrptr = unpptr - ((unpptr - self.__wrptr) & mask)
+        writeborder = min(unpptr + flushlimit, wrptr + winsize - MAX_INC_LZ_MATCH)
+        border = unpptr
+        while True:
+            if unpptr >= border:
+                if br.Addr > self.__readborder:
+                    if not self.__readbuf():
+                        break
+                filedone = False
+                while br.Addr * 8 + br.Bit >= self.__blockendbit:
+                    if self.__lastblock or not self.__readblockheader() or not self.__readtables():
+                        filedone = True
+                        break
+                if filedone:
+                    break
+                if unpptr >= writeborder:
+                    yield from self.__writebuf(unpptr & mask)
+                    if self.__written > destsize:
+                        break
+                    wrptr = unpptr - ((unpptr - self.__wrptr) & mask)
+                    writeborder = min(unpptr + flushlimit, wrptr + winsize - MAX_INC_LZ_MATCH)
+                    if writeborder <= unpptr:
+                        break
+                limit = min(self.__blockendbit, self.__readborder * 8)
+                symbols = (limit - br.Addr * 8 - br.Bit) // MAX_SYMBOL_BITS5
+                border = min(unpptr + max(symbols, 0), writeborder)
+            number = decodeentry(ldtable)
+            if number < 256:
+                window[unpptr & mask] = number
+                unpptr += 1
+                continue
+            if number >= 262:
+                number -= 262
+                length = LENGTH_BASE5[number]
+                bits = LENGTH_BITS5[number]
+                if bits > 0:
+                    length += getbits(bits)
+                distslot = decodeentry(ddtable)
+                distance = DIST_BASE5[distslot]
+                bits = DIST_BITS5[distslot]
+                if bits > 0:
+                    if bits >= 4:
+                        if bits > 36:
+                            distance += ((getbits(bits - 36) << 32) | getbits(32)) << 4
+                        elif bits > 4:
+                            distance += getbits(bits - 4) << 4
+                        distance += decodeentry(lddtable)
+                    else:
+                        distance += getbits(bits)
+                if distance > 0x100:
+                    length += 1
+                    if distance > 0x2000:
+                        length += 1
+                        if distance > 0x40000:
+                            length += 1
+                olddist[3] = olddist[2]
+                olddist[2] = olddist[1]
+                olddist[1] = olddist[0]
+                olddist[0] = distance
+                self.__lastlength = length
+                copy_string(window, winsize, unpptr & mask, length, distance)
+                unpptr += length
+                continue
+            border = unpptr
+            if number == 256:
+                if not self.__readfilter(unpptr & mask):
+                    break
+                if len(self.__filters) >= MAX_UNPACK_FILTERS:
+                    writeborder = unpptr
+                continue
+            if number == 257:
+                if self.__lastlength != 0:
+                    copy_string(window, winsize, unpptr & mask, self.__lastlength, olddist[0])
+                    unpptr += self.__lastlength
+                continue
+            distnum = number - 258
+            distance = olddist[distnum]
+            for i in range(distnum, 0, -1):
+                olddist[i] = olddist[i-1]
+            olddist[0] = distance
+            lengthslot = decodeentry(rdtable)
+            length = LENGTH_BASE5[lengthslot]
+            bits = LENGTH_BITS5[lengthslot]
+            if bits > 0:
+                length += getbits(bits)
+            self.__lastlength = length
+            copy_string(window, winsize, unpptr & mask, length, distance)
+            unpptr += length
+        unpptr &= mask
+        self.__unpptr = unpptr
+        yield from self.__writebuf(unpptr)
+
+    def __writebuf(self, unpptr):
+        # UnpWriteBuf: filtered blocks are copied out of the window, which
+        # later matches still read unfiltered
+        mask = self.__winsize - 1
+        writtenborder = self.__wrptr
+        fullwritesize = (unpptr - writtenborder) & mask
+        writesizeleft = fullwritesize
+        allprocessed = True
+        filters = self.__filters
+        for i, flt in enumerate(filters):
+            if flt.Type == FILTER_NONE:
+                continue
+            if flt.NextWindow:
+                if ((flt.BlockStart - self.__wrptr) & mask) <= fullwritesize:
+                    flt.NextWindow = False
+                continue
+            blockstart = flt.BlockStart
+            blocklength = flt.BlockLength
+            if ((blockstart - writtenborder) & mask) >= writesizeleft:
+                continue
+            if writtenborder != blockstart:
+                yield from self.__writearea(writtenborder, blockstart)
+                writtenborder = blockstart
+                writesizeleft = (unpptr - writtenborder) & mask
+            if blocklength > writesizeleft:
+                # the block is not fully decoded yet, write up to it
+                self.__wrptr = writtenborder
+                for later in filters[i:]:
+                    if later.Type != FILTER_NONE:
+                        later.NextWindow = False
+                allprocessed = False
+                break
+            if blocklength > 0:
+                data = window_block(self.__window, self.__winsize, blockstart, blocklength)
+                out = apply_filter(flt, data, self.__written)
+                flt.Type = FILTER_NONE
+                if out is None:
+                    self.__written += blocklength
+                else:
+                    yield from self.__writefiltered(out)
+                writtenborder = (blockstart + blocklength) & mask
+                writesizeleft = (unpptr - writtenborder) & mask
+        self.__filters = [flt for flt in filters if flt.Type != FILTER_NONE]
+        if allprocessed:
+            yield from self.__writearea(writtenborder, unpptr)
+            self.__wrptr = unpptr
+
+    def __writearea(self, start, end):
+        if end < start:
+            yield from self.__writedata(start, self.__winsize)
+            start = 0
+        yield from self.__writedata(start, end)
+
+    def __writedata(self, start, end):
+        left = self.__destsize - self.__written
+        self.__written += end - start
+        if left > 0:
+            end = min(end, start + left)
+            for pos in range(start, end, UNPACK_MAX_WRITE):
+                yield bytes(self.__window[pos:min(pos + UNPACK_MAX_WRITE, end)])
+
+    def __writefiltered(self, data):
+        left = self.__destsize - self.__written
+        self.__written += len(data)
+        if left > 0:
+            yield bytes(data[:left])
+
+    @property
+    def WinSize(self):
+        return self.__winsize
+
+    def Release(self):
+        TABLE_POOL.Give(self.__unpackblocktables.values())
+        self.__unpackblocktables = {}
+
+    @property
+    def UnpackBlockTables(self):
+        return self.__unpackblocktables
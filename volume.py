@@ -0,0 +1,89 @@
+import os
+import re
+from structs import RAR_FORMAT, LHD_SPLIT_BEFORE, LHD_SPLIT_AFTER
+from stream import Prefetch
+from archive import open_archive, read_signature, read_blocks, MAIN_HEADERS, FILE_HEADERS
+
+VOLNUMBER = re.compile(r"(\d+)\D*$")
+
+
+def next_volume_name(filename, newnumbering = True):
+    # name.part1.rar -> name.part2.rar, or the old name.rar -> name.r00 -> name.r01
+    head, tail = os.path.split(filename)
+    if newnumbering:
+        m = VOLNUMBER.search(tail)
+        if m is None:
+            return None
+        digits = m.group(1)
+        tail = tail[:m.start(1)] + str(int(digits) + 1).zfill(len(digits)) + tail[m.end(1):]
+    else:
+        base, ext = os.path.splitext(tail)
+        if len(ext) == 4 and ext[2:].isdigit():
+            number = int(ext[2:]) + 1
+            # .r99 carries into the letter, .s00 comes next
+            ext = ext[:2] + "%02d" % number if number < 100 else "." + chr(ord(ext[1]) + 1) + "00"
+        else:
+            ext = (ext[:2] if len(ext) >= 2 else ".r") + "00"
+        tail = base + ext
+    return os.path.join(head, tail)
+
+
+def read_volumes(f, filename, verify = False, fmt = RAR_FORMAT.RARFMT15, usemmap = True, prefetch = True):
+    # read_blocks over f and the volumes following it. A member split over
+    # volumes comes out once, after its last part, and reads the later
+    # parts by volume name. Only the current volume and the one a pending
+    # member starts in stay open, so consume each member before the next
+    opened = []
+    ahead = None
+    pending = None
+    first = None
+    try:
+        while True:
+            nextname = None
+            for h in read_blocks(f, verify, fmt):
+                if h.HeaderType in MAIN_HEADERS and h.IsVolume:
+                    nextname = next_volume_name(filename, h.NewNumbering)
+                    # a pending member reads its parts with its own prefetch
+                    if prefetch and pending is None and nextname is not None and os.path.exists(nextname):
+                        if ahead is not None:
+                            ahead.Stop()
+                        ahead = Prefetch(nextname)
+                if h.HeaderType not in FILE_HEADERS:
+                    yield h
+                    continue
+                part = h
+                if part.Flags & LHD_SPLIT_BEFORE:
+                    if pending is None or pending.Filename != part.Filename:
+                        # continued from a volume before the first one read
+                        pending = None
+                        continue
+                    pending.AppendPart(part, filename)
+                    h = pending
+                if part.Flags & LHD_SPLIT_AFTER:
+                    if pending is None:
+                        first = f
+                    pending = h
+                    continue
+                pending = None
+                yield h
+            if nextname is None or not os.path.exists(nextname):
+                if pending is not None:
+                    # the rest of the set is missing, hand out the parts there are
+                    yield pending
+                return
+            keep = first if pending is not None else None
+            for v in opened:
+                if v is not keep:
+                    v.close()
+            opened = [v for v in opened if v is keep]
+            f = open_archive(nextname, usemmap)
+            opened.append(f)
+            filename = nextname
+            fmt = read_signature(f)
+            if fmt == RAR_FORMAT.RARFMT_NONE:
+                raise EOFError("%s: not a RAR volume" % filename)
+    finally:
+        if ahead is not None:
+            ahead.Stop()
+        for v in opened:
+            v.close()